@@ -1,31 +1,310 @@
 # app.py
-from fastapi import FastAPI, Depends, HTTPException, status, Query
-from pydantic import BaseModel
-from typing import Optional, Any, Dict
+from fastapi import (
+    FastAPI,
+    Depends,
+    HTTPException,
+    status,
+    Query,
+    Request,
+    Response,
+    Header,
+)
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, create_model
+from typing import Optional, Any, Dict, List, Union, Tuple, NamedTuple
 from enum import Enum
 from uuid import uuid4
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager
+import asyncio
+import base64
+import binascii
+import codecs
+import csv
+import io
+import json
+import logging
+import math
+import os
+
+import orjson
 
 from sqlalchemy import (
-    create_engine,
+    event,
     Column,
     String,
+    Integer,
+    Float,
     DateTime,
     Text,
+    Index,
     Enum as SAEnum,
     JSON as SAJSON,
+    any_,
+    bindparam,
+    case,
     select,
+    update,
+    insert,
+    delete,
     func,
+    inspect,
+    or_,
+    text as sql_text,
+    tuple_,
 )
-from sqlalchemy.orm import sessionmaker, declarative_base, Session
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import (
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import NullPool
+
+from cache import TTLCache
+from documents import normalize_document
+from events import JobEventHub, WorkSignal
+from metrics import LatencyMiddleware, Registry
 
 
 # --------- Configuração do banco ---------
-SQLALCHEMY_DATABASE_URL = "sqlite:///./app.db"
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+MAX_CLAIM_BATCH = 100  # máximo de jobs reservados por chamada a /next
+MAX_SEND_BATCH = 10_000  # máximo de textos por chamada a /send/batch (JSON)
+INSERT_CHUNK = 1_000  # linhas por executemany no upload em streaming
+
+# Lease (visibility timeout) dos jobs reservados por /next
+LEASE_SECONDS = int(os.getenv("LEASE_SECONDS", "300"))
+REAPER_INTERVAL_SECONDS = float(os.getenv("REAPER_INTERVAL_SECONDS", "5"))
+MAX_ATTEMPTS = int(os.getenv("MAX_ATTEMPTS", "3"))
+
+# Long-poll do /next: espera máxima aceita e intervalo de reconsulta de
+# segurança (cobre inserções feitas por outros processos do gunicorn ou
+# por outros nós da API no mesmo Postgres)
+MAX_LONG_POLL_SECONDS = 60
+LONG_POLL_RECHECK_SECONDS = float(os.getenv("LONG_POLL_RECHECK_SECONDS", "5"))
+
+# Consultas por lista de ids: máximo aceito e tamanho de cada IN (...),
+# abaixo do limite de parâmetros do SQLite
+MAX_IDS_PER_REQUEST = 5_000
+IN_QUERY_CHUNK = 500
+SSE_KEEPALIVE_SECONDS = 15
+EXPORT_BATCH = 1_000  # jobs lidos do cursor por vez em /jobs/export
+MAX_TIMING_MARKS = 500  # marcas de etapa aceitas por /finish ou /fail
+TIMING_STATS_WINDOW_HOURS = 24  # janela padrão de /timings/stats
+# etapas com série própria em queue_job_stage_seconds; o nome vem do worker,
+# então qualquer outro vira "other" (o /timings/stats guarda o nome original)
+METRIC_STAGES = frozenset(
+    {
+        "page_load",
+        "captcha_request",
+        "captcha_solved",
+        "search_submitted",
+        "first_rows",
+        "page_collected",
+        "queue_wait",
+        "upload",
+    }
+)
+
+# Agendamento do /next: prioridade estrita (0 = normal, até MAX_PRIORITY =
+# urgente) e, dentro da mesma prioridade, fila justa ponderada entre clientes
+# (client_id do /send); pedidos sem client_id dividem o cliente padrão
+DEFAULT_CLIENT_ID = "default"
+MAX_PRIORITY = 9
+MAX_CLIENT_WEIGHT = 1000.0
+
+# Cache de resultados: um /send de um documento já consultado há menos de
+# RESULT_CACHE_TTL_SECONDS devolve o job DONE existente (0 desliga o cache)
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "21600"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+
+# Os gauges de profundidade da fila são mantidos incrementalmente e
+# recalculados com um COUNT por status a cada METRICS_RESYNC_SECONDS (corrige
+# o que outros processos/nós alteraram)
+METRICS_RESYNC_SECONDS = float(os.getenv("METRICS_RESYNC_SECONDS", "60"))
+
+logger = logging.getLogger(__name__)
+work_signal = WorkSignal()  # acorda quem está em long-poll no /next
+job_events = JobEventHub()  # estados finais publicados para /events
+# documento normalizado -> id do job DONE mais recente
+result_cache = TTLCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS)
+
+# métricas expostas em /metrics (contadores e histogramas são por processo)
+metrics = Registry()
+job_transitions = metrics.counter(
+    "queue_job_transitions_total",
+    "Transições de status dos jobs",
+    ("from_status", "to_status"),
+)
+queue_depth = metrics.gauge("queue_jobs", "Jobs por status", ("status",))
+queue_wait_seconds = metrics.histogram(
+    "queue_wait_seconds",
+    "Tempo entre o enfileiramento e a reserva em /next",
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+)
+job_processing_seconds = metrics.histogram(
+    "queue_processing_seconds",
+    "Tempo entre a reserva em /next e o /finish ou /fail",
+    ("status",),
+    buckets=(1, 5, 10, 20, 30, 45, 60, 90, 120, 300, 600),
+)
+job_stage_seconds = metrics.histogram(
+    "queue_job_stage_seconds",
+    "Duração de cada etapa reportada pelos workers",
+    ("stage",),
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+http_request_seconds = metrics.histogram(
+    "http_request_duration_seconds",
+    "Latência das requisições por endpoint",
+    ("method", "route", "status_code"),
+)
+
+# Perfis de armazenamento do SQLite (SQLITE_PROFILE):
+# - "performance": WAL (leitores não bloqueiam atrás de escritores),
+#   synchronous=NORMAL (sem fsync a cada commit; seguro em WAL contra
+#   corrupção, pode perder os últimos commits numa queda de energia),
+#   busy_timeout para esperar o lock em vez de falhar, mmap e cache maiores
+# - "safe": comportamento original do SQLite (rollback journal, FULL),
+#   aplicado explicitamente: journal_mode fica gravado no arquivo, então um
+#   banco que já rodou em WAL só volta ao rollback journal se alguém pedir
+SQLITE_PROFILES: Dict[str, Dict[str, Any]] = {
+    "performance": {
+        # primeiro: a troca para WAL também disputa o lock do arquivo
+        "busy_timeout": 5000,  # ms
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,  # bytes
+        "cache_size": -64 * 1024,  # negativo = KiB
+        "temp_store": "MEMORY",
+    },
+    "safe": {
+        "busy_timeout": 5000,
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+    },
+}
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "performance")
+# cada pragma pode ser sobrescrito individualmente, ex.: SQLITE_SYNCHRONOUS=FULL
+SQLITE_PRAGMAS = {
+    name: os.getenv(f"SQLITE_{name.upper()}", value)
+    for name, value in SQLITE_PROFILES[SQLITE_PROFILE].items()
+}
+
+# Pool de conexões explícito (um por processo do gunicorn)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# quanto um processo espera, no startup, a migração de outro terminar
+MIGRATION_LOCK_TIMEOUT = float(os.getenv("MIGRATION_LOCK_TIMEOUT", "300"))  # s
+# chave do pg_advisory_xact_lock que serializa as migrações no Postgres
+MIGRATION_LOCK_KEY = 0x636F6E73  # "cons"
+
+# Banco de dados (DATABASE_URL). Aceita a URL "normal" do SQLite ou do
+# Postgres e troca pelo driver assíncrono correspondente, ex.:
+#   sqlite:///./app.db                    -> sqlite+aiosqlite:///./app.db
+#   postgresql://user:pw@host:5432/fila   -> postgresql+asyncpg://...
+# Com Postgres, vários nós da API podem compartilhar a mesma fila.
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def _async_database_url(url: str) -> str:
+    scheme, separator, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{separator}{rest}"
+
+
+SQLALCHEMY_DATABASE_URL = _async_database_url(DATABASE_URL)
+engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+)
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Aplica os pragmas do perfil em cada conexão nova do pool."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+    # o driver não abre transações sozinho; quem emite o BEGIN é
+    # _begin_sqlite_transaction, no modo pedido pela sessão
+    dbapi_connection.isolation_level = None
+
+
+def _begin_sqlite_transaction(conn) -> None:
+    """
+    BEGIN explícito no SQLite. Transações de escrita usam BEGIN IMMEDIATE:
+    pegam o lock de escrita logo no início, esperando até busy_timeout se
+    outro processo estiver escrevendo. Com o BEGIN padrão (DEFERRED) a
+    transação começa lendo e só pede o lock na primeira escrita; se outro
+    processo escreveu nesse meio-tempo, o SQLite recusa na hora com
+    "database is locked", sem esperar.
+    """
+    mode = conn.get_execution_options().get("sqlite_begin", "DEFERRED")
+    conn.exec_driver_sql(f"BEGIN {mode}")
+
+
+# Escritas no SQLite: o banco aceita um escritor por vez, então cada processo
+# usa um pool de uma conexão só para elas, com BEGIN IMMEDIATE. As transações
+# de escrita de um processo esperam a vez na fila do pool (DB_POOL_TIMEOUT),
+# sem disputar o lock do arquivo, e só uma por processo concorre com os
+# outros processos (busy_timeout). No Postgres, o mesmo pool serve para tudo.
+if engine.dialect.name == "sqlite":
+    write_engine = create_async_engine(
+        SQLALCHEMY_DATABASE_URL,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=DB_POOL_TIMEOUT,
+        execution_options={"sqlite_begin": "IMMEDIATE"},
+    )
+    for _engine in (engine, write_engine):
+        event.listen(_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        event.listen(_engine.sync_engine, "begin", _begin_sqlite_transaction)
+else:
+    write_engine = engine
+
+
+def _private_database(url) -> bool:
+    """SQLite em memória: só este processo enxerga o banco."""
+    if url.get_backend_name() != "sqlite":
+        return False
+    database = url.database or ""
+    return database in ("", ":memory:") or (
+        database.startswith("file:") and url.query.get("mode") == "memory"
+    )
+
+
+# Outros processos gravando no mesmo banco (nós da API no Postgres, ou
+# `uvicorn --workers N` / `gunicorn -w N` no mesmo arquivo SQLite): um /finish
+# feito em outro processo não passa pelo pub/sub deste, então o /events
+# confere no banco, a cada EVENTS_RECHECK_SECONDS, os jobs assinados aqui (uma
+# consulta indexada para todos os streams, só quando há assinaturas). Não dá
+# para saber quantos processos existem, então liga em todo banco que não seja
+# um SQLite em memória; SHARED_DATABASE=0 desliga (um processo só)
+SHARED_DATABASE = not _private_database(engine.url)
+if os.getenv("SHARED_DATABASE"):
+    SHARED_DATABASE = os.getenv("SHARED_DATABASE").lower() in ("1", "true", "yes")
+EVENTS_RECHECK_SECONDS = float(os.getenv("EVENTS_RECHECK_SECONDS", "2"))
+
+# fábricas de sessões assíncronas compartilhadas por todas as rotas: leitura
+# e escrita (rotas que alteram a fila); as de escrita devem ser curtas
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+WriteSessionLocal = async_sessionmaker(
+    write_engine, autoflush=False, expire_on_commit=False
 )
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 Base = declarative_base()
 
 
@@ -40,34 +319,251 @@ class Message(Base):
     __tablename__ = "messages"
     id = Column(String, primary_key=True, index=True)
     text = Column(Text, nullable=False)
+    # CPF/CNPJ normalizado (sem pontuação), chave do cache de resultados
+    document = Column(String, nullable=True)
+    # no Postgres vira um tipo ENUM nativo; no SQLite, VARCHAR
     status = Column(
-        SAEnum(StatusEnum), nullable=False, index=True, default=StatusEnum.PENDING
+        SAEnum(StatusEnum, name="status_enum"),
+        nullable=False,
+        index=True,
+        default=StatusEnum.PENDING,
     )
-    result_json = Column(SAJSON, nullable=True)
+    # JSONB no Postgres (binário, indexável); JSON/TEXT no SQLite
+    result_json = Column(SAJSON().with_variant(JSONB(), "postgresql"), nullable=True)
     error_msg = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # lease: quem reservou o job e até quando a reserva vale
+    worker_id = Column(String, nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    # header Idempotency-Key do /send que criou o job
+    idempotency_key = Column(String, nullable=True)
+    # agendamento: quem enfileirou, prioridade (maior sai antes) e a marca de
+    # tempo virtual da fila justa (menor sai antes dentro da prioridade)
+    client_id = Column(
+        String,
+        nullable=False,
+        default=DEFAULT_CLIENT_ID,
+        server_default=sql_text(f"'{DEFAULT_CLIENT_ID}'"),
+    )
+    priority = Column(Integer, nullable=False, default=0, server_default="0")
+    vtag = Column(Float, nullable=False, default=0.0, server_default="0")
 
+    __table_args__ = (
+        # usado pelo reaper: PROCESSING com lease vencido
+        Index("ix_messages_status_lease", "status", "lease_expires_at"),
+        # fila/listagem por status em ordem de chegada: /next e /jobs?status=
+        Index("ix_messages_status_created", "status", "created_at", "id"),
+        # listagem sem filtro de status (/jobs com cursor)
+        Index("ix_messages_created", "created_at", "id"),
+        # cache de resultados: DONE mais recente de um documento
+        Index("ix_messages_document_status", "document", "status", "updated_at"),
+        # /jobs/export: DONE em ordem de conclusão
+        Index("ix_messages_status_updated", "status", "updated_at", "id"),
+        Index("uq_messages_idempotency_key", "idempotency_key", unique=True),
+    )
 
-Base.metadata.create_all(bind=engine)
+
+# ordem de reserva do /next: o primeiro PENDING deste índice é o próximo job
+Index(
+    "ix_messages_claim",
+    Message.status,
+    Message.priority.desc(),
+    Message.vtag,
+    Message.created_at,
+    Message.id,
+)
+CLAIM_ORDER = (
+    Message.priority.desc(),
+    Message.vtag.asc(),
+    Message.created_at.asc(),
+    Message.id.asc(),
+)
+
+
+INFLIGHT = (StatusEnum.PENDING, StatusEnum.PROCESSING)
+
+# no máximo um job em andamento (pending/processing) por documento: pedidos
+# simultâneos do mesmo CPF/CNPJ são agrupados no mesmo job
+Index(
+    "uq_messages_inflight_document",
+    Message.document,
+    unique=True,
+    sqlite_where=Message.status.in_(INFLIGHT),
+    postgresql_where=Message.status.in_(INFLIGHT),
+)
 
 
-def get_db():
-    db: Session = SessionLocal()
+class Client(Base):
+    """
+    Cliente da fila justa: peso (fatia relativa do /next) e relógio virtual,
+    a marca do último job que ele enfileirou. Cada job novo recebe a marca
+    max(relógio do sistema, relógio do cliente) + 1/peso, então um cliente
+    com 50 mil jobs na fila não atrasa quem chega com poucos: as marcas dos
+    dois se intercalam a partir do ponto em que a fila está.
+    """
+
+    __tablename__ = "clients"
+    id = Column(String, primary_key=True)
+    weight = Column(Float, nullable=False, default=1.0, server_default="1")
+    vtime = Column(Float, nullable=False, default=0.0, server_default="0")
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    # relógio do sistema com a fila vazia: a maior marca já distribuída
+    __table_args__ = (Index("ix_clients_vtime", "vtime"),)
+
+
+class JobTiming(Base):
+    """
+    Uma etapa de uma tentativa de um job: reportada pelo worker em /finish e
+    /fail (page_load, captcha_request, captcha_solved, search_submitted,
+    first_rows, page_collected, ...) ou calculada pela API (queue_wait,
+    upload).
+    """
+
+    __tablename__ = "job_timings"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String, nullable=False)
+    attempt = Column(Integer, nullable=False)
+    seq = Column(Integer, nullable=False)  # ordem da etapa na tentativa
+    stage = Column(String, nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    ended_at = Column(DateTime, nullable=False)
+    duration_ms = Column(Float, nullable=False)
+
+    __table_args__ = (
+        # linha do tempo de um job
+        Index("ix_job_timings_job", "job_id", "attempt", "seq"),
+        # /timings/stats: varre a janela sem voltar à tabela
+        Index("ix_job_timings_ended", "ended_at", "stage", "duration_ms"),
+    )
+
+
+def _add_missing_columns(conn) -> None:
+    Base.metadata.create_all(bind=conn)
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = (
+                f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                f"{column.type.compile(dialect=conn.dialect)}"
+            )
+            if column.server_default is not None:
+                ddl += f" NOT NULL DEFAULT {column.server_default.arg}"
+            conn.execute(sql_text(ddl))
+
+
+def _migrate(conn) -> None:
+    if conn.dialect.name == "postgresql":
+        # solto sozinho no fim da transação
+        conn.execute(
+            sql_text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY}
+        )
+    _add_missing_columns(conn)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            # cada índice num savepoint: um índice único que falhe por dados
+            # duplicados antigos não impede a criação dos demais
+            try:
+                with conn.begin_nested():
+                    index.create(conn, checkfirst=True)
+            except SQLAlchemyError:
+                logger.warning("não foi possível criar o índice %s", index.name)
+
+
+def _apply_migration_pragmas(dbapi_connection, connection_record):
+    _apply_sqlite_pragmas(dbapi_connection, connection_record)
+    cursor = dbapi_connection.cursor()
     try:
-        yield db
+        cursor.execute(f"PRAGMA busy_timeout={int(MIGRATION_LOCK_TIMEOUT * 1000)}")
     finally:
-        db.close()
+        cursor.close()
+
+
+async def _ensure_schema() -> None:
+    """
+    Cria as tabelas e aplica migrações aditivas em bancos já existentes:
+    colunas novas viram ALTER TABLE ... ADD COLUMN e índices novos são
+    criados se ainda não existirem (create_all só cria tabelas ausentes).
+    Roda no startup da aplicação.
+
+    Tudo numa transação só, serializada entre os processos que sobem juntos
+    (BEGIN EXCLUSIVE no SQLite, pg_advisory_xact_lock no Postgres): o
+    primeiro migra e os demais esperam por ele e encontram o esquema pronto,
+    em vez de falharem com "duplicate column" ou "already exists".
+    """
+    if engine.dialect.name == "sqlite":
+        # conexão própria, descartada no fim, com busy_timeout longo
+        migration_engine = create_async_engine(
+            SQLALCHEMY_DATABASE_URL,
+            poolclass=NullPool,
+            execution_options={"sqlite_begin": "EXCLUSIVE"},
+        )
+        sync_engine = migration_engine.sync_engine
+        event.listen(sync_engine, "connect", _apply_migration_pragmas)
+        event.listen(sync_engine, "begin", _begin_sqlite_transaction)
+    else:
+        migration_engine = engine
+    try:
+        async with migration_engine.begin() as conn:
+            await conn.run_sync(_migrate)
+    finally:
+        if migration_engine is not engine:
+            await migration_engine.dispose()
+
+
+async def get_db():
+    async with SessionLocal() as db:
+        yield db
+
+
+async def get_write_db():
+    async with WriteSessionLocal() as db:
+        yield db
 
 
 # --------- Schemas ---------
 class SendRequest(BaseModel):
     text: str
+    # idade máxima (s) de um resultado reaproveitado; 0 força nova consulta
+    max_age: Optional[int] = Field(default=None, ge=0)
+    # quem enfileira (fila justa entre clientes) e a prioridade do job
+    client_id: Optional[str] = Field(default=None, min_length=1, max_length=100)
+    priority: int = Field(default=0, ge=0, le=MAX_PRIORITY)
 
 
 class SendResponse(BaseModel):
     id: str
     status: StatusEnum = StatusEnum.PENDING
+    cached: bool = False
+    # agrupado em um job já em andamento para o mesmo documento
+    coalesced: bool = False
+
+
+class SendBatchRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1, max_length=MAX_SEND_BATCH)
+    max_age: Optional[int] = Field(default=None, ge=0)
+    client_id: Optional[str] = Field(default=None, min_length=1, max_length=100)
+    priority: int = Field(default=0, ge=0, le=MAX_PRIORITY)
+
+
+class UploadFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+class SendBatchResponse(BaseModel):
+    ids: List[str]
+    status: StatusEnum = StatusEnum.PENDING
+    # ids que já estavam DONE no cache de resultados
+    cached: List[str] = []
+    # ids de jobs já em andamento que receberam documentos deste lote
+    coalesced: List[str] = []
 
 
 class RetrieveDoneResponse(BaseModel):
@@ -84,43 +580,840 @@ class RetrieveErrorResponse(BaseModel):
     error: str
 
 
+class RetrieveBatchRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=MAX_IDS_PER_REQUEST)
+    include_content: bool = True
+
+
 class NextResponse(BaseModel):
     id: str
     text: str
     status: StatusEnum
+    lease_expires_at: Optional[datetime] = None
+    attempts: int = 0
+    client_id: str = DEFAULT_CLIENT_ID
+    priority: int = 0
 
 
 class ClearResponse(BaseModel):
     deleted: int
 
 
+class ClientOut(BaseModel):
+    id: str
+    weight: float
+    vtime: float
+
+
+class ClientWeightRequest(BaseModel):
+    weight: float = Field(..., gt=0, le=MAX_CLIENT_WEIGHT)
+
+
+class StageMark(BaseModel):
+    stage: str = Field(..., min_length=1, max_length=64)
+    at: datetime = Field(..., description="Fim da etapa (ISO 8601; sem fuso = UTC)")
+    started_at: Optional[datetime] = Field(
+        default=None, description="Início da etapa; se omitido, a marca anterior"
+    )
+
+
 class FinishRequest(BaseModel):
     content: Dict[str, Any]
+    worker_id: Optional[str] = None
+    timings: List[StageMark] = Field(default_factory=list, max_length=MAX_TIMING_MARKS)
 
 
 class FailRequest(BaseModel):
     error: str
+    worker_id: Optional[str] = None
+    timings: List[StageMark] = Field(default_factory=list, max_length=MAX_TIMING_MARKS)
+
+
+class StageTimingOut(BaseModel):
+    attempt: int
+    stage: str
+    started_at: datetime
+    ended_at: datetime
+    duration_ms: float
+
+
+class JobTimelineResponse(BaseModel):
+    id: str
+    status: StatusEnum
+    created_at: datetime
+    claimed_at: Optional[datetime] = None
+    updated_at: datetime
+    stages: List[StageTimingOut]
+
+
+class StageStats(BaseModel):
+    count: int
+    total_ms: float
+    share: float = Field(..., description="Fração do tempo total da janela")
+    mean_ms: float
+    p50_ms: float
+    p90_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+
+
+class TimingStatsResponse(BaseModel):
+    since: datetime
+    until: datetime
+    stages: Dict[str, StageStats]
+
+
+class HeartbeatResponse(BaseModel):
+    id: str
+    status: StatusEnum
+    lease_expires_at: datetime
+
+
+def _retrieve_payload(
+    status: StatusEnum,
+    content: Optional[Dict[str, Any]] = None,
+    error: Optional[str] = None,
+    include_content: bool = True,
+) -> Dict[str, Any]:
+    """Monta a resposta de /retrieve (pending inclui processing)."""
+    if status in (StatusEnum.PENDING, StatusEnum.PROCESSING):
+        return {"status": "pending"}  # mantém contrato original
+    elif status == StatusEnum.ERROR:
+        return {"status": "error", "error": error or "unknown error"}
+    else:  # DONE
+        if not include_content:
+            return {"status": "done"}
+        return {"status": "done", "content": content or {}}
+
+
+async def _load_by_ids(db: AsyncSession, ids: List[str], *columns) -> List[Any]:
+    """SELECT das colunas pedidas para uma lista de ids, em blocos de IN (...)."""
+    rows = []
+    for start in range(0, len(ids), IN_QUERY_CHUNK):
+        chunk = ids[start : start + IN_QUERY_CHUNK]
+        result = await db.execute(select(*columns).where(Message.id.in_(chunk)))
+        rows += result.all()
+    return rows
+
+
+# --------- Reaper de leases ---------
+async def _reap_expired_leases(db: AsyncSession) -> Dict[str, int]:
+    """
+    Devolve para PENDING os jobs em PROCESSING cujo lease venceu (worker
+    morto, aba fechada...). Jobs que já esgotaram MAX_ATTEMPTS viram ERROR.
+    Cada passo é um único UPDATE sobre o índice (status, lease_expires_at);
+    PROCESSING sem lease (reservados antes dos leases existirem) também conta
+    como vencido.
+    """
+    now = datetime.utcnow()
+    expired = (
+        Message.status == StatusEnum.PROCESSING,
+        or_(Message.lease_expires_at < now, Message.lease_expires_at.is_(None)),
+    )
+    error_msg = f"lease expired after {MAX_ATTEMPTS} attempts"
+    failed = await db.execute(
+        update(Message)
+        .where(*expired, Message.attempts >= MAX_ATTEMPTS)
+        .values(
+            status=StatusEnum.ERROR,
+            error_msg=error_msg,
+            lease_expires_at=None,
+            updated_at=now,
+        )
+        .returning(Message.id)
+        .execution_options(synchronize_session=False)
+    )
+    failed_ids = failed.scalars().all()
+    requeued = await db.execute(
+        update(Message)
+        .where(*expired)
+        .values(
+            status=StatusEnum.PENDING,
+            worker_id=None,
+            claimed_at=None,
+            lease_expires_at=None,
+            updated_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    _record_transition(StatusEnum.PROCESSING, StatusEnum.PENDING, requeued.rowcount)
+    _record_transition(StatusEnum.PROCESSING, StatusEnum.ERROR, len(failed_ids))
+    for job_id in failed_ids:
+        job_events.publish(job_id, _retrieve_payload(StatusEnum.ERROR, error=error_msg))
+    return {"requeued": requeued.rowcount, "failed": len(failed_ids)}
+
+
+async def _run_reaper_once() -> Dict[str, int]:
+    async with WriteSessionLocal() as db:
+        return await _reap_expired_leases(db)
+
+
+def _record_transition(
+    old: Optional[StatusEnum], new: StatusEnum, count: int = 1
+) -> None:
+    """Conta `count` jobs passando de `old` (None = novo) para `new`."""
+    if count <= 0:
+        return
+    old_label = old.value if old is not None else "none"
+    job_transitions.inc(count, from_status=old_label, to_status=new.value)
+    if old is not None:
+        queue_depth.dec(count, status=old.value)
+    queue_depth.inc(count, status=new.value)
+
+
+async def _sync_queue_depth(db: AsyncSession) -> None:
+    """Recalcula os gauges de profundidade com um COUNT agrupado por status."""
+    result = await db.execute(
+        select(Message.status, func.count()).group_by(Message.status)
+    )
+    counts = dict(result.all())
+    for job_status in StatusEnum:
+        queue_depth.set(counts.get(job_status, 0), status=job_status.value)
+
+
+async def _run_depth_sync() -> None:
+    async with SessionLocal() as db:
+        await _sync_queue_depth(db)
+
+
+async def _reaper_loop():
+    loop = asyncio.get_running_loop()
+    next_sync = loop.time() + METRICS_RESYNC_SECONDS
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL_SECONDS)
+        try:
+            result = await _run_reaper_once()
+            if result["requeued"] or result["failed"]:
+                logger.info("reaper: %s", result)
+            if result["requeued"]:
+                work_signal.notify()
+        except Exception:
+            logger.exception("reaper: falha ao liberar leases vencidos")
+        if loop.time() >= next_sync:
+            next_sync = loop.time() + METRICS_RESYNC_SECONDS
+            try:
+                await _run_depth_sync()
+            except Exception:
+                logger.exception("métricas: falha ao recalcular a profundidade")
+
+
+async def _publish_finished(job_ids: List[str]) -> int:
+    """
+    Publica no pub/sub os jobs da lista que já estão DONE/ERROR no banco
+    (finalizados em outro processo). Retorna quantos publicou.
+    """
+    finished = 0
+    async with SessionLocal() as db:
+        for start in range(0, len(job_ids), IN_QUERY_CHUNK):
+            chunk = job_ids[start : start + IN_QUERY_CHUNK]
+            result = await db.execute(
+                select(
+                    Message.id, Message.status, Message.result_json, Message.error_msg
+                ).where(
+                    Message.id.in_(chunk),
+                    Message.status.in_((StatusEnum.DONE, StatusEnum.ERROR)),
+                )
+            )
+            for row in result:
+                job_events.publish(
+                    row.id,
+                    _retrieve_payload(row.status, row.result_json, row.error_msg),
+                )
+                finished += 1
+    return finished
+
+
+async def _events_recheck_loop():
+    while True:
+        await asyncio.sleep(EVENTS_RECHECK_SECONDS)
+        job_ids = job_events.subscribed()
+        if not job_ids:
+            continue
+        try:
+            await _publish_finished(job_ids)
+        except Exception:
+            logger.exception("events: falha ao conferir os jobs assinados")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await _ensure_schema()
+    await _run_depth_sync()
+    work_signal.bind(asyncio.get_running_loop())
+    job_events.bind(asyncio.get_running_loop())
+    tasks = [asyncio.create_task(_reaper_loop())]
+    if SHARED_DATABASE:
+        tasks.append(asyncio.create_task(_events_recheck_loop()))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
 
 
 # --------- App ---------
-app = FastAPI(title="Mini Queue API", version="1.1.0")
+app = FastAPI(title="Mini Queue API", version="1.1.0", lifespan=lifespan)
+app.add_middleware(LatencyMiddleware, histogram=http_request_seconds)
+
+# lock do banco ainda ocupado depois de busy_timeout (SQLite) ou
+# lock_timeout (Postgres): sobrecarga passageira, o cliente deve tentar de novo
+LOCK_ERROR_MARKERS = ("database is locked", "database is busy", "lock timeout")
+LOCK_RETRY_AFTER_SECONDS = 1
+
+
+@app.exception_handler(OperationalError)
+@app.exception_handler(PoolTimeoutError)
+async def database_busy_handler(request: Request, exc: SQLAlchemyError):
+    """
+    503 com Retry-After quando o lock do banco (OperationalError) ou uma
+    conexão do pool (PoolTimeoutError) não ficou livre a tempo.
+    """
+    if isinstance(exc, OperationalError) and not any(
+        marker in str(exc.orig).lower() for marker in LOCK_ERROR_MARKERS
+    ):
+        raise exc
+    logger.warning("%s %s: banco ocupado (%s)", request.method, request.url.path, exc)
+    return JSONResponse(
+        {"detail": "database busy, please retry"},
+        status_code=503,
+        headers={"Retry-After": str(LOCK_RETRY_AFTER_SECONDS)},
+    )
 
 
 @app.post(
     "/send", response_model=SendResponse, summary="Enfileira um texto e retorna um id"
 )
-def send(payload: SendRequest, db: Session = Depends(get_db)):
-    job_id = str(uuid4())
-    record = Message(
-        id=job_id,
-        text=payload.text,
-        status=StatusEnum.PENDING,
-        created_at=datetime.utcnow(),
-        updated_at=datetime.utcnow(),
+async def send(
+    payload: SendRequest,
+    db: AsyncSession = Depends(get_write_db),
+    idempotency_key: Optional[str] = Header(
+        default=None,
+        description="Repetir a chamada com a mesma chave devolve o mesmo job",
+    ),
+):
+    """
+    Enfileira a consulta de um CPF/CNPJ. Documentos inválidos são recusados
+    (422). Se o mesmo documento já tiver um resultado DONE recente, devolve
+    esse job (status done, cached=true) em vez de raspar de novo; se já houver
+    um job em andamento para ele, devolve esse job (coalesced=true).
+
+    `priority` > 0 passa o job na frente de todos os de prioridade menor
+    (ex.: consultas interativas); `client_id` identifica quem enfileira para
+    a fila justa entre clientes.
+    """
+    try:
+        document = normalize_document(payload.text)
+    except ValueError as exc:
+        raise HTTPException(422, str(exc))
+    [result] = await _enqueue(
+        db,
+        [(payload.text, document)],
+        payload.max_age,
+        [idempotency_key],
+        client_id=payload.client_id,
+        priority=payload.priority,
+    )
+    await db.commit()
+    _record_enqueued([result])
+    if result.status == StatusEnum.PENDING:
+        work_signal.notify()
+    return SendResponse(**result._asdict())
+
+
+def _cache_max_age(max_age: Optional[int]) -> int:
+    if max_age is None:
+        return RESULT_CACHE_TTL_SECONDS
+    return min(max_age, RESULT_CACHE_TTL_SECONDS)
+
+
+async def _lookup_cached(
+    db: AsyncSession, documents: List[str], max_age: Optional[int]
+) -> Dict[str, str]:
+    """
+    Documento -> id do job DONE mais recente com no máximo `max_age` segundos.
+    Consulta primeiro o cache em memória e depois o índice
+    (document, status, updated_at) para o que faltar (resultados concluídos
+    em outros processos).
+    """
+    max_age = _cache_max_age(max_age)
+    if max_age <= 0 or not documents:
+        return {}
+    found: Dict[str, str] = {}
+    misses = []
+    for document in dict.fromkeys(documents):
+        job_id = result_cache.get(document, max_age)
+        if job_id is None:
+            misses.append(document)
+        else:
+            found[document] = job_id
+
+    now = datetime.utcnow()
+    for start in range(0, len(misses), IN_QUERY_CHUNK):
+        chunk = misses[start : start + IN_QUERY_CHUNK]
+        result = await db.execute(
+            select(Message.document, Message.id, Message.updated_at)
+            .where(
+                Message.document.in_(chunk),
+                Message.status == StatusEnum.DONE,
+                Message.updated_at >= now - timedelta(seconds=max_age),
+            )
+            .order_by(Message.updated_at.desc())
+        )
+        for row in result:
+            if row.document in found:
+                continue
+            found[row.document] = row.id
+            age = (now - row.updated_at).total_seconds()
+            result_cache.put(row.document, row.id, age=age)
+    return found
+
+
+class _Enqueued(NamedTuple):
+    id: str
+    status: StatusEnum
+    cached: bool = False
+    coalesced: bool = False
+    created: bool = False  # job novo inserido por esta chamada
+
+
+def _record_enqueued(results: List[_Enqueued]) -> None:
+    _record_transition(None, StatusEnum.PENDING, sum(r.created for r in results))
+
+
+async def _lookup_inflight(db: AsyncSession, documents: List[str]) -> Dict[str, Any]:
+    """Documento -> (id, status) do job PENDING/PROCESSING daquele documento."""
+    documents = list(dict.fromkeys(documents))
+    found = {}
+    for start in range(0, len(documents), IN_QUERY_CHUNK):
+        chunk = documents[start : start + IN_QUERY_CHUNK]
+        result = await db.execute(
+            select(Message.document, Message.id, Message.status).where(
+                Message.document.in_(chunk), Message.status.in_(INFLIGHT)
+            )
+        )
+        found.update((row.document, row) for row in result)
+    return found
+
+
+async def _lookup_keys(db: AsyncSession, keys: List[str]) -> Dict[str, Any]:
+    """Idempotency-Key -> (id, status, document) do job criado com ela."""
+    found = {}
+    for start in range(0, len(keys), IN_QUERY_CHUNK):
+        chunk = keys[start : start + IN_QUERY_CHUNK]
+        result = await db.execute(
+            select(
+                Message.idempotency_key, Message.id, Message.status, Message.document
+            ).where(Message.idempotency_key.in_(chunk))
+        )
+        found.update((row.idempotency_key, row) for row in result)
+    return found
+
+
+async def _virtual_time(db: AsyncSession) -> float:
+    """
+    Relógio virtual do sistema: a marca do próximo job do /next (início do
+    índice ix_messages_claim) ou, com a fila vazia, a maior marca já
+    distribuída (ix_clients_vtime).
+    """
+    head = await db.scalar(
+        select(Message.vtag)
+        .where(Message.status == StatusEnum.PENDING)
+        .order_by(*CLAIM_ORDER)
+        .limit(1)
+    )
+    if head is not None:
+        return head
+    return await db.scalar(select(func.max(Client.vtime))) or 0.0
+
+
+async def _reserve_tags(
+    db: AsyncSession, client_id: str, count: int, now: float
+) -> List[float]:
+    """
+    Reserva as marcas virtuais dos próximos `count` jobs do cliente: começam
+    em max(relógio do sistema `now`, relógio do cliente), de 1/peso em 1/peso.
+    Um cliente que ficou parado não acumula crédito.
+
+    O relógio do cliente avança num único UPDATE ... RETURNING, sem ler e
+    depois gravar (pedidos simultâneos do mesmo cliente recebem faixas
+    distintas), na mesma transação que inseriu os jobs: se ela falhar, a
+    reserva volta junto.
+    """
+    await db.execute(_insert_ignore(db, Client).values(id=client_id))
+    start = case((Client.vtime > now, Client.vtime), else_=now)
+    row = (
+        await db.execute(
+            update(Client)
+            .where(Client.id == client_id)
+            .values(vtime=start + count / Client.weight, updated_at=datetime.utcnow())
+            .returning(Client.vtime, Client.weight)
+        )
+    ).one()
+    step = 1.0 / row.weight
+    first = row.vtime - step * count
+    return [first + step * (i + 1) for i in range(count)]
+
+
+async def _peek_tag(db: AsyncSession, client_id: str, now: float) -> float:
+    """A marca que o próximo job do cliente receberia, sem reservá-la."""
+    row = (
+        await db.execute(
+            select(Client.vtime, Client.weight).where(Client.id == client_id)
+        )
+    ).one_or_none()
+    if row is None:
+        return now + 1.0
+    return max(now, row.vtime) + 1.0 / row.weight
+
+
+async def _set_tags(db: AsyncSession, tags: Dict[str, float]) -> None:
+    """Grava as marcas reservadas nos jobs recém-inseridos (id -> marca)."""
+    table = Message.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("b_id"))
+        .values(vtag=bindparam("b_tag"))
+    )
+    await db.execute(
+        stmt, [{"b_id": job_id, "b_tag": tag} for job_id, tag in tags.items()]
+    )
+
+
+async def _promote_coalesced(
+    db: AsyncSession, promoted: List[Tuple[str, float]], priority: int
+) -> None:
+    """
+    Um pedido agrupado num job PENDING de outro cliente não espera a vez
+    desse cliente: o job fica com a menor das marcas e a maior prioridade.
+    """
+    if not promoted:
+        return
+    table = Message.__table__
+    tag, level = bindparam("b_tag"), bindparam("b_priority")
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("b_id"), table.c.status == StatusEnum.PENDING)
+        .values(
+            vtag=case((table.c.vtag > tag, tag), else_=table.c.vtag),
+            priority=case((table.c.priority < level, level), else_=table.c.priority),
+        )
+    )
+    await db.execute(
+        stmt,
+        [
+            {"b_id": job_id, "b_tag": vtag, "b_priority": priority}
+            for job_id, vtag in promoted
+        ],
+    )
+
+
+async def _enqueue(
+    db: AsyncSession,
+    items: List[Tuple[str, str]],
+    max_age: Optional[int] = None,
+    keys: Optional[List[Optional[str]]] = None,
+    client_id: Optional[str] = None,
+    priority: int = 0,
+) -> List[_Enqueued]:
+    """
+    Enfileira pares (texto, documento normalizado), sem commit, na ordem:
+    1. Idempotency-Key já usada -> o mesmo job de antes
+    2. resultado DONE recente no cache -> o job DONE existente
+    3. job em andamento para o documento (ou o mesmo documento repetido no
+       pedido) -> esse job (coalescido; se estiver PENDING, herda a marca
+       que o cliente receberia e a prioridade do pedido, se forem melhores)
+    4. senão, um job PENDING novo, com a marca virtual do cliente
+
+    A inserção usa ON CONFLICT DO NOTHING contra o índice único parcial de
+    documentos em andamento (e o de Idempotency-Key). Depois, uma consulta
+    pelo mesmo índice diz qual job ficou com cada documento. Assim, pedidos
+    simultâneos, mesmo em processos diferentes, convergem para um único job.
+    Só os jobs de fato inseridos avançam o relógio do cliente: repetições,
+    reenvios de algo em andamento e resultados do cache não custam a vez.
+    """
+    keys = keys or [None] * len(items)
+    client_id = client_id or DEFAULT_CLIENT_ID
+    results: List[Optional[_Enqueued]] = [None] * len(items)
+    promoted: List[str] = []
+
+    replays = await _lookup_keys(db, [k for k in keys if k])
+    for i, key in enumerate(keys):
+        row = replays.get(key) if key else None
+        if row is None:
+            continue
+        if row.document != items[i][1]:
+            raise HTTPException(409, "Idempotency-Key reused for another document")
+        results[i] = _Enqueued(row.id, row.status)
+
+    # um job em andamento pode terminar entre a inserção e a consulta; nesse
+    # caso a próxima volta o encontra pelo cache de resultados
+    for _ in range(3):
+        todo = [i for i, r in enumerate(results) if r is None]
+        if not todo:
+            break
+        cached = await _lookup_cached(db, [items[i][1] for i in todo], max_age)
+        for i in todo:
+            if items[i][1] in cached:
+                results[i] = _Enqueued(cached[items[i][1]], StatusEnum.DONE, True)
+        todo = [i for i in todo if results[i] is None]
+        if not todo:
+            break
+        # uma linha por documento: as repetições ficam com o job da primeira
+        leaders: Dict[str, int] = {}
+        for i in todo:
+            leaders.setdefault(items[i][1], i)
+        # relógio lido antes da inserção: as linhas novas ainda não têm marca
+        now = await _virtual_time(db)
+        inserted = await _insert_texts(
+            db,
+            [items[i] for i in leaders.values()],
+            [keys[i] for i in leaders.values()],
+            client_id=client_id,
+            priority=priority,
+        )
+        new_ids = dict(zip(leaders.values(), inserted))
+        owners = await _lookup_inflight(db, list(leaders))
+        created = [
+            new_ids[i]
+            for document, i in leaders.items()
+            if document in owners and owners[document].id == new_ids[i]
+        ]
+        if created:
+            reserved = await _reserve_tags(db, client_id, len(created), now)
+            await _set_tags(db, dict(zip(created, reserved)))
+        for i in todo:
+            owner = owners.get(items[i][1])
+            if owner is None:
+                continue
+            new = owner.id == new_ids.get(i)
+            results[i] = _Enqueued(
+                owner.id, owner.status, coalesced=not new, created=new
+            )
+            if not new and owner.status == StatusEnum.PENDING:
+                promoted.append(owner.id)
+
+    if any(r is None for r in results):
+        raise HTTPException(503, "could not enqueue, please retry")
+    if promoted:
+        tag = await _peek_tag(db, client_id, await _virtual_time(db))
+        promoted = list(dict.fromkeys(promoted))
+        await _promote_coalesced(db, [(job_id, tag) for job_id in promoted], priority)
+    return results
+
+
+def _normalize_texts(texts: List[str]) -> List[Tuple[str, str]]:
+    items, invalid = [], []
+    for index, text in enumerate(texts):
+        try:
+            items.append((text, normalize_document(text)))
+        except ValueError:
+            invalid.append({"index": index, "text": text})
+    if invalid:
+        raise HTTPException(
+            422, {"message": "invalid CPF/CNPJ", "invalid": invalid[:100]}
+        )
+    return items
+
+
+def _insert_ignore(db: AsyncSession, model=Message):
+    """INSERT que ignora linhas que violariam um índice único."""
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        return pg_insert(model).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite_insert(model).on_conflict_do_nothing()
+    return insert(model)
+
+
+async def _insert_texts(
+    db: AsyncSession,
+    items: List[Tuple[str, str]],
+    keys: Optional[List[Optional[str]]] = None,
+    client_id: str = DEFAULT_CLIENT_ID,
+    priority: int = 0,
+) -> List[str]:
+    """
+    Insere vários pares (texto, documento) como PENDING com um único
+    executemany (sem commit). Retorna os ids gerados na mesma ordem da
+    entrada; linhas descartadas por conflito (documento já em andamento ou
+    Idempotency-Key repetida) simplesmente não aparecem no banco. A marca
+    virtual fica zerada: quem sabe quais linhas entraram grava com _set_tags.
+    """
+    if not items:
+        return []
+    keys = keys or [None] * len(items)
+    now = datetime.utcnow()
+    rows = [
+        {
+            "id": str(uuid4()),
+            "text": text,
+            "document": document,
+            "idempotency_key": key,
+            "client_id": client_id,
+            "priority": priority,
+            "status": StatusEnum.PENDING,
+            # desloca 1µs por linha para preservar a ordem FIFO dentro do lote
+            "created_at": now + timedelta(microseconds=i),
+            "updated_at": now,
+        }
+        for i, ((text, document), key) in enumerate(zip(items, keys))
+    ]
+    await db.execute(_insert_ignore(db), rows)
+    return [r["id"] for r in rows]
+
+
+def _batch_response(results: List[_Enqueued]) -> SendBatchResponse:
+    return SendBatchResponse(
+        ids=[r.id for r in results],
+        cached=list(dict.fromkeys(r.id for r in results if r.cached)),
+        coalesced=list(dict.fromkeys(r.id for r in results if r.coalesced)),
+    )
+
+
+def _item_keys(key: Optional[str], count: int, start: int = 0):
+    """Deriva uma Idempotency-Key por item de lote a partir da chave do lote."""
+    if key is None:
+        return None
+    return [f"{key}:{start + i}" for i in range(count)]
+
+
+@app.post(
+    "/send/batch",
+    response_model=SendBatchResponse,
+    summary="Enfileira vários textos em uma única transação",
+)
+async def send_batch(
+    payload: SendBatchRequest,
+    db: AsyncSession = Depends(get_write_db),
+    idempotency_key: Optional[str] = Header(default=None),
+):
+    """
+    Todos os documentos são validados antes de inserir; se algum for
+    inválido, nada é enfileirado (422 com os índices recusados). Documentos
+    repetidos no lote ou já em andamento apontam para o mesmo job.
+    """
+    items = _normalize_texts(payload.texts)
+    keys = _item_keys(idempotency_key, len(items))
+    results = await _enqueue(
+        db,
+        items,
+        payload.max_age,
+        keys,
+        client_id=payload.client_id,
+        priority=payload.priority,
     )
-    db.add(record)
-    db.commit()
-    return SendResponse(id=job_id, status=StatusEnum.PENDING)
+    await db.commit()
+    _record_enqueued(results)
+    work_signal.notify()
+    return _batch_response(results)
+
+
+async def _iter_lines(request: Request):
+    """Decodifica o corpo da requisição em streaming e produz linha a linha."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer.strip():
+        yield buffer.rstrip("\r")
+
+
+def _parse_ndjson(line: str) -> Optional[str]:
+    value = json.loads(line)
+    if isinstance(value, dict):
+        value = value.get("text")
+    return None if value is None else str(value)
+
+
+def _parse_csv(line: str) -> Optional[str]:
+    cells = next(csv.reader([line]), [])
+    return cells[0] if cells else None
+
+
+@app.post(
+    "/send/batch/upload",
+    response_model=SendBatchResponse,
+    summary="Enfileira textos de um arquivo NDJSON ou CSV enviado em streaming",
+    responses={
+        200: {"description": "Ids na mesma ordem das linhas do arquivo"},
+        400: {"description": "Linha ou CPF/CNPJ inválido, ou arquivo vazio"},
+    },
+)
+async def send_batch_upload(
+    request: Request,
+    db: AsyncSession = Depends(get_write_db),
+    format: Optional[UploadFormat] = Query(
+        default=None,
+        description="ndjson ou csv; se omitido, é deduzido do Content-Type",
+    ),
+    max_age: Optional[int] = Query(
+        default=None,
+        ge=0,
+        description="Idade máxima (s) de um resultado reaproveitado do cache",
+    ),
+    client_id: Optional[str] = Query(
+        default=None,
+        min_length=1,
+        max_length=100,
+        description="Quem enfileira (fila justa entre clientes)",
+    ),
+    priority: int = Query(default=0, ge=0, le=MAX_PRIORITY),
+    idempotency_key: Optional[str] = Header(default=None),
+):
+    """
+    Lê o corpo em streaming (não precisa caber em memória como um único JSON)
+    e valida todas as linhas antes de inserir: com uma linha inválida, nada
+    é enfileirado. Depois insere em blocos de INSERT_CHUNK linhas, cada um
+    na sua transação curta (o lock de escrita não fica preso enquanto o
+    cliente envia o arquivo); com Idempotency-Key, repetir o upload depois
+    de uma falha no meio não duplica nada.
+    - NDJSON: cada linha é uma string JSON ou um objeto {"text": ...}
+    - CSV: usa a primeira coluna; um cabeçalho "text" na primeira linha é ignorado
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = UploadFormat.CSV if "csv" in content_type else UploadFormat.NDJSON
+    parse = _parse_ndjson if format == UploadFormat.NDJSON else _parse_csv
+
+    items: List[Tuple[str, str]] = []
+    lineno = 0
+    async for line in _iter_lines(request):
+        lineno += 1
+        if not line.strip():
+            continue
+        try:
+            text = parse(line)
+        except ValueError:
+            raise HTTPException(400, f"invalid {format.value} at line {lineno}")
+        if text is None or (
+            lineno == 1 and format == UploadFormat.CSV and text.lower() == "text"
+        ):
+            continue
+        try:
+            items.append((text, normalize_document(text)))
+        except ValueError:
+            raise HTTPException(400, f"invalid CPF/CNPJ at line {lineno}")
+    if not items:
+        raise HTTPException(400, "no texts found in upload")
+
+    results: List[_Enqueued] = []
+    for start in range(0, len(items), INSERT_CHUNK):
+        chunk = items[start : start + INSERT_CHUNK]
+        keys = _item_keys(idempotency_key, len(chunk), start=start)
+        enqueued = await _enqueue(
+            db, chunk, max_age, keys, client_id=client_id, priority=priority
+        )
+        await db.commit()
+        _record_enqueued(enqueued)
+        work_signal.notify()
+        results += enqueued
+    return _batch_response(results)
 
 
 @app.get(
@@ -134,108 +1427,510 @@ def send(payload: SendRequest, db: Session = Depends(get_db)):
     },
     summary="Consulta status pelo id",
 )
-def retrieve(job_id: str, db: Session = Depends(get_db)):
-    record: Optional[Message] = db.get(Message, job_id)
+async def retrieve(job_id: str, db: AsyncSession = Depends(get_db)):
+    record: Optional[Message] = await db.get(Message, job_id)
     if not record:
         raise HTTPException(status_code=404, detail="id not found")
 
-    if record.status in (StatusEnum.PENDING, StatusEnum.PROCESSING):
-        return {"status": "pending"}  # mantém contrato original
-    elif record.status == StatusEnum.ERROR:
-        return {"status": "error", "error": record.error_msg or "unknown error"}
-    else:  # DONE
-        return {"status": "done", "content": record.result_json or {}}
+    return _retrieve_payload(record.status, record.result_json, record.error_msg)
+
+
+def _parse_ids(ids: str) -> List[str]:
+    parsed = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if not parsed:
+        raise HTTPException(400, "no ids given")
+    if len(parsed) > MAX_IDS_PER_REQUEST:
+        raise HTTPException(400, f"at most {MAX_IDS_PER_REQUEST} ids per request")
+    return parsed
+
+
+async def _retrieve_many(
+    db: AsyncSession, ids: List[str], include_content: bool
+) -> Dict[str, Dict[str, Any]]:
+    columns = [Message.id, Message.status, Message.error_msg]
+    if include_content:
+        columns.append(Message.result_json)
+    found = {
+        row.id: _retrieve_payload(
+            row.status,
+            row.result_json if include_content else None,
+            row.error_msg,
+            include_content,
+        )
+        for row in await _load_by_ids(db, ids, *columns)
+    }
+    return {i: found.get(i, {"status": "not_found"}) for i in ids}
+
+
+_RETRIEVE_BATCH_RESPONSES = {
+    200: {
+        "description": (
+            "Mapa id -> resposta no mesmo formato de /retrieve/{job_id}; "
+            "ids desconhecidos aparecem com status not_found."
+        )
+    },
+    400: {"description": "Nenhum id ou ids demais"},
+}
+
+
+@app.get(
+    "/retrieve",
+    responses=_RETRIEVE_BATCH_RESPONSES,
+    summary="Consulta o status de vários ids de uma vez",
+)
+async def retrieve_batch(
+    ids: str = Query(..., description="Ids separados por vírgula"),
+    include_content: bool = Query(
+        default=True, description="Se false, omite o result_json (só status)"
+    ),
+    db: AsyncSession = Depends(get_db),
+):
+    return await _retrieve_many(db, _parse_ids(ids), include_content)
+
+
+@app.post(
+    "/retrieve",
+    responses=_RETRIEVE_BATCH_RESPONSES,
+    summary="Consulta o status de vários ids de uma vez (ids no corpo)",
+)
+async def retrieve_batch_post(
+    payload: RetrieveBatchRequest, db: AsyncSession = Depends(get_db)
+):
+    ids = list(dict.fromkeys(payload.ids))
+    return await _retrieve_many(db, ids, payload.include_content)
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.get(
+    "/events",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {"text/event-stream": {}},
+            "description": (
+                "Stream SSE: um evento `job` por id quando ele chega a done/error "
+                "(mesmo formato de /retrieve, acrescido de `id`). O stream termina "
+                "quando todos os ids estiverem resolvidos."
+            ),
+        },
+    },
+    summary="Assina a conclusão de um ou vários jobs (server-sent events)",
+)
+async def job_event_stream(
+    request: Request,
+    ids: str = Query(..., description="Ids separados por vírgula"),
+    include_content: bool = Query(
+        default=True, description="Inclui o result_json nos eventos de done"
+    ),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Em vez de fazer polling em /retrieve/{job_id}, o cliente abre este stream
+    e recebe o estado final assim que /finish ou /fail confirmam a transação.
+    Os eventos vêm do pub/sub em memória; o banco só é consultado na
+    assinatura, para os jobs que já terminaram antes dela. Com o banco
+    compartilhado com outros processos (SHARED_DATABASE), os finalizados
+    neles chegam pela conferência periódica de _events_recheck_loop.
+    """
+    job_ids = _parse_ids(ids)
+    # assina antes de consultar para não perder um finish no meio do caminho
+    queue = job_events.subscribe(job_ids)
+
+    try:
+        rows = await _load_by_ids(
+            db,
+            job_ids,
+            Message.id,
+            Message.status,
+            Message.result_json,
+            Message.error_msg,
+        )
+    except Exception:
+        job_events.unsubscribe(job_ids, queue)
+        raise
+    # encerra a transação de leitura: o stream pode durar muito tempo
+    await db.rollback()
+
+    remaining = set(job_ids)
+
+    def finished(rows):
+        for row in rows:
+            if row.status in (StatusEnum.DONE, StatusEnum.ERROR):
+                payload = _retrieve_payload(
+                    row.status, row.result_json, row.error_msg, include_content
+                )
+                remaining.discard(row.id)
+                yield _sse("job", {"id": row.id, **payload})
+
+    async def stream():
+        try:
+            found = {row.id for row in rows}
+            for message in finished(rows):
+                yield message
+            for job_id in remaining - found:
+                remaining.discard(job_id)
+                yield _sse("job", {"id": job_id, "status": "not_found"})
+
+            while remaining:
+                try:
+                    job_id, payload = await asyncio.wait_for(
+                        queue.get(), SSE_KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if job_id not in remaining:
+                    continue
+                remaining.discard(job_id)
+                if not include_content:
+                    payload = {k: v for k, v in payload.items() if k != "content"}
+                yield _sse("job", {"id": job_id, **payload})
+        finally:
+            job_events.unsubscribe(job_ids, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _claim_pending(
+    db: AsyncSession,
+    limit: int = 1,
+    worker_id: Optional[str] = None,
+    lease_seconds: int = LEASE_SECONDS,
+):
+    """
+    Reserva atomicamente até `limit` registros PENDING e os marca como
+    PROCESSING em um único UPDATE ... RETURNING, gravando o worker e o
+    vencimento do lease e incrementando o contador de tentativas.
+
+    A ordem é a do índice ix_messages_claim: prioridade (maior primeiro),
+    depois a marca virtual da fila justa entre clientes e a chegada. Achar
+    o próximo job é uma descida no índice, sem varrer a fila.
+
+    A condição `status == PENDING` no próprio UPDATE garante que dois workers
+    nunca recebam o mesmo job: no SQLite a escrita é serializada pelo lock do
+    banco; no Postgres a subconsulta usa FOR UPDATE SKIP LOCKED, de modo que
+    workers concorrentes pulam as linhas já travadas em vez de esperar.
+    """
+    now = datetime.utcnow()
+    head = (
+        select(Message.id)
+        .where(Message.status == StatusEnum.PENDING)
+        .order_by(*CLAIM_ORDER)
+        .limit(limit)
+    )
+    if db.bind.dialect.name == "postgresql":
+        # id = ANY(ARRAY(...)): a subconsulta trava as linhas uma vez só
+        # (InitPlan) e o UPDATE vai direto a elas pela chave primária; com
+        # IN (...) o planejador junta a subconsulta a uma varredura de todos
+        # os PENDING, que espera nas linhas travadas pelos outros nós
+        locked = head.with_for_update(skip_locked=True).scalar_subquery()
+        claimed = Message.id == any_(func.array(locked, type_=ARRAY(String)))
+    else:
+        claimed = Message.id.in_(head.scalar_subquery())
+
+    stmt = (
+        update(Message)
+        .where(claimed)
+        .where(Message.status == StatusEnum.PENDING)
+        .values(
+            status=StatusEnum.PROCESSING,
+            worker_id=worker_id,
+            claimed_at=now,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            attempts=Message.attempts + 1,
+            updated_at=now,
+        )
+        .returning(
+            Message.id,
+            Message.text,
+            Message.status,
+            Message.created_at,
+            Message.lease_expires_at,
+            Message.attempts,
+            Message.client_id,
+            Message.priority,
+            Message.vtag,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    rows = (await db.execute(stmt)).all()
+    # RETURNING não garante ordem; devolve na ordem do agendador
+    return sorted(rows, key=lambda r: (-r.priority, r.vtag, r.created_at, r.id))
 
 
 @app.post(
     "/next",
-    response_model=NextResponse,
+    response_model=Union[NextResponse, List[NextResponse]],
     responses={
         200: {
-            "description": "Reserva o registro mais antigo pendente e o marca como processing."
+            "description": (
+                "Reserva o próximo registro pendente e o marca como processing. "
+                "Com `n`, retorna uma lista com até n registros (possivelmente vazia)."
+            )
         },
-        404: {"description": "Não há registros pendentes."},
-        409: {"description": "Já existe um registro em processamento."},
+        404: {"description": "Não há registros pendentes (apenas sem `n`)."},
     },
-    summary="Busca e reserva o mais antigo em pending, se não houver outro em processing",
-)
-def next_pending(db: Session = Depends(get_db)):
-    """
-    Regras:
-    - Se existir QUALQUER registro em PROCESSING -> 409
-    - Senão, pega o mais antigo em PENDING, marca como PROCESSING e retorna
-    """
-    # Inicia uma transação para garantir atomicidade
-    with db.begin():
-        processing_exists = db.execute(
-            select(func.count())
-            .select_from(Message)
-            .where(Message.status == StatusEnum.PROCESSING)
-        ).scalar_one()
-
-        processing_exists = 0
-        if processing_exists and processing_exists > 0:
-            raise HTTPException(status_code=409, detail="a job is already processing")
-
-        # pega o mais antigo pending
-        record: Optional[Message] = (
-            db.execute(
-                select(Message)
-                .where(Message.status == StatusEnum.PENDING)
-                .order_by(Message.created_at.asc())
-                .limit(1)
+    summary="Busca e reserva o(s) próximo(s) em pending",
+)
+async def next_pending(
+    request: Request,
+    db: AsyncSession = Depends(get_write_db),
+    n: Optional[int] = Query(
+        default=None,
+        ge=1,
+        le=MAX_CLAIM_BATCH,
+        description="Reserva até n jobs de uma vez e retorna uma lista",
+    ),
+    worker_id: Optional[str] = Query(
+        default=None, description="Identificador do worker que reserva o job"
+    ),
+    lease: int = Query(
+        default=LEASE_SECONDS,
+        ge=1,
+        description="Segundos até o lease vencer e o job voltar para pending",
+    ),
+    wait: float = Query(
+        default=0,
+        ge=0,
+        le=MAX_LONG_POLL_SECONDS,
+        description="Long-poll: espera até `wait` segundos por um job se a fila estiver vazia",
+    ),
+):
+    """
+    Pega o(s) próximo(s) em PENDING, marca como PROCESSING e retorna.
+    Jobs de prioridade maior saem primeiro; na mesma prioridade, os clientes
+    (client_id do /send) se revezam na proporção dos seus pesos, e os jobs de
+    um mesmo cliente saem na ordem de chegada.
+    A reserva é feita em um único UPDATE condicional, então vários workers
+    (processos do gunicorn ou clientes de scraping) podem chamar /next ao
+    mesmo tempo sem que o mesmo job seja entregue duas vezes.
+    - Sem `n` -> um único job (404 se a fila estiver vazia), contrato original
+    - Com `n` -> lista com até n jobs, reservados na mesma transação
+    Cada reserva vale por `lease` segundos; renove com /heartbeat/{job_id}.
+    Com `wait`, se a fila estiver vazia a requisição fica aberta até chegar um
+    job (acordada na hora por /send e /send/batch) ou até o tempo acabar.
+    """
+
+    async def claim():
+        async with db.begin():
+            return await _claim_pending(
+                db, limit=n or 1, worker_id=worker_id, lease_seconds=lease
             )
-            .scalars()
-            .first()
-        )
 
-        if not record:
-            raise HTTPException(status_code=404, detail="no pending jobs")
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        waiter = work_signal.listen()
+        rows = await claim()
+        remaining = deadline - loop.time()
+        if rows or remaining <= 0 or await request.is_disconnected():
+            break
+        await work_signal.wait(waiter, min(remaining, LONG_POLL_RECHECK_SECONDS))
 
-        # reserva: marca como processing
-        record.status = StatusEnum.PROCESSING
-        record.updated_at = datetime.utcnow()
-        db.add(record)
-        # commit acontece ao sair do bloco with
+    now = datetime.utcnow()
+    for r in rows:
+        queue_wait_seconds.observe((now - r.created_at).total_seconds())
+    _record_transition(StatusEnum.PENDING, StatusEnum.PROCESSING, len(rows))
+
+    items = [
+        NextResponse(
+            id=r.id,
+            text=r.text,
+            status=r.status,
+            lease_expires_at=r.lease_expires_at,
+            attempts=r.attempts,
+            client_id=r.client_id,
+            priority=r.priority,
+        )
+        for r in rows
+    ]
+    if n is not None:
+        return items
 
-    return NextResponse(id=record.id, text=record.text, status=record.status)
+    if not items:
+        raise HTTPException(status_code=404, detail="no pending jobs")
+    return items[0]
 
 
 @app.post(
-    "/finish/{job_id}", summary="(Opcional) Marca um job como DONE com result_json"
+    "/heartbeat/{job_id}",
+    response_model=HeartbeatResponse,
+    responses={
+        404: {"description": "ID não encontrado"},
+        409: {"description": "Job não está em processing ou pertence a outro worker"},
+    },
+    summary="Renova o lease de um job em processamento",
 )
-def finish(job_id: str, payload: FinishRequest, db: Session = Depends(get_db)):
-    record = db.get(Message, job_id)
+async def heartbeat(
+    job_id: str,
+    db: AsyncSession = Depends(get_write_db),
+    worker_id: Optional[str] = Query(
+        default=None, description="Se informado, precisa ser o dono do lease"
+    ),
+    lease: int = Query(
+        default=LEASE_SECONDS, ge=1, description="Novo lease em segundos"
+    ),
+):
+    expires = datetime.utcnow() + timedelta(seconds=lease)
+    stmt = (
+        update(Message)
+        .where(Message.id == job_id, Message.status == StatusEnum.PROCESSING)
+        .values(lease_expires_at=expires)
+        .execution_options(synchronize_session=False)
+    )
+    if worker_id is not None:
+        stmt = stmt.where(Message.worker_id == worker_id)
+    if (await db.execute(stmt)).rowcount == 0:
+        await db.rollback()
+        if await db.get(Message, job_id) is None:
+            raise HTTPException(404, "id not found")
+        raise HTTPException(409, "job is not in processing for this worker")
+    await db.commit()
+    return HeartbeatResponse(
+        id=job_id, status=StatusEnum.PROCESSING, lease_expires_at=expires
+    )
+
+
+async def _get_processing(
+    db: AsyncSession, job_id: str, worker_id: Optional[str]
+) -> Message:
+    record = await db.get(Message, job_id)
     if not record:
         raise HTTPException(404, "id not found")
     if record.status != StatusEnum.PROCESSING:
         raise HTTPException(409, "job is not in processing")
+    if worker_id is not None and record.worker_id != worker_id:
+        raise HTTPException(409, "job is leased by another worker")
+    return record
+
+
+def _record_finished(record: Message) -> None:
+    if record.claimed_at is not None:
+        job_processing_seconds.observe(
+            (record.updated_at - record.claimed_at).total_seconds(),
+            status=record.status.value,
+        )
+    _record_transition(StatusEnum.PROCESSING, record.status)
+
+
+def _utc_naive(value: datetime) -> datetime:
+    """Datas com fuso viram UTC sem fuso, como as gravadas pela API."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _clamp_mark(value: datetime, low: Optional[datetime], high: datetime) -> datetime:
+    value = _utc_naive(value)
+    if low is not None and value < low:
+        return low
+    return min(value, high)
+
+
+def _timing_rows(record: Message, marks: List[StageMark]) -> List[Dict[str, Any]]:
+    """
+    Converte as marcas do worker em etapas com início, fim e duração.
+    Sem `started_at`, uma etapa começa onde a anterior terminou (a primeira,
+    na reserva do job). A API acrescenta queue_wait (criação -> reserva) e,
+    se houver marcas, upload (última marca -> chegada do /finish ou /fail).
+
+    As marcas vêm do relógio do worker: ficam presas entre a reserva e a
+    chegada do /finish ou /fail, para que um relógio adiantado ou atrasado
+    não produza etapas de dias que distorcem os percentis do /timings/stats.
+    """
+    low, high = record.claimed_at, record.updated_at
+    stages = []
+    if record.claimed_at is not None:
+        stages.append(("queue_wait", record.created_at, record.claimed_at))
+    previous = record.claimed_at
+    for mark in marks:
+        ended = _clamp_mark(mark.at, low, high)
+        if mark.started_at is not None:
+            started = _clamp_mark(mark.started_at, low, ended)
+        else:
+            started = previous or ended
+        stages.append((mark.stage, started, ended))
+        previous = ended
+    if marks:
+        stages.append(("upload", previous, record.updated_at))
+    return [
+        {
+            "job_id": record.id,
+            "attempt": record.attempts,
+            "seq": seq,
+            "stage": stage,
+            "started_at": started,
+            "ended_at": ended,
+            # marcas fora de ordem não geram duração negativa
+            "duration_ms": max((ended - started).total_seconds() * 1000, 0.0),
+        }
+        for seq, (stage, started, ended) in enumerate(stages)
+    ]
+
+
+async def _save_timings(
+    db: AsyncSession, record: Message, marks: List[StageMark]
+) -> List[Dict[str, Any]]:
+    """Grava as etapas da tentativa atual na mesma transação do /finish."""
+    rows = _timing_rows(record, marks)
+    if rows:
+        await db.execute(insert(JobTiming), rows)
+    return rows
+
+
+def _observe_timings(rows: List[Dict[str, Any]]) -> None:
+    for row in rows:
+        stage = row["stage"] if row["stage"] in METRIC_STAGES else "other"
+        job_stage_seconds.observe(row["duration_ms"] / 1000, stage=stage)
+
+
+@app.post(
+    "/finish/{job_id}", summary="(Opcional) Marca um job como DONE com result_json"
+)
+async def finish(
+    job_id: str, payload: FinishRequest, db: AsyncSession = Depends(get_write_db)
+):
+    record = await _get_processing(db, job_id, payload.worker_id)
     record.result_json = payload.content
     record.status = StatusEnum.DONE
+    record.lease_expires_at = None
     record.updated_at = datetime.utcnow()
-    db.add(record)
-    db.commit()
+    timings = await _save_timings(db, record, payload.timings)
+    await db.commit()
+    _record_finished(record)
+    _observe_timings(timings)
+    if record.document:
+        result_cache.put(record.document, job_id)
+    job_events.publish(job_id, _retrieve_payload(StatusEnum.DONE, payload.content))
     return {"status": "done"}
 
 
 @app.post("/fail/{job_id}", summary="(Opcional) Marca um job como ERROR")
-def fail(job_id: str, payload: FailRequest, db: Session = Depends(get_db)):
-    record = db.get(Message, job_id)
-    if not record:
-        raise HTTPException(404, "id not found")
-    if record.status != StatusEnum.PROCESSING:
-        raise HTTPException(409, "job is not in processing")
+async def fail(
+    job_id: str, payload: FailRequest, db: AsyncSession = Depends(get_write_db)
+):
+    record = await _get_processing(db, job_id, payload.worker_id)
     record.error_msg = payload.error
     record.status = StatusEnum.ERROR
+    record.lease_expires_at = None
     record.updated_at = datetime.utcnow()
-    db.add(record)
-    db.commit()
+    timings = await _save_timings(db, record, payload.timings)
+    await db.commit()
+    _record_finished(record)
+    _observe_timings(timings)
+    job_events.publish(job_id, _retrieve_payload(StatusEnum.ERROR, error=payload.error))
     return {"status": "error", "error": payload.error}
 
 
-from typing import List
-
-
 # ---- Schemas novos/ajustados ----
 class JobOut(BaseModel):
     id: str
@@ -245,38 +1940,347 @@ class JobOut(BaseModel):
     error_msg: Optional[str] = None
     created_at: datetime
     updated_at: datetime
+    worker_id: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    attempts: int = 0
+    client_id: str = DEFAULT_CLIENT_ID
+    priority: int = 0
 
     class Config:
         from_attributes = True  # pydantic v2
 
 
+# Campos de /jobs: por padrão tudo menos o result_json (que pode ser grande)
+JOB_FIELDS = tuple(JobOut.model_fields)
+DEFAULT_JOB_FIELDS = tuple(f for f in JOB_FIELDS if f != "result_json")
+
+# Item de /jobs: os campos de JobOut, mas só os pedidos em `fields` (ou os
+# padrão, mais result_json com include_content) aparecem; nenhum é obrigatório
+JobListItem = create_model(
+    "JobListItem",
+    **{
+        name: (Optional[field.annotation], None)
+        for name, field in JobOut.model_fields.items()
+    },
+)
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+    PARQUET = "parquet"
+
+
+def _encode_cursor(created_at: datetime, job_id: str) -> str:
+    raw = json.dumps([created_at.isoformat(), job_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, job_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(job_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(400, "invalid cursor")
+
+
 @app.get(
     "/jobs",
-    response_model=List[JobOut],
+    response_model=List[JobListItem],
     summary="Lista jobs (tudo ou filtrado por status)",
     responses={
-        200: {"description": "Lista paginada de jobs"},
+        200: {
+            "description": (
+                "Lista paginada de jobs, cada um só com os campos de `fields` "
+                "(padrão: todos menos result_json, que vem com include_content)"
+            )
+        },
     },
 )
-def list_jobs(
-    db: Session = Depends(get_db),
+async def list_jobs(
+    db: AsyncSession = Depends(get_db),
     status: Optional[StatusEnum] = Query(
         default=None, description="Filtrar por status"
     ),
     limit: int = Query(default=50, ge=1, le=500, description="Máximo de itens"),
     offset: int = Query(default=0, ge=0, description="Deslocamento para paginação"),
+    cursor: Optional[str] = Query(
+        default=None,
+        description="Cursor opaco do header X-Next-Cursor da página anterior",
+    ),
     newest: bool = Query(
         default=False, description="Ordenar do mais novo para o mais antigo"
     ),
+    fields: Optional[str] = Query(
+        default=None,
+        description=f"Campos separados por vírgula, entre: {', '.join(JOB_FIELDS)}",
+    ),
+    include_content: bool = Query(
+        default=False, description="Inclui o result_json nos campos padrão"
+    ),
 ):
-    stmt = select(Message)
+    """
+    Seleciona no SQL só as colunas pedidas (por padrão, tudo menos o
+    result_json) e serializa as linhas direto com orjson, sem hidratar
+    objetos do ORM nem validar item a item com Pydantic.
+
+    Paginação por offset (compatível) ou por cursor (keyset). Com cursor a
+    consulta busca direto a partir do último item visto no índice
+    (status, created_at, id), com custo constante em qualquer profundidade.
+    Quando a página vem cheia, o cursor da próxima página é devolvido no
+    header X-Next-Cursor.
+    """
+    if cursor is not None and offset:
+        raise HTTPException(400, "use either cursor or offset, not both")
+
+    if fields is not None:
+        selected = list(
+            dict.fromkeys(f.strip() for f in fields.split(",") if f.strip())
+        )
+        unknown = [f for f in selected if f not in JOB_FIELDS]
+        if unknown or not selected:
+            raise HTTPException(400, f"unknown fields: {', '.join(unknown)}")
+    else:
+        selected = list(DEFAULT_JOB_FIELDS)
+        if include_content:
+            selected.append("result_json")
+    # created_at e id sempre vêm do banco: são a chave do cursor
+    columns = dict.fromkeys(["id", "created_at", *selected])
+
+    stmt = select(*(getattr(Message, c) for c in columns))
     if status:
         stmt = stmt.where(Message.status == status)
-    order_col = Message.created_at.desc() if newest else Message.created_at.asc()
-    stmt = stmt.order_by(order_col).offset(offset).limit(limit)
+    key = tuple_(Message.created_at, Message.id)
+    if cursor is not None:
+        after = tuple_(*_decode_cursor(cursor))
+        stmt = stmt.where(key < after if newest else key > after)
+    if newest:
+        stmt = stmt.order_by(Message.created_at.desc(), Message.id.desc())
+    else:
+        stmt = stmt.order_by(Message.created_at.asc(), Message.id.asc())
+    stmt = stmt.offset(offset).limit(limit)
+
+    rows = (await db.execute(stmt)).all()
+    headers = {}
+    if len(rows) == limit:
+        headers["X-Next-Cursor"] = _encode_cursor(rows[-1].created_at, rows[-1].id)
+    body = orjson.dumps([{f: getattr(row, f) for f in selected} for row in rows])
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# --------- Exportação ---------
+EXPORT_PREFIX = ["job_id", "text", "finished_at", "row_index"]
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv; charset=utf-8",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+
+async def _iter_export_batches(since: Optional[datetime], until: Optional[datetime]):
+    """
+    Lê os jobs DONE em blocos de EXPORT_BATCH com um cursor do lado do
+    servidor (stream_results/yield_per), então a memória não cresce com o
+    tamanho da exportação. Usa sessão própria: o gerador roda depois que a
+    rota já retornou o StreamingResponse.
+    """
+    stmt = (
+        select(
+            Message.id,
+            Message.text,
+            Message.status,
+            Message.result_json,
+            Message.created_at,
+            Message.updated_at,
+        )
+        .where(Message.status == StatusEnum.DONE)
+        .order_by(Message.updated_at.asc(), Message.id.asc())
+        .execution_options(stream_results=True, yield_per=EXPORT_BATCH)
+    )
+    if since is not None:
+        stmt = stmt.where(Message.updated_at >= since)
+    if until is not None:
+        stmt = stmt.where(Message.updated_at < until)
+
+    async with SessionLocal() as db:
+        result = await db.stream(stmt)
+        async for partition in result.partitions():
+            yield partition
+
+
+class _FlatRows:
+    """
+    Achata result_json ({headers, rows}) em uma linha de saída por linha da
+    tabela raspada. As colunas da tabela são as do primeiro job com headers
+    (ou column_1..n, se o primeiro job com linhas não trouxe headers) e
+    ficam fixas daí em diante: o cabeçalho do CSV e o schema do Parquet
+    saem com elas. Os valores de cada job são casados pelo nome do header
+    ou, se o job não trouxe headers, pela posição, completando ou cortando
+    as células na largura das colunas.
+    """
+
+    def __init__(self):
+        self.headers: Optional[List[str]] = None
+
+    @property
+    def columns(self) -> List[str]:
+        return EXPORT_PREFIX + (self.headers or [])
+
+    def rows(self, job) -> List[List[Any]]:
+        content = job.result_json or {}
+        job_headers = [str(h) for h in content.get("headers") or []]
+        table = content.get("rows") or []
+        if self.headers is None and job_headers:
+            self.headers = job_headers
+        elif self.headers is None and table:
+            width = max(len(row) if isinstance(row, list) else 1 for row in table)
+            self.headers = [f"column_{i + 1}" for i in range(width)]
+        width = len(self.headers or [])
+        out = []
+        for index, row in enumerate(table):
+            if not isinstance(row, list):
+                row = [row]
+            if job_headers:
+                values = dict(zip(job_headers, row))
+                cells = [values.get(h, "") for h in self.headers or []]
+            else:
+                cells = (list(row) + [""] * width)[:width]
+            out.append([job.id, job.text, job.updated_at.isoformat(), index, *cells])
+        return out
+
+
+class _ChunkSink(io.RawIOBase):
+    """Arquivo só de escrita que acumula bytes até serem drenados."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+async def _export_ndjson(batches):
+    async for batch in batches:
+        yield b"".join(
+            orjson.dumps(
+                {
+                    "id": job.id,
+                    "text": job.text,
+                    "status": job.status,
+                    "created_at": job.created_at,
+                    "finished_at": job.updated_at,
+                    "content": job.result_json or {},
+                }
+            )
+            + b"\n"
+            for job in batch
+        )
+
+
+async def _export_csv(batches):
+    flat = _FlatRows()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+    async for batch in batches:
+        for job in batch:
+            rows = flat.rows(job)
+            if rows and not header_written:
+                writer.writerow(flat.columns)
+                header_written = True
+            writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if not header_written:
+        writer.writerow(flat.columns)
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def _export_parquet(batches):
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    flat = _FlatRows()
+    sink = _ChunkSink()
+    writer = None
+    try:
+        async for batch in batches:
+            rows = [row for job in batch for row in flat.rows(job)]
+            if not rows:
+                continue
+            frame = pd.DataFrame(rows, columns=flat.columns).astype(str)
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(sink, table.schema)
+            writer.write_table(table.cast(writer.schema))
+            yield sink.drain()
+        if writer is None:
+            empty = pd.DataFrame(columns=flat.columns).astype(str)
+            writer = pq.ParquetWriter(
+                sink, pa.Table.from_pandas(empty, preserve_index=False).schema
+            )
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.drain()
 
-    items = db.execute(stmt).scalars().all()
-    return [JobOut.model_validate(i) for i in items]
+
+@app.get(
+    "/jobs/export",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {media: {} for media in EXPORT_MEDIA_TYPES.values()},
+            "description": "Arquivo gerado em streaming",
+        },
+    },
+    summary="Exporta os resultados dos jobs DONE (NDJSON, CSV ou Parquet)",
+)
+async def export_jobs(
+    format: ExportFormat = Query(default=ExportFormat.NDJSON),
+    since: Optional[datetime] = Query(
+        default=None, description="Concluídos a partir de (updated_at >= since)"
+    ),
+    until: Optional[datetime] = Query(
+        default=None, description="Concluídos antes de (updated_at < until)"
+    ),
+):
+    """
+    Exporta todos os jobs DONE, ou os concluídos na janela [since, until).
+    - ndjson: um job por linha, com o result_json completo em `content`
+    - csv / parquet: uma linha por linha da tabela raspada, com job_id, text,
+      finished_at e row_index seguidos das colunas da tabela
+    """
+    exporters = {
+        ExportFormat.NDJSON: _export_ndjson,
+        ExportFormat.CSV: _export_csv,
+        ExportFormat.PARQUET: _export_parquet,
+    }
+    since = _utc_naive(since) if since else None
+    until = _utc_naive(until) if until else None
+    stream = exporters[format](_iter_export_batches(since, until))
+    filename = f"jobs.{format.value}"
+    return StreamingResponse(
+        stream,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 @app.delete(
@@ -285,21 +2289,184 @@ def list_jobs(
     response_model=ClearResponse,
     status_code=status.HTTP_200_OK,
 )
-def clear_jobs(
-    db: Session = Depends(get_db),
+async def clear_jobs(
+    db: AsyncSession = Depends(get_write_db),
     status: Optional[StatusEnum] = Query(
         default=None, description="Se informado, remove apenas registros deste status"
     ),
 ):
     """
-    Limpa a tabela messages.
+    Limpa a tabela messages (e os tempos por etapa dos jobs removidos).
     - Sem parâmetro -> remove todos os registros.
     - Com parâmetro status -> remove apenas registros daquele status.
     Retorna a quantidade de registros excluídos.
     """
-    query = db.query(Message)
+    timings = delete(JobTiming).execution_options(synchronize_session=False)
+    stmt = delete(Message).execution_options(synchronize_session=False)
     if status:
-        query = query.filter(Message.status == status)
-    deleted_count = query.delete(synchronize_session=False)
-    db.commit()
+        removed = select(Message.id).where(Message.status == status)
+        timings = timings.where(JobTiming.job_id.in_(removed))
+        stmt = stmt.where(Message.status == status)
+    await db.execute(timings)
+    deleted_count = (await db.execute(stmt)).rowcount
+    await db.commit()
+    await _run_depth_sync()
+    if status in (None, StatusEnum.DONE):
+        result_cache.clear()
     return ClearResponse(deleted=deleted_count)
+
+
+# --------- Clientes da fila justa ---------
+@app.get(
+    "/clients",
+    response_model=List[ClientOut],
+    summary="Lista os clientes da fila justa com peso e relógio virtual",
+)
+async def list_clients(db: AsyncSession = Depends(get_db)):
+    result = await db.execute(
+        select(Client.id, Client.weight, Client.vtime).order_by(Client.id)
+    )
+    return [ClientOut(**row._mapping) for row in result]
+
+
+@app.put(
+    "/clients/{client_id}",
+    response_model=ClientOut,
+    summary="Define o peso de um cliente na fila justa",
+)
+async def set_client_weight(
+    client_id: str,
+    payload: ClientWeightRequest,
+    db: AsyncSession = Depends(get_write_db),
+):
+    """
+    Um cliente com peso 2 recebe o dobro de reservas do /next de um com
+    peso 1 enquanto ambos tiverem jobs na fila. Vale para os jobs
+    enfileirados a partir de agora.
+    """
+    await db.execute(_insert_ignore(db, Client).values(id=client_id))
+    await db.execute(
+        update(Client)
+        .where(Client.id == client_id)
+        .values(weight=payload.weight, updated_at=datetime.utcnow())
+    )
+    row = (
+        await db.execute(
+            select(Client.id, Client.weight, Client.vtime).where(Client.id == client_id)
+        )
+    ).one()
+    await db.commit()
+    return ClientOut(**row._mapping)
+
+
+# --------- Métricas ---------
+@app.get(
+    "/metrics",
+    response_class=Response,
+    responses={200: {"content": {"text/plain": {}}}},
+    summary="Métricas da fila no formato do Prometheus",
+)
+async def metrics_endpoint():
+    """
+    - queue_job_transitions_total: transições de status (none = job novo)
+    - queue_jobs: profundidade atual por status, sem varrer a tabela a cada
+      coleta (mantida a cada transição e recalculada periodicamente)
+    - queue_wait_seconds: enfileiramento -> reserva em /next
+    - queue_processing_seconds: reserva -> /finish ou /fail
+    - http_request_duration_seconds: latência por rota
+    """
+    return Response(
+        content=metrics.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+# --------- Tempos por etapa ---------
+@app.get(
+    "/jobs/{job_id}/timings",
+    response_model=JobTimelineResponse,
+    responses={404: {"description": "ID não encontrado"}},
+    summary="Linha do tempo das etapas de um job",
+)
+async def job_timeline(job_id: str, db: AsyncSession = Depends(get_db)):
+    """Etapas de todas as tentativas do job, na ordem em que aconteceram."""
+    record = await db.get(Message, job_id)
+    if not record:
+        raise HTTPException(404, "id not found")
+    result = await db.execute(
+        select(JobTiming)
+        .where(JobTiming.job_id == job_id)
+        .order_by(JobTiming.attempt.asc(), JobTiming.seq.asc())
+    )
+    return JobTimelineResponse(
+        id=record.id,
+        status=record.status,
+        created_at=record.created_at,
+        claimed_at=record.claimed_at,
+        updated_at=record.updated_at,
+        stages=[
+            StageTimingOut.model_validate(t, from_attributes=True)
+            for t in result.scalars()
+        ],
+    )
+
+
+def _percentile(values: List[float], p: float) -> float:
+    """Percentil por posição (nearest-rank) de uma lista já ordenada."""
+    return values[max(math.ceil(p * len(values)) - 1, 0)]
+
+
+@app.get(
+    "/timings/stats",
+    response_model=TimingStatsResponse,
+    summary="Percentis de duração por etapa",
+)
+async def timing_stats(
+    db: AsyncSession = Depends(get_db),
+    since: Optional[datetime] = Query(
+        default=None,
+        description=f"Etapas encerradas a partir de (padrão: últimas {TIMING_STATS_WINDOW_HOURS}h)",
+    ),
+    until: Optional[datetime] = Query(
+        default=None, description="Etapas encerradas antes de (padrão: agora)"
+    ),
+    stage: Optional[str] = Query(default=None, description="Apenas esta etapa"),
+):
+    """
+    Agrega as etapas encerradas na janela [since, until): contagem, média,
+    p50/p90/p95/p99, máximo e a fração do tempo total gasta em cada etapa.
+    A consulta lê só o índice (ended_at, stage, duration_ms).
+    """
+    until = _utc_naive(until) if until else datetime.utcnow()
+    since = (
+        _utc_naive(since)
+        if since
+        else until - timedelta(hours=TIMING_STATS_WINDOW_HOURS)
+    )
+    stmt = select(JobTiming.stage, JobTiming.duration_ms).where(
+        JobTiming.ended_at >= since, JobTiming.ended_at < until
+    )
+    if stage is not None:
+        stmt = stmt.where(JobTiming.stage == stage)
+
+    durations: Dict[str, List[float]] = {}
+    for row in await db.execute(stmt):
+        durations.setdefault(row.stage, []).append(row.duration_ms)
+    grand_total = sum(sum(values) for values in durations.values()) or 1.0
+
+    stages = {}
+    for name, values in sorted(durations.items()):
+        values.sort()
+        total = sum(values)
+        stages[name] = StageStats(
+            count=len(values),
+            total_ms=total,
+            share=total / grand_total,
+            mean_ms=total / len(values),
+            p50_ms=_percentile(values, 0.50),
+            p90_ms=_percentile(values, 0.90),
+            p95_ms=_percentile(values, 0.95),
+            p99_ms=_percentile(values, 0.99),
+            max_ms=values[-1],
+        )
+    return TimingStatsResponse(since=since, until=until, stages=stages)
@@ -0,0 +1,77 @@
+# benchmarks/_common.py
+# Utilitários dos benchmarks: documentos válidos, servidor uvicorn e percentis.
+import contextlib
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# os benchmarks rodam como scripts: os módulos do app ficam um nível acima
+sys.path.insert(0, ROOT)
+
+from documents import complete_cpf  # noqa: E402,F401
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+@contextlib.contextmanager
+def api_server(
+    database: str,
+    port: int = 8765,
+    workers: int = 1,
+    env: Optional[Dict[str, str]] = None,
+) -> Iterator[str]:
+    """
+    Sobe `uvicorn app:app` com `workers` processos no SQLite `database` e
+    devolve a URL base quando /metrics responder; derruba tudo na saída.
+    """
+    environment = dict(os.environ, DATABASE_URL=f"sqlite:///{database}")
+    environment.update(env or {})
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app:app",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ],
+        cwd=ROOT,
+        env=environment,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError("uvicorn terminou durante o startup")
+            try:
+                requests.get(f"{base_url}/metrics", timeout=1)
+                break
+            except requests.ConnectionError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+        yield base_url
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def remove_database(database: str) -> None:
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(database + suffix)
@@ -0,0 +1,107 @@
+# benchmarks/fair_queue.py
+"""
+Simulação da fila justa: um cliente pesado enfileira um backlog grande e,
+enquanto os workers o consomem, clientes pequenos mandam consultas
+avulsas. Mede quanto cada consulta pequena esperou (em reservas do /next
+e em segundos) em três cenários:
+
+- fifo: tudo no mesmo client_id, como a fila por ordem de chegada
+- fair: cada cliente com o seu client_id (fila justa ponderada)
+- priority: como fifo, mas as consultas pequenas com priority=1
+
+    python benchmarks/fair_queue.py --backlog 10000 --lookups 100
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import requests
+
+from _common import api_server, complete_cpf, percentile, remove_database
+
+SEED_BATCH = 1_000
+SCENARIOS = ("fifo", "fair", "priority")
+
+
+def run_scenario(scenario: str, args) -> Tuple[List[int], List[float]]:
+    database = os.path.join(tempfile.mkdtemp(), f"fair-{scenario}.db")
+    remove_database(database)
+    waits: List[int] = []
+    seconds: List[float] = []
+    with api_server(database, args.port) as base_url, requests.Session() as session:
+        backlog = [complete_cpf(200_000_000 + i) for i in range(args.backlog)]
+        for start in range(0, len(backlog), SEED_BATCH):
+            session.post(
+                f"{base_url}/send/batch",
+                json={
+                    "texts": backlog[start : start + SEED_BATCH],
+                    "client_id": "heavy",
+                },
+            ).raise_for_status()
+
+        pending: Dict[str, Tuple[int, float]] = {}  # id -> (reserva, instante)
+        sent = claims = 0
+        while sent < args.lookups or pending:
+            if sent < args.lookups and claims % args.every == 0:
+                payload = {
+                    "text": complete_cpf(700_000_000 + sent),
+                    "client_id": "heavy",
+                }
+                if scenario == "fair":
+                    payload["client_id"] = f"small-{sent % args.tenants}"
+                elif scenario == "priority":
+                    payload["priority"] = 1
+                resp = session.post(f"{base_url}/send", json=payload)
+                resp.raise_for_status()
+                pending[resp.json()["id"]] = (claims, time.perf_counter())
+                sent += 1
+            resp = session.post(f"{base_url}/next", params={"worker_id": "bench"})
+            if resp.status_code == 404:
+                break
+            resp.raise_for_status()
+            claims += 1
+            job_id = resp.json()["id"]
+            if job_id in pending:
+                sent_at, started = pending.pop(job_id)
+                waits.append(claims - sent_at)
+                seconds.append(time.perf_counter() - started)
+    remove_database(database)
+    return waits, seconds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--backlog", type=int, default=10_000)
+    parser.add_argument("--lookups", type=int, default=100)
+    parser.add_argument("--tenants", type=int, default=5)
+    parser.add_argument(
+        "--every", type=int, default=20, help="reservas entre duas consultas"
+    )
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    print(
+        f"backlog de {args.backlog} jobs, {args.lookups} consultas de "
+        f"{args.tenants} clientes pequenos (1 a cada {args.every} reservas)"
+    )
+    print(
+        f"{'cenário':<10} {'p50':>7} {'p95':>7} {'p99':>7} {'máx':>7}"
+        f"   {'p50 s':>7} {'p99 s':>7}"
+    )
+    for scenario in args.scenarios.split(","):
+        waits, seconds = run_scenario(scenario, args)
+        print(
+            f"{scenario:<10} "
+            + " ".join(f"{percentile(waits, p):>7}" for p in (50, 95, 99))
+            + f" {max(waits, default=0):>7}"
+            + f"   {percentile(seconds, 50):>7.2f} {percentile(seconds, 99):>7.2f}"
+        )
+    print("(espera em reservas do /next entre o /send e a reserva da consulta)")
+
+
+if __name__ == "__main__":
+    main()
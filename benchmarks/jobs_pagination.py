@@ -0,0 +1,134 @@
+# benchmarks/jobs_pagination.py
+"""
+Latência de uma página do /jobs em profundidades crescentes de uma fila
+com 1M de jobs: paginação por offset contra paginação por cursor
+(X-Next-Cursor), com e sem o filtro de status.
+
+O seed vai pelo /send/batch em blocos de MAX_SEND_BATCH e leva alguns
+minutos; com --database o arquivo é mantido e reaproveitado nas rodadas
+seguintes.
+
+    python benchmarks/jobs_pagination.py --rows 1000000 --depths 0,10000,100000,500000,990000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+from _common import api_server, complete_cpf, percentile, remove_database
+
+SEED_BATCH = 10_000  # MAX_SEND_BATCH
+WALK_PAGE = 500  # maior página do /jobs: percorre o cursor até cada profundidade
+
+
+def seed(session: requests.Session, base_url: str, rows: int) -> None:
+    started = time.perf_counter()
+    for start in range(0, rows, SEED_BATCH):
+        texts = [
+            complete_cpf(100_000_000 + i)
+            for i in range(start, min(rows, start + SEED_BATCH))
+        ]
+        session.post(
+            f"{base_url}/send/batch", json={"texts": texts}, timeout=300
+        ).raise_for_status()
+        print(f"  seed {start + len(texts):>9}/{rows}", end="\r", flush=True)
+    print(f"\r  seed de {rows} jobs em {time.perf_counter() - started:.0f}s")
+
+
+def cursors_at(
+    session: requests.Session, base_url: str, params: Dict, depths: List[int]
+) -> Dict[int, Optional[str]]:
+    """O cursor que começa cada profundidade, percorrendo a fila página a página."""
+    found: Dict[int, Optional[str]] = {0: None}
+    cursor, seen = None, 0
+    for depth in sorted(d for d in depths if d > 0):
+        while seen < depth:
+            page = {**params, "limit": min(WALK_PAGE, depth - seen)}
+            if cursor is not None:
+                page["cursor"] = cursor
+            resp = session.get(f"{base_url}/jobs", params=page)
+            resp.raise_for_status()
+            cursor = resp.headers.get("X-Next-Cursor")
+            seen += len(resp.json())
+            if cursor is None:
+                break
+        if seen < depth:
+            break  # a fila acabou antes desta profundidade
+        found[depth] = cursor
+    return found
+
+
+def measure(
+    session: requests.Session, base_url: str, params: Dict, repeat: int
+) -> List[float]:
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        resp = session.get(f"{base_url}/jobs", params=params)
+        latencies.append(time.perf_counter() - started)
+        resp.raise_for_status()
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--depths", default="0,10000,100000,500000,990000")
+    parser.add_argument("--limit", type=int, default=50, help="itens por página")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--database", help="arquivo SQLite mantido entre rodadas (seed só se vazio)"
+    )
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    database = args.database or os.path.join(tempfile.mkdtemp(), "pagination.db")
+    depths = [int(d) for d in args.depths.split(",")]
+    filters = {"todos": {}, "pending": {"status": "pending"}}
+
+    with api_server(database, args.port) as base_url, requests.Session() as session:
+        stored = session.get(
+            f"{base_url}/jobs", params={"limit": 1, "offset": args.rows - 1}
+        ).json()
+        if not stored:
+            seed(session, base_url, args.rows)
+
+        print(
+            f"{args.rows} jobs, páginas de {args.limit}, {args.repeat} requisições "
+            "por ponto (ms)"
+        )
+        print(
+            f"{'filtro':<8} {'profundidade':>12}   {'offset p50':>10} "
+            f"{'p99':>8}   {'cursor p50':>10} {'p99':>8}"
+        )
+        for name, params in filters.items():
+            cursors = cursors_at(session, base_url, params, depths)
+            for depth in depths:
+                if depth not in cursors:
+                    print(f"{name:<8} {depth:>12}   (além do fim da fila)")
+                    continue
+                page = {**params, "limit": args.limit}
+                by_offset = measure(
+                    session, base_url, {**page, "offset": depth}, args.repeat
+                )
+                if cursors[depth] is not None:
+                    page["cursor"] = cursors[depth]
+                by_cursor = measure(session, base_url, page, args.repeat)
+                print(
+                    f"{name:<8} {depth:>12}   "
+                    f"{percentile(by_offset, 50) * 1000:>10.1f} "
+                    f"{percentile(by_offset, 99) * 1000:>8.1f}   "
+                    f"{percentile(by_cursor, 50) * 1000:>10.1f} "
+                    f"{percentile(by_cursor, 99) * 1000:>8.1f}"
+                )
+
+    if args.database is None:
+        remove_database(database)
+
+
+if __name__ == "__main__":
+    main()
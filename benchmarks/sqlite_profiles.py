@@ -0,0 +1,135 @@
+# benchmarks/sqlite_profiles.py
+"""
+Vazão de uma carga mista de leitura/escrita com vários workers uvicorn no
+mesmo SQLite, para cada perfil de SQLITE_PROFILE.
+
+Leituras: /jobs (uma página) e /retrieve/{id}. Escritas: /send de um
+documento novo e /next seguido de /finish.
+
+    python benchmarks/sqlite_profiles.py --workers 4 --clients 32 --duration 20
+"""
+
+import argparse
+import itertools
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+from _common import api_server, complete_cpf, percentile, remove_database
+
+SEED_BATCH = 1_000
+
+
+def seed(base_url: str, jobs: int, counter) -> List[str]:
+    ids: List[str] = []
+    with requests.Session() as session:
+        for start in range(0, jobs, SEED_BATCH):
+            texts = [
+                complete_cpf(next(counter))
+                for _ in range(min(SEED_BATCH, jobs - start))
+            ]
+            resp = session.post(f"{base_url}/send/batch", json={"texts": texts})
+            resp.raise_for_status()
+            ids += resp.json()["ids"]
+    return ids
+
+
+def run_profile(profile: str, args) -> Dict[str, List[float]]:
+    database = os.path.join(tempfile.mkdtemp(), f"bench-{profile}.db")
+    remove_database(database)
+    counter = itertools.count(100_000_000)
+    lock = threading.Lock()
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, int] = defaultdict(int)
+
+    with api_server(
+        database, args.port, args.workers, {"SQLITE_PROFILE": profile}
+    ) as base_url:
+        ids = seed(base_url, args.seed_jobs, counter)
+        deadline = time.monotonic() + args.duration
+
+        def client(number: int) -> None:
+            rng = random.Random(number)
+            session = requests.Session()
+            while time.monotonic() < deadline:
+                if rng.random() < args.read_ratio:
+                    kind = rng.choice(("jobs", "retrieve"))
+                else:
+                    kind = rng.choice(("send", "next+finish"))
+                with lock:
+                    text = complete_cpf(next(counter)) if kind == "send" else None
+                started = time.perf_counter()
+                if kind == "jobs":
+                    resp = session.get(f"{base_url}/jobs", params={"limit": 50})
+                elif kind == "retrieve":
+                    resp = session.get(f"{base_url}/retrieve/{rng.choice(ids)}")
+                elif kind == "send":
+                    resp = session.post(f"{base_url}/send", json={"text": text})
+                else:
+                    resp = _claim_and_finish(session, base_url)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies[kind].append(elapsed)
+                    statuses[f"{kind} {resp.status_code}"] += 1
+            session.close()
+
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            list(executor.map(client, range(args.clients)))
+
+    errors = {k: v for k, v in statuses.items() if k.endswith(("500", "503"))}
+    if errors:
+        print(f"  [{profile}] respostas de erro: {errors}")
+    remove_database(database)
+    return latencies
+
+
+def _claim_and_finish(session: requests.Session, base_url: str) -> requests.Response:
+    resp = session.post(f"{base_url}/next", params={"worker_id": "bench"})
+    if resp.status_code != 200:
+        return resp
+    return session.post(
+        f"{base_url}/finish/{resp.json()['id']}",
+        json={"content": {"headers": [], "rows": []}, "worker_id": "bench"},
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--profiles", default="safe,performance")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0, help="segundos")
+    parser.add_argument("--read-ratio", type=float, default=0.8)
+    parser.add_argument("--seed-jobs", type=int, default=5_000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(
+        f"{args.workers} workers, {args.clients} clientes, {args.duration:.0f}s, "
+        f"{args.read_ratio:.0%} leituras"
+    )
+    header = f"{'perfil':<12} {'operação':<12} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}"
+    for profile in args.profiles.split(","):
+        latencies = run_profile(profile, args)
+        print(header)
+        total = 0
+        for kind in ("jobs", "retrieve", "send", "next+finish"):
+            values = latencies.get(kind, [])
+            total += len(values)
+            print(
+                f"{profile:<12} {kind:<12} {len(values) / args.duration:>8.1f} "
+                f"{percentile(values, 50) * 1000:>8.1f} "
+                f"{percentile(values, 99) * 1000:>8.1f}"
+            )
+        print(f"{profile:<12} {'total':<12} {total / args.duration:>8.1f}\n")
+
+
+if __name__ == "__main__":
+    main()
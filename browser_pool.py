@@ -0,0 +1,160 @@
+# browser_pool.py
+# Pool de navegadores Chromium mantidos abertos entre os jobs do solver.
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from playwright.async_api import Browser, BrowserContext, Playwright
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledBrowser:
+    def __init__(self, browser: Browser):
+        self.browser = browser
+        self.active = 0  # contextos abertos agora
+        self.jobs = 0  # contextos já entregues desde o launch
+        self.crashed = False
+        browser.on("disconnected", self._on_disconnected)
+
+    def _on_disconnected(self, _browser) -> None:
+        self.crashed = True
+
+    @property
+    def alive(self) -> bool:
+        return not self.crashed and self.browser.is_connected()
+
+
+class BrowserPool:
+    """
+    Mantém `size` navegadores abertos e entrega um BrowserContext novo (sem
+    cookies nem storage de jobs anteriores) por job, com no máximo
+    `max_contexts` contextos simultâneos por navegador. Quem pede um
+    contexto com todos os navegadores cheios espera até um ser devolvido.
+
+    Cada navegador é reiniciado depois de `max_jobs` contextos (para a
+    memória não crescer sem limite) ou assim que cair; o reinício espera
+    os contextos ainda abertos nele terminarem.
+
+    `context_options` são passadas a todo new_context() (sobrepostas pelas
+    do chamador) e `on_context` roda em cada contexto novo antes de ele ser
+    entregue (ex.: ResourceBlocker.install).
+
+    Uso:
+        async with BrowserPool(playwright, size=2) as pool:
+            async with pool.context() as context:
+                page = await context.new_page()
+    """
+
+    def __init__(
+        self,
+        playwright: Playwright,
+        size: int = 1,
+        max_contexts: int = 4,
+        max_jobs: int = 50,
+        launch_options: Optional[Dict[str, Any]] = None,
+        context_options: Optional[Dict[str, Any]] = None,
+        on_context: Optional[Callable[[BrowserContext], Awaitable[None]]] = None,
+    ):
+        self.playwright = playwright
+        self.size = size
+        self.max_contexts = max_contexts
+        self.max_jobs = max_jobs
+        self.launch_options = launch_options or {}
+        self.context_options = context_options or {}
+        self.on_context = on_context
+        self._slots: List[_PooledBrowser] = []
+        self._changed = asyncio.Condition()
+
+    async def __aenter__(self) -> "BrowserPool":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        while len(self._slots) < self.size:
+            self._slots.append(await self._launch())
+
+    async def close(self) -> None:
+        for slot in self._slots:
+            await self._close_browser(slot)
+        self._slots = []
+
+    @asynccontextmanager
+    async def context(self, **options: Any) -> AsyncIterator[BrowserContext]:
+        """Abre um contexto novo no navegador menos ocupado e o fecha no fim."""
+        slot = await self._acquire()
+        try:
+            context = await slot.browser.new_context(
+                **{**self.context_options, **options}
+            )
+        except Exception:
+            await self._release(slot)
+            raise
+        if self.on_context is not None:
+            try:
+                await self.on_context(context)
+            except Exception:
+                await context.close()
+                await self._release(slot)
+                raise
+        try:
+            yield context
+        finally:
+            try:
+                await context.close()
+            except Exception:
+                # navegador caiu no meio do job: o contexto já era
+                logger.debug("falha ao fechar o contexto", exc_info=True)
+            await self._release(slot)
+
+    async def _launch(self) -> _PooledBrowser:
+        browser = await self.playwright.chromium.launch(**self.launch_options)
+        return _PooledBrowser(browser)
+
+    async def _close_browser(self, slot: _PooledBrowser) -> None:
+        try:
+            await slot.browser.close()
+        except Exception:
+            logger.debug("falha ao fechar o navegador", exc_info=True)
+
+    async def _replace(self, slot: _PooledBrowser) -> None:
+        index = self._slots.index(slot)
+        await self._close_browser(slot)
+        self._slots[index] = await self._launch()
+
+    async def _acquire(self) -> _PooledBrowser:
+        async with self._changed:
+            while True:
+                for slot in list(self._slots):
+                    if not slot.alive and slot.active == 0:
+                        logger.warning("navegador caiu; reiniciando")
+                        await self._replace(slot)
+                available = [
+                    slot
+                    for slot in self._slots
+                    if slot.alive
+                    and slot.active < self.max_contexts
+                    and slot.jobs < self.max_jobs
+                ]
+                if available:
+                    slot = min(available, key=lambda s: s.active)
+                    slot.active += 1
+                    slot.jobs += 1
+                    return slot
+                await self._changed.wait()
+
+    async def _release(self, slot: _PooledBrowser) -> None:
+        async with self._changed:
+            slot.active -= 1
+            if slot.active == 0 and slot in self._slots:
+                if not slot.alive:
+                    logger.warning("navegador caiu; reiniciando")
+                    await self._replace(slot)
+                elif slot.jobs >= self.max_jobs:
+                    logger.info("navegador atingiu %d jobs; reiniciando", slot.jobs)
+                    await self._replace(slot)
+            self._changed.notify_all()
@@ -0,0 +1,110 @@
+# browser_profile.py
+# Perfil enxuto do Chromium para o solver: headless, sem recursos supérfluos.
+import logging
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+from playwright.async_api import BrowserContext, Route
+
+logger = logging.getLogger(__name__)
+
+# Flags que desligam o que uma consulta não usa (GPU, sync, extensões,
+# atualizações de componentes, tradução...) e economizam memória por página
+LEAN_ARGS = [
+    "--disable-gpu",
+    "--disable-dev-shm-usage",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-background-timer-throttling",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-features=Translate,MediaRouter,OptimizationHints,BackForwardCache",
+    "--metrics-recording-only",
+    "--mute-audio",
+    "--no-first-run",
+    "--blink-settings=imagesEnabled=false",
+]
+
+# A tabela e o formulário não dependem disso para funcionar
+BLOCKED_RESOURCE_TYPES = ("image", "media", "font", "texttrack", "ping", "manifest")
+
+# Hosts que a consulta precisa: o próprio TSE e o hCaptcha (o token é
+# injetado, mas o script do widget precisa carregar)
+ALLOWED_HOSTS = ("tse.jus.br", "hcaptcha.com")
+
+
+def lean_launch_options(headless: bool = True) -> Dict[str, Any]:
+    return {"headless": headless, "args": list(LEAN_ARGS)}
+
+
+def lean_context_options() -> Dict[str, Any]:
+    """Opções de new_context() do perfil enxuto."""
+    return {
+        "viewport": {"width": 1280, "height": 800},
+        "device_scale_factor": 1,
+        "service_workers": "block",
+        "reduced_motion": "reduce",
+    }
+
+
+def host_allowed(host: str, allowed: Iterable[str]) -> bool:
+    return any(host == a or host.endswith("." + a) for a in allowed)
+
+
+class ResourceBlocker:
+    """
+    Aborta, em cada contexto em que for instalado, as requisições dos tipos
+    de `blocked_types` e as de hosts fora de `allowed_hosts` (analytics,
+    fontes e CDNs de terceiros). Conta o que bloqueou e o que deixou passar.
+
+        blocker = ResourceBlocker(extra_hosts=[urlparse(URL).hostname])
+        BrowserPool(..., on_context=blocker.install)
+    """
+
+    def __init__(
+        self,
+        allowed_hosts: Iterable[str] = ALLOWED_HOSTS,
+        blocked_types: Iterable[str] = BLOCKED_RESOURCE_TYPES,
+        extra_hosts: Iterable[Optional[str]] = (),
+    ):
+        self.allowed_hosts = tuple(allowed_hosts) + tuple(h for h in extra_hosts if h)
+        self.blocked_types = frozenset(blocked_types)
+        self.blocked = 0
+        self.allowed = 0
+
+    async def install(self, context: BrowserContext) -> None:
+        await context.route("**/*", self._handle)
+
+    async def _handle(self, route: Route) -> None:
+        request = route.request
+        host = urlparse(request.url).hostname or ""
+        if request.resource_type in self.blocked_types or not host_allowed(
+            host, self.allowed_hosts
+        ):
+            self.blocked += 1
+            await route.abort("blockedbyclient")
+            return
+        self.allowed += 1
+        await route.continue_()
+
+
+async def context_memory(context: BrowserContext) -> Dict[str, float]:
+    """
+    Heap JS (em MB) das páginas abertas no contexto, lido via CDP
+    (Runtime.getHeapUsage); só funciona no Chromium.
+    """
+    used = total = 0.0
+    for page in context.pages:
+        session = await context.new_cdp_session(page)
+        try:
+            heap = await session.send("Runtime.getHeapUsage")
+        finally:
+            await session.detach()
+        used += heap["usedSize"]
+        total += heap["totalSize"]
+    return {
+        "pages": len(context.pages),
+        "js_heap_used_mb": used / 2**20,
+        "js_heap_total_mb": total / 2**20,
+    }
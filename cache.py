@@ -0,0 +1,59 @@
+# cache.py
+# Cache em memória com expiração por idade e limite de tamanho (LRU).
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Mapa com no máximo `max_size` entradas que expiram `ttl` segundos depois
+    de gravadas. Ao estourar o tamanho, descarta a entrada usada há mais tempo.
+    Seguro para uso a partir de várias threads.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, max_age: Optional[float] = None) -> Optional[Any]:
+        """Retorna o valor se ele tiver no máximo `max_age` (padrão: ttl) segundos."""
+        max_age = self.ttl if max_age is None else min(max_age, self.ttl)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            age = time.monotonic() - stored_at
+            if age > self.ttl:
+                del self._data[key]
+                return None
+            if age > max_age:
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any, age: float = 0.0) -> None:
+        """Grava o valor; `age` indica há quantos segundos ele foi produzido."""
+        if self.max_size <= 0 or age > self.ttl:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() - age, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
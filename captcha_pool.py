@@ -0,0 +1,210 @@
+# captcha_pool.py
+# Pool de tokens do hCaptcha resolvidos antecipadamente, em segundo plano.
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, NamedTuple, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class SolvedToken(NamedTuple):
+    code: str
+    useragent: Optional[str]
+    solved_at: float  # time.monotonic() de quando o provedor devolveu o token
+    solve_seconds: float  # quanto o provedor demorou
+
+    def age(self, now: Optional[float] = None) -> float:
+        return (time.monotonic() if now is None else now) - self.solved_at
+
+
+class CaptchaUnavailable(Exception):
+    """Nenhum token a tempo: o provedor está falhando ou lento demais."""
+
+
+class CaptchaPool:
+    """
+    Mantém alguns tokens já resolvidos para o mesmo sitekey/URL, para que a
+    resolução (10-40s no provedor) saia do caminho crítico de cada job.
+
+    - `solve` é o cliente do provedor: uma função bloqueante sem argumentos
+      que devolve {"code": ..., "useragent": ...}. Roda em thread; em
+      testes, basta passar uma função falsa.
+    - Um token vale `ttl` segundos após resolvido; `take()` descarta os que
+      tenham menos de `margin` segundos de vida restante.
+    - O tamanho alvo (tokens prontos + em resolução) segue o consumo
+      observado: taxa de consumo x tempo médio de resolução, entre
+      `min_size` e `max_size`, e nunca mais tokens prontos do que dá para
+      usar antes de vencerem.
+    - Depois de `max_failures` falhas seguidas do provedor, `take()` levanta
+      CaptchaUnavailable em vez de esperar (o job falha e volta para a
+      fila); o produtor continua tentando e a primeira resolução bem-sucedida
+      zera a contagem.
+
+    Uso:
+        async with CaptchaPool(solve) as pool:
+            token = await pool.take()
+    """
+
+    def __init__(
+        self,
+        solve: Callable[[], Dict[str, Any]],
+        min_size: int = 1,
+        max_size: int = 8,
+        ttl: float = 120.0,
+        margin: float = 20.0,
+        rate_window: float = 300.0,
+        retry_seconds: float = 5.0,
+        max_failures: int = 5,
+    ):
+        self.solve = solve
+        self.min_size = min_size
+        self.max_size = max_size
+        self.ttl = ttl
+        self.margin = margin
+        self.rate_window = rate_window
+        self.retry_seconds = retry_seconds
+        self.max_failures = max_failures
+        self._ready: Deque[SolvedToken] = deque()
+        self._solving: Set[asyncio.Task] = set()
+        self._takes: Deque[float] = deque()  # instantes dos últimos take()
+        self._solve_seconds: Optional[float] = None  # média móvel (EWMA)
+        self._changed = asyncio.Condition()
+        self._started_at = time.monotonic()
+        self._producer: Optional[asyncio.Task] = None
+        self._closing = False
+        self.expired = 0  # tokens descartados sem uso
+        self.failures = 0  # falhas seguidas do provedor
+        self._last_error: Optional[BaseException] = None
+
+    async def __aenter__(self) -> "CaptchaPool":
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    def start(self) -> None:
+        if self._producer is None:
+            self._closing = False
+            self._started_at = time.monotonic()
+            self._producer = asyncio.create_task(self._produce())
+
+    async def close(self) -> None:
+        if self._producer is not None:
+            # o produtor sai do laço sozinho: cancelá-lo dentro do
+            # wait_for(Condition.wait()) pode perder o cancelamento
+            async with self._changed:
+                self._closing = True
+                self._changed.notify_all()
+            await self._producer
+            self._producer = None
+        tasks = list(self._solving)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def take(self, timeout: Optional[float] = None) -> SolvedToken:
+        """
+        Entrega o token pronto mais antigo ainda válido; espera se não houver.
+        Levanta CaptchaUnavailable se nenhum chegar em `timeout` segundos ou
+        se o provedor já falhou `max_failures` vezes seguidas.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        async with self._changed:
+            self._takes.append(time.monotonic())
+            self._changed.notify_all()  # o produtor recalcula o alvo
+            while True:
+                self._discard_expired()
+                if self._ready:
+                    return self._ready.popleft()
+                if self.failures >= self.max_failures:
+                    raise CaptchaUnavailable(
+                        f"provedor do captcha falhou {self.failures} vezes "
+                        f"seguidas: {self._last_error}"
+                    )
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise CaptchaUnavailable(f"nenhum token em {timeout:.0f}s")
+                try:
+                    await asyncio.wait_for(self._changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass  # confere de novo e levanta acima
+
+    # ---- métricas do consumo ----
+    def consumption_rate(self) -> float:
+        """Tokens consumidos por segundo na janela recente."""
+        now = time.monotonic()
+        while self._takes and now - self._takes[0] > self.rate_window:
+            self._takes.popleft()
+        window = min(self.rate_window, max(now - self._started_at, 1.0))
+        return len(self._takes) / window
+
+    def target_size(self) -> int:
+        solve_seconds = self._solve_seconds or 30.0
+        rate = self.consumption_rate()
+        # tokens em resolução ou prontos para cobrir o consumo enquanto o
+        # provedor trabalha (lei de Little), com uma folga de um token
+        wanted = math.ceil(rate * solve_seconds) + 1
+        # mais do que isso venceria na prateleira antes de ser usado
+        usable = math.floor(rate * (self.ttl - self.margin)) + 1
+        return max(self.min_size, min(wanted, usable, self.max_size))
+
+    @property
+    def ready(self) -> int:
+        return len(self._ready)
+
+    @property
+    def solving(self) -> int:
+        return len(self._solving)
+
+    # ---- produção ----
+    def _discard_expired(self) -> None:
+        now = time.monotonic()
+        while self._ready and self._ready[0].age(now) > self.ttl - self.margin:
+            self._ready.popleft()
+            self.expired += 1
+
+    async def _produce(self) -> None:
+        while not self._closing:
+            async with self._changed:
+                self._discard_expired()
+                missing = self.target_size() - len(self._ready) - len(self._solving)
+                for _ in range(max(missing, 0)):
+                    task = asyncio.create_task(self._solve_one())
+                    self._solving.add(task)
+                    task.add_done_callback(self._solving.discard)
+                # acorda a cada segundo para descartar tokens vencendo
+                try:
+                    await asyncio.wait_for(self._changed.wait(), 1.0)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _solve_one(self) -> None:
+        started = time.monotonic()
+        try:
+            result = await asyncio.to_thread(self.solve)
+        except Exception as exc:
+            logger.exception("captcha: provedor falhou")
+            async with self._changed:
+                self.failures += 1
+                self._last_error = exc
+                self._changed.notify_all()  # take() confere o limite de falhas
+            # segura a vaga por um tempo para não martelar o provedor
+            await asyncio.sleep(self.retry_seconds)
+            return
+        solved_at = time.monotonic()
+        elapsed = solved_at - started
+        token = SolvedToken(result["code"], result.get("useragent"), solved_at, elapsed)
+        async with self._changed:
+            if self._solve_seconds is None:
+                self._solve_seconds = elapsed
+            else:
+                self._solve_seconds = 0.8 * self._solve_seconds + 0.2 * elapsed
+            self.failures = 0
+            self._ready.append(token)
+            self._changed.notify_all()
@@ -1,13 +1,19 @@
 // service_worker.js (Manifest V3)
-// Polls /next every 30s. When a job arrives, injects runFlowV3 into the active tab,
+// Long-polls /next (the alarm only restarts the loop if the worker was suspended).
+// When a job arrives, injects runFlowV3 into the active tab,
 // fills the search input, clicks the search button, waits for results, paginates, collects the table,
-// and POSTs { content: { headers, rows } } to /finish/<JOB_ID>.
+// and POSTs { content: { headers, rows }, timings } to /finish/<JOB_ID>.
+// `timings` are per-stage marks used by /jobs/<JOB_ID>/timings and /timings/stats.
 
 let running = false;
 
 // === CONFIG ===
 const BASE_URL = "http://localhost:8000";
-const POLL_INTERVAL_SEC = 30;
+const POLL_INTERVAL_SEC = 30;  // alarm that (re)starts the long-poll loop
+const LONG_POLL_SEC = 25;       // /next?wait=... (server holds the request until a job arrives)
+const LEASE_SEC = 300;          // lease requested on /next (job returns to pending if we die)
+const HEARTBEAT_SEC = 60;       // lease renewal interval while a job is running
+const WORKER_ID = `extension-${crypto.randomUUID()}`;
 
 // ---- Title filter ----
 // Will only run when the active tab's title matches one of these patterns (case-insensitive, includes).
@@ -30,6 +36,10 @@ async function runFlowV3(value) {
   const isVisible = (el) => { if (!el) return false; const s = getComputedStyle(el); if (s.visibility === "hidden" || s.display === "none" || +s.opacity === 0) return false; const r = el.getBoundingClientRect(); return r.width > 1 && r.height > 1; };
   const safeClick = (el) => { try { el.scrollIntoView({ behavior: "auto", block: "center" }); } catch {} try { el.focus({ preventScroll: true }); } catch {}; el.click(); };
 
+  // --- Stage marks (each stage ends at its mark and starts at the previous one) ---
+  const timings = [];
+  const mark = (stage) => timings.push({ stage, at: new Date().toISOString() });
+
   // --- Table helpers ---
   const rowsSelector = "table tbody tr, .mat-mdc-table .mat-mdc-row, .mat-table .mat-row";
   const waitForRows = async (min = 1, timeout = 30000) => {
@@ -240,6 +250,7 @@ async function runFlowV3(value) {
       safeClick(btn);
       await wait(500);
     }
+    mark("search_submitted");
     const ok = await waitForRows(1, 20000);
     return ok > 0;
   };
@@ -247,6 +258,7 @@ async function runFlowV3(value) {
   try {
     await fillAndSearch(value);
     await waitForRows(1, 30000);
+    mark("first_rows");
 
     let matSelect = document.querySelector("mat-select, .mat-mdc-select, .mat-select");
     if (matSelect) {
@@ -273,6 +285,7 @@ async function runFlowV3(value) {
 
     let aggregate = { headers: [], rows: [] };
     let first = await collectTableFromCard();
+    mark("page_collected");
     if (first?.headers?.length) aggregate.headers = first.headers;
     if (first?.rows?.length) aggregate.rows.push(...first.rows);
 
@@ -286,6 +299,7 @@ async function runFlowV3(value) {
         const moved = await clickNext(pag);
         if (!moved) break;
         const pageData = await collectTableFromCard();
+        mark("page_collected");
         if (pageData?.rows?.length) aggregate.rows.push(...pageData.rows);
         const snapEl = document.querySelector(".mat-mdc-table, .mat-table");
         const snap = snapEl ? snapEl.innerText.slice(0, 200) : "";
@@ -299,6 +313,7 @@ async function runFlowV3(value) {
     } else {
       await tryInfiniteScroll();
       const all = await collectTableFromCard();
+      mark("page_collected");
       if (all?.rows?.length) {
         aggregate.headers = aggregate.headers.length ? aggregate.headers : all.headers || [];
         aggregate.rows = all.rows;
@@ -306,33 +321,47 @@ async function runFlowV3(value) {
     }
 
     aggregate.rows = _uniqRows(aggregate.rows);
-    return aggregate;
+    return { ...aggregate, timings };
   } catch (err) {
-    return { headers: [], rows: [], error: String(err?.message || err) };
+    return { headers: [], rows: [], error: String(err?.message || err), timings };
   }
 }
 
 // ---- API calls ----
 async function apiNext() {
-  const resp = await fetch(`${BASE_URL}/next`, {
+  const qs = new URLSearchParams({
+    worker_id: WORKER_ID,
+    lease: String(LEASE_SEC),
+    wait: String(LONG_POLL_SEC)
+  });
+  const resp = await fetch(`${BASE_URL}/next?${qs}`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify({ trigger: "extension" })
   });
-  if (resp.status === 204) return null;
-  if (resp.status !== 200) return null;
+  if (resp.status === 204 || resp.status === 404) return null; // no job within the wait
+  if (resp.status !== 200) throw new Error(`/next failed: HTTP ${resp.status}`);
   try { return await resp.json(); } catch { return null; }
 }
 
-async function apiFinish(jobId, payload) {
+async function apiFinish(jobId, payload, timings = []) {
   const resp = await fetch(`${BASE_URL}/finish/${jobId}`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ content: payload })
+    body: JSON.stringify({ content: payload, worker_id: WORKER_ID, timings })
   });
   return resp.ok;
 }
 
+async function apiHeartbeat(jobId) {
+  const qs = new URLSearchParams({ worker_id: WORKER_ID, lease: String(LEASE_SEC) });
+  try {
+    await fetch(`${BASE_URL}/heartbeat/${jobId}?${qs}`, { method: "POST" });
+  } catch (e) {
+    console.warn("heartbeat error:", e);
+  }
+}
+
 // ---- Poll loop (alarms) ----
 chrome.runtime.onInstalled.addListener(() => {
   chrome.alarms.create("poll-next", { periodInMinutes: POLL_INTERVAL_SEC / 60 });
@@ -341,37 +370,31 @@ chrome.runtime.onStartup.addListener(() => {
   chrome.alarms.create("poll-next", { periodInMinutes: POLL_INTERVAL_SEC / 60 });
 });
 
-chrome.alarms.onAlarm.addListener(async (alarm) => {
-  if (alarm.name !== "poll-next") return;
-  if (running) return;
-  running = true;
-  try {
-    const job = await apiNext();
-    if (!job) return;
-
-    const jobId = job.jobid ?? job.id ?? job.jobId ?? job.uuid ?? job._id;
-    if (!jobId) return;
-
-    // === Active tab ===
-    const tabs = await chrome.tabs.query({ active: true, lastFocusedWindow: true });
-    const tab = tabs && tabs[0];
-    if (!tab?.id) return;
+// Active tab, only if it is the expected search page
+async function findTargetTab() {
+  const tabs = await chrome.tabs.query({ active: true, lastFocusedWindow: true });
+  const tab = tabs && tabs[0];
+  if (!tab?.id) return null;
 
-    // Get a reliable title (tab.title may be stale in SPAs)
-    let pageTitle = tab.title || "";
-    try {
-      const [res] = await chrome.scripting.executeScript({
-        target: { tabId: tab.id },
-        func: () => document.title
-      });
-      if (res && typeof res.result === "string") pageTitle = res.result;
-    } catch (_) {}
+  // Get a reliable title (tab.title may be stale in SPAs)
+  let pageTitle = tab.title || "";
+  try {
+    const [res] = await chrome.scripting.executeScript({
+      target: { tabId: tab.id },
+      func: () => document.title
+    });
+    if (res && typeof res.result === "string") pageTitle = res.result;
+  } catch (_) {}
 
-    // Enforce title filter
-    if (!titleMatchesAny(pageTitle)) {
-      return; // skip this cycle if not on the expected page
-    }
+  // Enforce title filter
+  return titleMatchesAny(pageTitle) ? tab : null;
+}
 
+async function processJob(tab, job) {
+  const jobId = job.jobid ?? job.id ?? job.jobId ?? job.uuid ?? job._id;
+  if (!jobId) return;
+  const heartbeat = setInterval(() => apiHeartbeat(jobId), HEARTBEAT_SEC * 1000);
+  try {
     const valor = job.valor ?? job.value ?? job.result ?? job.data ?? job.text ?? "";
     const inj = await chrome.scripting.executeScript({
       target: { tabId: tab.id },
@@ -383,7 +406,26 @@ chrome.alarms.onAlarm.addListener(async (alarm) => {
     if (!result || result.error) return;
 
     const payload = { headers: result.headers || [], rows: result.rows || [] };
-    await apiFinish(jobId, payload);
+    await apiFinish(jobId, payload, result.timings || []);
+  } finally {
+    clearInterval(heartbeat);
+  }
+}
+
+chrome.alarms.onAlarm.addListener(async (alarm) => {
+  if (alarm.name !== "poll-next") return;
+  if (running) return;
+  running = true;
+  try {
+    // Keep long-polling while the search page is open; an empty /next just
+    // means the server waited LONG_POLL_SEC without work, so ask again.
+    while (true) {
+      const tab = await findTargetTab();
+      if (!tab) break; // not on the expected page: wait for the next alarm
+      const job = await apiNext();
+      if (!job) continue;
+      await processJob(tab, job);
+    }
   } catch (e) {
     console.warn("poll-next error:", e);
   } finally {
@@ -0,0 +1,314 @@
+# direct_api.py
+# Consulta direta ao endpoint JSON da Consulta Pública Unificada, sem navegador.
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from documents import normalize_document
+
+DIRECT_BASE_URL = os.getenv(
+    "DIRECT_BASE_URL", "https://consultaunificadapje.tse.jus.br"
+)
+# o protótipo (archive/direct_access.py) chama .../processo/10/0: tamanho e página
+DIRECT_PAGE_PATH = os.getenv(
+    "DIRECT_PAGE_PATH", "/consulta-publica-unificada/processo/{size}/{page}"
+)
+# tamanhos de página tentados do maior para o menor; fica o primeiro aceito
+DIRECT_PAGE_SIZES = tuple(
+    int(size) for size in os.getenv("DIRECT_PAGE_SIZES", "100,50,20,10").split(",")
+)
+# páginas buscadas ao mesmo tempo por consulta, depois da primeira
+DIRECT_FAN_OUT = int(os.getenv("DIRECT_FAN_OUT", "4"))
+DIRECT_TIMEOUT_SECONDS = float(os.getenv("DIRECT_TIMEOUT_SECONDS", "30"))
+MAX_PAGES = 200
+
+# Cabeçalhos de navegador copiados do protótipo (o Angular envia os mesmos)
+DEFAULT_HEADERS = {
+    "accept": "application/json, text/plain, */*",
+    "accept-language": "pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7",
+    "content-type": "application/json",
+    "sec-ch-ua": '"Not;A=Brand";v="99", "Google Chrome";v="139", "Chromium";v="139"',
+    "sec-ch-ua-mobile": "?0",
+    "sec-ch-ua-platform": '"Windows"',
+    "sec-fetch-dest": "empty",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-site": "same-origin",
+    "Referer": "https://consultaunificadapje.tse.jus.br/",
+}
+
+# Colunas devolvidas em {headers, rows}, iguais às da tabela da página; cada
+# uma com os campos do JSON que podem preenchê-la (o primeiro presente vence)
+COLUMNS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("Número Processo", ("numeroProcesso", "numero", "numeroUnico")),
+    ("Instância", ("instancia", "grau")),
+    ("UF", ("uf", "siglaUf")),
+    ("Classe Judicial", ("classeJudicial", "classe")),
+    ("Assunto Principal", ("assuntoPrincipal", "assunto")),
+    (
+        "Data Último Movimento",
+        ("dataUltimoMovimento", "dataUltimaMovimentacao", "ultimoMovimento.data"),
+    ),
+    ("Partes", ("partes",)),
+]
+HEADERS = [name for name, _ in COLUMNS]
+
+# Onde a resposta paginada traz a lista de processos e o total
+_ITEM_KEYS = ("content", "processos", "items", "resultado", "data")
+_TOTAL_KEYS = ("totalElements", "total", "totalRegistros", "quantidade")
+
+
+class DirectApiError(Exception):
+    """O endpoint recusou a consulta (captcha inválido, cookies vencidos...)."""
+
+
+class TooManyResults(Exception):
+    """
+    O documento tem mais processos do que cabem em MAX_PAGES páginas: o job
+    falha em vez de terminar DONE (e ir para o cache) com a lista cortada.
+    """
+
+
+def _lookup(item: Dict[str, Any], path: str) -> Any:
+    value: Any = item
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, dict):
+        for key in ("descricao", "nome", "sigla", "valor"):
+            if value.get(key) is not None:
+                return str(value[key])
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, list):
+        return "; ".join(filter(None, (_cell(v) for v in value)))
+    return str(value)
+
+
+def to_row(item: Dict[str, Any]) -> List[str]:
+    row = []
+    for _, paths in COLUMNS:
+        value = next(
+            (v for v in (_lookup(item, p) for p in paths) if v is not None), None
+        )
+        row.append(_cell(value))
+    return row
+
+
+def row_key(row: List[str]) -> Tuple[str, ...]:
+    """Um processo aparece uma vez por instância: (Número Processo, Instância)."""
+    # sem número (campo não mapeado), só junta linhas idênticas
+    return (row[0], row[1]) if row[0] else tuple(row)
+
+
+def page_items(data: Any) -> List[Dict[str, Any]]:
+    if isinstance(data, list):
+        return data
+    for key in _ITEM_KEYS:
+        if isinstance(data.get(key), list):
+            return data[key]
+    return []
+
+
+def page_total(data: Any) -> Optional[int]:
+    """Total de processos informado pela resposta; None se ela não disser."""
+    if isinstance(data, dict):
+        for key in _TOTAL_KEYS:
+            if isinstance(data.get(key), int):
+                return data[key]
+    return None
+
+
+class DirectClient:
+    """
+    Cliente do endpoint JSON de consulta, com uma requests.Session de
+    conexões keep-alive reaproveitadas entre jobs (até `pool_size`
+    simultâneas, uma por slot do worker) e os cookies de um storage state
+    do Playwright.
+
+    Cada consulta manda o token do hCaptcha no cabeçalho `captcharesponse`
+    e devolve {"headers": [...], "rows": [...]}, o formato do /finish.
+
+    A primeira página diz o total; as demais são buscadas em paralelo, até
+    `fan_out` por consulta, no maior tamanho de `page_sizes` que o endpoint
+    aceitar (descoberto na primeira consulta e lembrado depois).
+    """
+
+    def __init__(
+        self,
+        base_url: str = DIRECT_BASE_URL,
+        page_path: str = DIRECT_PAGE_PATH,
+        page_sizes: Tuple[int, ...] = DIRECT_PAGE_SIZES,
+        fan_out: int = DIRECT_FAN_OUT,
+        pool_size: int = 10,
+        timeout: float = DIRECT_TIMEOUT_SECONDS,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.page_path = page_path
+        self.page_sizes = sorted(page_sizes, reverse=True)
+        self.page_size: Optional[int] = None  # tamanho aceito, após a 1ª consulta
+        self.fan_out = max(fan_out, 1)
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        # só repete erros de rede/gateway; 4xx volta direto para quem chamou
+        retry = Retry(
+            total=2,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=None,
+        )
+        # cada consulta em andamento usa até `fan_out` conexões
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size * self.fan_out,
+            max_retries=retry,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def load_storage_state(self, state: Any) -> int:
+        """
+        Carrega os cookies de um storage state do Playwright (dict ou caminho
+        de um arquivo como archive/state.json). Retorna quantos carregou.
+        """
+        if isinstance(state, (str, os.PathLike)):
+            with open(state, encoding="utf-8") as f:
+                state = json.load(f)
+        cookies = state.get("cookies", [])
+        for cookie in cookies:
+            expires = cookie.get("expires")
+            self.session.cookies.set(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie.get("domain", ""),
+                path=cookie.get("path", "/"),
+                secure=cookie.get("secure", False),
+                # -1 = cookie de sessão
+                expires=int(expires) if expires and expires > 0 else None,
+            )
+        return len(cookies)
+
+    def fetch_page(
+        self,
+        document: str,
+        token: str,
+        page: int = 0,
+        size: Optional[int] = None,
+        user_agent: Optional[str] = None,
+    ) -> Any:
+        """Uma página crua do endpoint (JSON decodificado)."""
+        path = self.page_path.format(
+            size=size or self.page_size or self.page_sizes[-1], page=page
+        )
+        headers = {"captcharesponse": token}
+        if user_agent:
+            headers["user-agent"] = user_agent
+        resp = self.session.post(
+            self.base_url + path,
+            json={
+                "partes.cpfCnpjParte": normalize_document(document),
+                "filtrarPorNovoProcesso": True,
+            },
+            headers=headers,
+            timeout=self.timeout,
+        )
+        if resp.status_code in (401, 403, 429):
+            raise DirectApiError(f"consulta recusada: HTTP {resp.status_code}")
+        resp.raise_for_status()
+        return resp.json()
+
+    def _first_page(
+        self, document: str, token: str, user_agent: Optional[str]
+    ) -> Tuple[Any, int]:
+        """Primeira página no maior tamanho aceito; devolve (dados, tamanho)."""
+        sizes = [self.page_size] if self.page_size else self.page_sizes
+        for size in sizes:
+            try:
+                data = self.fetch_page(document, token, 0, size, user_agent)
+            except requests.HTTPError as exc:
+                # 400/422: tamanho fora do limite do endpoint; tenta o próximo
+                if exc.response.status_code not in (400, 422) or size == sizes[-1]:
+                    raise
+                continue
+            items = page_items(data)
+            total = page_total(data)
+            # alguns backends cortam o tamanho pedido em silêncio
+            if total is not None and 0 < len(items) < min(size, total):
+                size = len(items)
+            self.page_size = size
+            return data, size
+        raise DirectApiError("nenhum tamanho de página aceito")
+
+    def search(
+        self,
+        document: str,
+        token: str,
+        user_agent: Optional[str] = None,
+        on_page: Optional[Callable[[int], None]] = None,
+    ) -> Dict[str, Any]:
+        """Todas as páginas do documento, em {"headers": [...], "rows": [...]}."""
+        data, size = self._first_page(document, token, user_agent)
+        pages = [page_items(data)]
+        total = page_total(data)
+        if on_page is not None:
+            on_page(0)
+
+        def fetch(page: int) -> List[Dict[str, Any]]:
+            found = page_items(self.fetch_page(document, token, page, size, user_agent))
+            if on_page is not None:
+                on_page(page)
+            return found
+
+        if total is not None:
+            last = math.ceil(total / size)
+            if last > MAX_PAGES:
+                raise TooManyResults(
+                    f"{total} processos: mais de {MAX_PAGES} páginas de {size}"
+                )
+        elif not pages[0]:
+            last = 1
+        else:
+            # sem total (e sem como saber se o tamanho foi cortado): segue em
+            # lotes até uma página vazia
+            last = MAX_PAGES
+        complete = total is not None or not pages[0]
+        page = 1
+        with ThreadPoolExecutor(max_workers=self.fan_out) as executor:
+            while page < last:
+                # com total conhecido, tudo de uma vez (o executor limita a
+                # `fan_out` simultâneas); sem total, um lote por vez
+                step = last if total is not None else self.fan_out
+                batch = range(page, min(page + step, last))
+                found = list(executor.map(fetch, batch))
+                pages += found
+                page = batch.stop
+                if total is None and not all(found):
+                    complete = True
+                    break
+        if not complete:
+            raise TooManyResults(
+                f"{MAX_PAGES} páginas de {size} sem chegar ao fim da lista"
+            )
+
+        # páginas se sobrepõem se a lista mudar durante a consulta
+        rows: Dict[Tuple[str, ...], List[str]] = {}
+        for items in pages:
+            for item in items:
+                row = to_row(item)
+                rows.setdefault(row_key(row), row)
+        return {"headers": list(HEADERS), "rows": list(rows.values())}
@@ -0,0 +1,62 @@
+# documents.py
+# Normalização e validação de CPF/CNPJ antes de enfileirar uma consulta.
+import re
+
+_PUNCTUATION = re.compile(r"[\s./\-]")
+_CPF = re.compile(r"\d{11}")
+# CNPJ: 12 caracteres alfanuméricos (CNPJ alfanumérico) + 2 dígitos verificadores
+_CNPJ = re.compile(r"[0-9A-Z]{12}\d{2}")
+
+_CNPJ_WEIGHTS = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+
+
+def _cpf_digit(digits: str) -> int:
+    weight = len(digits) + 1
+    total = sum(int(d) * (weight - i) for i, d in enumerate(digits))
+    rest = total * 10 % 11
+    return 0 if rest == 10 else rest
+
+
+def is_valid_cpf(value: str) -> bool:
+    if not _CPF.fullmatch(value) or value == value[0] * 11:
+        return False
+    first = _cpf_digit(value[:9])
+    second = _cpf_digit(value[:9] + str(first))
+    return value[9:] == f"{first}{second}"
+
+
+def complete_cpf(base: int) -> str:
+    """CPF válido com os 9 primeiros dígitos `base` (seeds de testes e benchmarks)."""
+    digits = f"{base:09d}"
+    first = _cpf_digit(digits)
+    return f"{digits}{first}{_cpf_digit(digits + str(first))}"
+
+
+def _cnpj_digit(chars: str) -> int:
+    # no CNPJ alfanumérico cada caractere vale ord(c) - 48 (dígitos continuam iguais)
+    weights = _CNPJ_WEIGHTS[-len(chars) :]
+    total = sum((ord(c) - 48) * w for c, w in zip(chars, weights))
+    rest = total % 11
+    return 0 if rest < 2 else 11 - rest
+
+
+def is_valid_cnpj(value: str) -> bool:
+    if not _CNPJ.fullmatch(value) or value == value[0] * 14:
+        return False
+    first = _cnpj_digit(value[:12])
+    second = _cnpj_digit(value[:12] + str(first))
+    return value[12:] == f"{first}{second}"
+
+
+def normalize_document(value: str) -> str:
+    """
+    Remove pontuação (pontos, barra, hífen, espaços) e valida os dígitos
+    verificadores. Retorna o CPF (11 dígitos) ou CNPJ (14 caracteres) normalizado.
+    Levanta ValueError se o documento for inválido.
+    """
+    document = _PUNCTUATION.sub("", value or "").upper()
+    if len(document) == 11 and is_valid_cpf(document):
+        return document
+    if len(document) == 14 and is_valid_cnpj(document):
+        return document
+    raise ValueError(f"invalid CPF/CNPJ: {value!r}")
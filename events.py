@@ -0,0 +1,119 @@
+# events.py
+# Notificações em memória (dentro do processo) usadas pela API de fila.
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+
+class WorkSignal:
+    """
+    Sinaliza que há trabalho novo na fila para quem está em long-poll no /next.
+
+    Uso:
+        waiter = signal.listen()      # antes de consultar o banco
+        ... consulta, não achou nada ...
+        await signal.wait(waiter, timeout)
+
+    Pegar o `waiter` antes da consulta evita perder uma notificação que chegue
+    entre a consulta vazia e o início da espera. `notify()` pode ser chamado de
+    qualquer thread, não só de dentro do event loop.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._event: Optional[asyncio.Event] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._event = asyncio.Event()
+
+    def listen(self) -> Optional[asyncio.Event]:
+        return self._event
+
+    def notify(self) -> None:
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._wake()
+            return
+        try:
+            loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            pass  # loop já encerrado
+
+    def _wake(self) -> None:
+        event, self._event = self._event, asyncio.Event()
+        if event is not None:
+            event.set()
+
+    async def wait(self, waiter: Optional[asyncio.Event], timeout: float) -> bool:
+        """Espera até `timeout` segundos; retorna True se houve notificação."""
+        if waiter is None:
+            await asyncio.sleep(timeout)
+            return False
+        try:
+            await asyncio.wait_for(waiter.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class JobEventHub:
+    """
+    Pub/sub em memória de mudanças de estado de jobs.
+
+    Cada assinante recebe uma asyncio.Queue registrada para um ou mais ids;
+    `publish()` distribui o mesmo evento para todas as filas daquele id sem
+    nenhuma nova consulta ao banco. Assim como WorkSignal, `publish()` pode ser
+    chamado de qualquer thread.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def subscribe(self, job_ids: Iterable[str]) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        for job_id in job_ids:
+            self._subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, job_ids: Iterable[str], queue: asyncio.Queue) -> None:
+        for job_id in job_ids:
+            queues = self._subscribers.get(job_id)
+            if queues is None:
+                continue
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[job_id]
+
+    def subscribed(self) -> List[str]:
+        """Ids com pelo menos um assinante."""
+        return list(self._subscribers)
+
+    def publish(self, job_id: str, event: Dict[str, Any]) -> None:
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._dispatch(job_id, event)
+            return
+        try:
+            loop.call_soon_threadsafe(self._dispatch, job_id, event)
+        except RuntimeError:
+            pass  # loop já encerrado
+
+    def _dispatch(self, job_id: str, event: Dict[str, Any]) -> None:
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait((job_id, event))
@@ -0,0 +1,197 @@
+# metrics.py
+# Métricas em memória no formato texto do Prometheus (sem dependências).
+import threading
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name}: esperava os labels {self.labels}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Contador monotônico, opcionalmente com labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """Valor que sobe e desce; pode ser corrigido com set()."""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Histograma cumulativo com buckets fixos, como o do Prometheus."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # labels -> (contagem por bucket, soma)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted((k, (list(c), s)) for k, (c, s) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(
+                    self.labels + ("le",), key + (_format_value(bound),)
+                )
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    """Conjunto de métricas expostas juntas em /metrics."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class LatencyMiddleware:
+    """
+    Middleware ASGI que registra a duração de cada requisição HTTP em um
+    Histogram com os labels method, route e status_code. `route` é o
+    caminho declarado na rota (ex.: /retrieve/{job_id}), não a URL recebida,
+    para não criar uma série por id.
+    """
+
+    def __init__(self, app, histogram: Histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # o roteador grava a rota escolhida no próprio scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.histogram.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=route,
+                status_code=str(status_code),
+            )
@@ -0,0 +1,84 @@
+# queue_client.py
+# Cliente HTTP da API de fila (app.py) usado pelos workers de scraping.
+import os
+import socket
+from typing import Any, Dict, Iterable, Optional
+
+import requests
+
+QUEUE_URL = os.getenv("QUEUE_URL", "http://localhost:8000")
+LEASE_SECONDS = int(os.getenv("WORKER_LEASE_SECONDS", "300"))
+LONG_POLL_SECONDS = float(os.getenv("WORKER_LONG_POLL_SECONDS", "25"))
+
+
+class QueueClient:
+    """
+    Reserva jobs em /next (com long-poll) e devolve o resultado em /finish
+    ou /fail, sempre identificado pelo mesmo worker_id. Reaproveita a conexão
+    HTTP entre as chamadas (requests.Session).
+    """
+
+    def __init__(
+        self,
+        base_url: str = QUEUE_URL,
+        worker_id: Optional[str] = None,
+        lease: int = LEASE_SECONDS,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.worker_id = worker_id or f"solver-{socket.gethostname()}-{os.getpid()}"
+        self.lease = lease
+        self.session = requests.Session()
+
+    def close(self) -> None:
+        self.session.close()
+
+    def next(self, wait: float = LONG_POLL_SECONDS) -> Optional[Dict[str, Any]]:
+        """Reserva o job pendente mais antigo; None se a fila ficou vazia."""
+        resp = self.session.post(
+            f"{self.base_url}/next",
+            params={"worker_id": self.worker_id, "lease": self.lease, "wait": wait},
+            timeout=wait + 10,
+        )
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+        return resp.json()
+
+    def heartbeat(self, job_id: str) -> bool:
+        resp = self.session.post(
+            f"{self.base_url}/heartbeat/{job_id}",
+            params={"worker_id": self.worker_id, "lease": self.lease},
+            timeout=10,
+        )
+        return resp.ok
+
+    def finish(
+        self,
+        job_id: str,
+        content: Dict[str, Any],
+        timings: Iterable[Dict[str, Any]] = (),
+    ) -> None:
+        resp = self.session.post(
+            f"{self.base_url}/finish/{job_id}",
+            json={
+                "content": content,
+                "worker_id": self.worker_id,
+                "timings": list(timings),
+            },
+            timeout=30,
+        )
+        resp.raise_for_status()
+
+    def fail(
+        self, job_id: str, error: str, timings: Iterable[Dict[str, Any]] = ()
+    ) -> None:
+        resp = self.session.post(
+            f"{self.base_url}/fail/{job_id}",
+            json={
+                "error": error,
+                "worker_id": self.worker_id,
+                "timings": list(timings),
+            },
+            timeout=30,
+        )
+        resp.raise_for_status()
@@ -1,18 +1,134 @@
-import json
-import sys
+import asyncio
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from urllib.parse import urlparse
 
-from playwright.sync_api import Playwright, sync_playwright, expect
+import requests
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
 from solvecaptcha import Solvecaptcha
 
 from dotenv import load_dotenv
 
+from browser_pool import BrowserPool
+from browser_profile import (
+    ResourceBlocker,
+    context_memory,
+    lean_context_options,
+    lean_launch_options,
+)
+from captcha_pool import CaptchaPool
+from direct_api import DirectClient
+from queue_client import QueueClient
+from storage_state import StatePool
 
 load_dotenv()
 
+# Worker: mantém navegadores abertos (BrowserPool) e processa até
+# SOLVER_CONCURRENCY jobs de /next ao mesmo tempo, um por página.
+# Com SOLVER_MODE=direct, consulta o endpoint JSON sem navegador (direct_api)
+MODE = os.getenv("SOLVER_MODE", "browser").lower()
+# storage state do Playwright com os cookies usados no modo direct (sem ele,
+# usa a identidade mais recente de SOLVER_STATE_DIR)
+STORAGE_STATE = os.getenv("SOLVER_STORAGE_STATE")
+CONCURRENCY = int(os.getenv("SOLVER_CONCURRENCY", "4"))
+# "lean": headless, sem imagens/fontes/terceiros (browser_profile); "full":
+# Chromium padrão, útil para depurar
+PROFILE = os.getenv("SOLVER_PROFILE", "lean").lower()
+# hosts liberados além do TSE e do hCaptcha no perfil lean, separados por vírgula
+EXTRA_HOSTS = [h for h in os.getenv("SOLVER_ALLOWED_HOSTS", "").split(",") if h]
+_HEADLESS_DEFAULT = "true" if PROFILE == "lean" else "false"
+HEADLESS = os.getenv("HEADLESS", _HEADLESS_DEFAULT).lower() in ("1", "true", "yes")
+BROWSERS = int(os.getenv("SOLVER_BROWSERS", "1"))
+CONTEXTS_PER_BROWSER = int(os.getenv("SOLVER_CONTEXTS_PER_BROWSER", "4"))
+JOBS_PER_BROWSER = int(os.getenv("SOLVER_JOBS_PER_BROWSER", "50"))
+ROWS_TIMEOUT_MS = 30_000
+MAX_PAGES = 200
+RETRY_SECONDS = 5  # espera antes de tentar a API de novo depois de um erro
 
-def set_iframe_attr(page, selector, attr, value=None, remove=False):
-    return page.evaluate(
+# Identidades (cookies do anti-bot) reaproveitadas entre jobs (StatePool)
+IDENTITIES = int(os.getenv("SOLVER_IDENTITIES", "4"))
+STATE_DIR = os.getenv("SOLVER_STATE_DIR", ".state")
+STATE_MAX_AGE = float(os.getenv("SOLVER_STATE_MAX_AGE_SECONDS", "1800"))
+STATE_REFRESH_MARGIN = float(os.getenv("SOLVER_STATE_REFRESH_MARGIN_SECONDS", "300"))
+
+# Tokens do hCaptcha resolvidos antes de serem necessários (CaptchaPool)
+CAPTCHA_POOL_MIN = int(os.getenv("CAPTCHA_POOL_MIN", "1"))
+CAPTCHA_POOL_MAX = int(os.getenv("CAPTCHA_POOL_MAX", str(CONCURRENCY * 2)))
+CAPTCHA_TOKEN_TTL = float(os.getenv("CAPTCHA_TOKEN_TTL_SECONDS", "120"))
+CAPTCHA_TOKEN_MARGIN = float(os.getenv("CAPTCHA_TOKEN_MARGIN_SECONDS", "20"))
+# quanto um job espera por um token antes de falhar (e voltar para a fila), e
+# quantas falhas seguidas do provedor fazem os jobs falharem sem esperar
+CAPTCHA_TAKE_TIMEOUT = float(os.getenv("CAPTCHA_TAKE_TIMEOUT_SECONDS", "180"))
+CAPTCHA_MAX_FAILURES = int(os.getenv("CAPTCHA_MAX_FAILURES", "5"))
+
+ROWS_SELECTOR = "table tbody tr, .mat-mdc-table .mat-mdc-row, .mat-table .mat-row"
+NEXT_BUTTON = (
+    "button.mat-mdc-paginator-navigation-next, button.mat-paginator-navigation-next"
+)
+
+logger = logging.getLogger("solver")
+
+# Extrai cabeçalhos e linhas da tabela de resultados (mat-table ou <table>)
+COLLECT_TABLE_JS = """
+() => {
+  const text = (el) => (el?.innerText ?? el?.textContent ?? "").replace(/\\s+/g, " ").trim();
+  const mat = document.querySelector(".mat-mdc-table, .mat-table");
+  if (mat) {
+    const headers = Array.from(
+      mat.querySelectorAll(".mat-mdc-header-cell, .mat-header-cell")
+    ).map(text);
+    const rows = Array.from(mat.querySelectorAll(".mat-mdc-row, .mat-row")).map(
+      (r) => Array.from(r.querySelectorAll(".mat-mdc-cell, .mat-cell")).map(text)
+    );
+    return { headers, rows };
+  }
+  const table = document.querySelector("table");
+  if (!table) return { headers: [], rows: [] };
+  const headers = Array.from(table.querySelectorAll("thead th")).map(text);
+  const rows = Array.from(table.querySelectorAll("tbody tr")).map(
+    (tr) => Array.from(tr.querySelectorAll("th,td")).map(text)
+  );
+  return { headers, rows };
+}
+"""
+
+# Grava o token do hCaptcha nos campos de resposta e ajusta o user agent
+INJECT_TOKEN_JS = """
+([token, useragent]) => {
+    Object.defineProperty(navigator, "userAgent", {
+      get: () => useragent
+    });
+
+    const elh = document.querySelector("textarea[name='h-captcha-response']");
+    if (!elh) return;
+    elh.value = token;
+    elh.setAttribute('value', token); // só para visualização
+    elh.dispatchEvent(new Event('input', { bubbles: true }));
+    elh.dispatchEvent(new Event('change', { bubbles: true }));
+
+    const elg = document.querySelector("textarea[name='g-recaptcha-response']");
+    if (!elg) return;
+    elg.value = token;
+    elg.setAttribute('value', token); // só para visualização
+    elg.dispatchEvent(new Event('input', { bubbles: true }));
+    elg.dispatchEvent(new Event('change', { bubbles: true }));
+}
+"""
+
+# Espera a primeira linha da tabela mudar depois de trocar de página
+ROWS_CHANGED_JS = """
+([selector, previous]) => {
+  const row = document.querySelector(selector);
+  return !!row && row.innerText !== previous;
+}
+"""
+
+
+async def set_iframe_attr(page, selector, attr, value=None, remove=False):
+    return await page.evaluate(
         """
       ([sel, attr, val, remove]) => {
         const el = document.querySelector(sel);
@@ -26,74 +142,278 @@ def set_iframe_attr(page, selector, attr, value=None, remove=False):
     )
 
 
-def run(cnpj: str) -> bool:
-    with sync_playwright() as playwright:
-        browser = playwright.chromium.launch(headless=False)
-        context = browser.new_context()
-        page = context.new_page()
-        page.goto(os.getenv("URL"))
+def now():
+    return datetime.now(timezone.utc)
+
+
+def mark(timings, stage, started_at=None):
+    """
+    Marca o fim de uma etapa no formato aceito por /finish e /fail. Sem
+    `started_at`, a etapa começa na marca anterior.
+    """
+    entry = {"stage": stage, "at": now().isoformat()}
+    if started_at is not None:
+        entry["started_at"] = started_at.isoformat()
+    timings.append(entry)
+
+
+def solve_captcha(solver: Solvecaptcha) -> dict:
+    """Chamada bloqueante (10-40s no provedor); o CaptchaPool a roda em thread."""
+    return solver.hcaptcha(
+        sitekey=os.getenv("SITEKEY"),
+        url=os.getenv("URLCAPTCHA"),
+        # userAgent=os.getenv("USERAGENT"),
+        domain="js.hcaptcha.com",
+        invisible=1,
+    )
+
+
+async def _next_page_available(button) -> bool:
+    if await button.count() == 0:
+        return False
+    return not (
+        await button.is_disabled()
+        or await button.get_attribute("aria-disabled") == "true"
+    )
+
+
+async def collect_table(page, timings) -> dict:
+    """Lê a tabela de resultados, seguindo o paginador até a última página."""
+    try:
+        await page.wait_for_selector(ROWS_SELECTOR, timeout=ROWS_TIMEOUT_MS)
+    except PlaywrightTimeout:
+        # nenhum processo encontrado para o documento
+        mark(timings, "first_rows")
+        return {"headers": [], "rows": []}
+    mark(timings, "first_rows")
+
+    table = await page.evaluate(COLLECT_TABLE_JS)
+    mark(timings, "page_collected")
+    headers, rows = table["headers"], table["rows"]
+
+    next_button = page.locator(NEXT_BUTTON).first
+    for _ in range(MAX_PAGES):
+        if not await _next_page_available(next_button):
+            break
+        first_row = await page.locator(ROWS_SELECTOR).first.inner_text()
+        await next_button.click()
+        await page.wait_for_function(
+            ROWS_CHANGED_JS, arg=[ROWS_SELECTOR, first_row], timeout=ROWS_TIMEOUT_MS
+        )
+        rows += (await page.evaluate(COLLECT_TABLE_JS))["rows"]
+        mark(timings, "page_collected")
+
+    unique = list(dict.fromkeys(tuple(row) for row in rows))
+    return {"headers": headers, "rows": [list(row) for row in unique]}
+
+
+async def run(context, cnpj: str, captchas: CaptchaPool, timings: list) -> dict:
+    """
+    Faz uma consulta em um BrowserContext já aberto e retorna
+    {"headers": [...], "rows": [...]}. Levanta exceção se algo falhar.
+    O token do captcha sai do CaptchaPool na hora da pesquisa, já resolvido
+    em segundo plano enquanto a página carregava (ou antes disso).
+    """
+    page = await context.new_page()
+    await page.goto(os.getenv("URL"))
+    mark(timings, "page_load")
+
+    await page.get_by_role("textbox", name="CPF ou CNPJ").click()
+    await page.get_by_role("textbox", name="CPF ou CNPJ").fill(cnpj)
+
+    mark(timings, "captcha_request")
+    token = await captchas.take(timeout=CAPTCHA_TAKE_TIMEOUT)
+    # duração = espera por um token pronto (zero se o pool estava abastecido)
+    mark(timings, "captcha_solved")
+
+    logger.info("👉 Injetando script (token com %.0fs)...", token.age())
+    await page.evaluate(INJECT_TOKEN_JS, [token.code, token.useragent])
+    # await set_iframe_attr(page, "iframe", "data-hcaptcha-response", result["code"])
+
+    await page.get_by_role("button", name="Pesquisar Pesquisar").click()
+    mark(timings, "search_submitted")
+
+    return await collect_table(page, timings)
+
+
+async def browser_consult(
+    pool: BrowserPool,
+    states: StatePool,
+    captchas: CaptchaPool,
+    cnpj: str,
+    timings: list,
+) -> dict:
+    """
+    Consulta em um contexto novo do BrowserPool (run()), hidratado com uma
+    identidade já aquecida; grava o estado dela se a consulta der certo.
+    """
+    identity = await states.acquire()
+    try:
+        async with pool.context(**states.context_options(identity)) as context:
+            try:
+                content = await run(context, cnpj, captchas, timings)
+            except Exception:
+                states.discard(identity)
+                raise
+            await states.save(identity, context)
+            await log_memory(context)
+            return content
+    finally:
+        states.release(identity)
+
+
+async def log_memory(context) -> None:
+    """Registra o heap JS do contexto ao fim do job (via CDP)."""
+    try:
+        memory = await context_memory(context)
+    except Exception:
+        logger.debug("falha ao medir a memória do contexto", exc_info=True)
+        return
+    logger.info(
+        "contexto: %d página(s), heap JS %.1f MB (de %.1f MB)",
+        memory["pages"],
+        memory["js_heap_used_mb"],
+        memory["js_heap_total_mb"],
+    )
+
+
+async def warm_identity(pool: BrowserPool, state) -> dict:
+    """Carrega a página com o estado atual (ou nenhum) e devolve o estado novo."""
+    options = {"storage_state": state} if state else {}
+    async with pool.context(**options) as context:
+        page = await context.new_page()
+        await page.goto(os.getenv("URL"), wait_until="networkidle")
+        return await context.storage_state()
+
+
+async def direct_consult(
+    direct: DirectClient, captchas: CaptchaPool, cnpj: str, timings: list
+) -> dict:
+    """Mesma consulta de run(), direto no endpoint JSON, sem abrir página."""
+    mark(timings, "captcha_request")
+    token = await captchas.take(timeout=CAPTCHA_TAKE_TIMEOUT)
+    mark(timings, "captcha_solved")
+    return await asyncio.to_thread(
+        direct.search,
+        cnpj,
+        token.code,
+        user_agent=token.useragent,
+        on_page=lambda _page: mark(timings, "page_collected"),
+    )
+
 
-        page.get_by_role("textbox", name="CPF ou CNPJ").click()
-        page.get_by_role("textbox", name="CPF ou CNPJ").fill(cnpj)
+async def keep_leased(client: QueueClient, job_id: str) -> None:
+    """Renova o lease do job enquanto ele está sendo processado."""
+    while True:
+        await asyncio.sleep(client.lease / 3)
+        try:
+            await asyncio.to_thread(client.heartbeat, job_id)
+        except requests.RequestException:
+            logger.warning("heartbeat do job %s falhou", job_id)
 
-        ua = page.evaluate("() => navigator.userAgent")
 
-        api_key = os.getenv("API", "YOUR_API_KEY")
+async def process_job(consult, client: QueueClient, job) -> None:
+    """`consult(text, timings)` faz a consulta: browser_consult ou direct_consult."""
+    timings = []
+    heartbeat = asyncio.create_task(keep_leased(client, job["id"]))
+    try:
+        content = await consult(job["text"], timings)
+    except Exception as exc:
+        logger.exception("job %s falhou", job["id"])
+        error = str(exc) or exc.__class__.__name__
+        await asyncio.to_thread(client.fail, job["id"], error, timings)
+        return
+    finally:
+        heartbeat.cancel()
+    await asyncio.to_thread(client.finish, job["id"], content, timings)
+    logger.info("job %s: %d linhas", job["id"], len(content["rows"]))
 
-        solver = Solvecaptcha(api_key, extendedResponse=True)
 
+async def worker(consult, client: QueueClient):
+    """Um slot de concorrência: reserva um job, processa, repete."""
+    while True:
         try:
-            result = solver.hcaptcha(
-                sitekey=os.getenv("SITEKEY"),
-                url=os.getenv("URLCAPTCHA"),
-                # userAgent=os.getenv("USERAGENT"),
-                domain="js.hcaptcha.com",
-                invisible=1,
-            )
+            job = await asyncio.to_thread(client.next)
+            if job is not None:
+                await process_job(consult, client, job)
+        except requests.RequestException:
+            logger.exception("falha ao falar com a API de fila")
+            await asyncio.sleep(RETRY_SECONDS)
 
-            with open("result.json", "w") as f:
-                f.write(json.dumps(result))
 
-        except Exception as e:
-            return None
+async def serve(consult, client: QueueClient) -> None:
+    logger.info(
+        "worker %s aguardando jobs (%d simultâneos, modo %s)",
+        client.worker_id,
+        CONCURRENCY,
+        MODE,
+    )
+    await asyncio.gather(*(worker(consult, client) for _ in range(CONCURRENCY)))
+
 
+async def main():
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    # chamadas bloqueantes rodam em threads: long-poll do /next, /finish ou
+    # heartbeat e, no modo direct, a consulta HTTP por slot, mais uma por
+    # captcha em resolução
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=CONCURRENCY * 3 + CAPTCHA_POOL_MAX)
+    )
+    client = QueueClient()
+    solver = Solvecaptcha(os.getenv("API", "YOUR_API_KEY"), extendedResponse=True)
+    captchas = CaptchaPool(
+        partial(solve_captcha, solver),
+        min_size=CAPTCHA_POOL_MIN,
+        max_size=CAPTCHA_POOL_MAX,
+        ttl=CAPTCHA_TOKEN_TTL,
+        margin=CAPTCHA_TOKEN_MARGIN,
+        max_failures=CAPTCHA_MAX_FAILURES,
+    )
+    if MODE == "direct":
+        direct = DirectClient(pool_size=CONCURRENCY)
+        if STORAGE_STATE:
+            direct.load_storage_state(STORAGE_STATE)
         else:
-            print("👉 Injetando script...")
-            results = page.evaluate(
-                """([token, useragent]) => {
-                    Object.defineProperty(navigator, "userAgent", {
-                      get: () => useragent
-                    });
-
-                    const elh = document.querySelector("textarea[name='h-captcha-response']");
-                    if (!elh) return;
-                    elh.value = token;
-                    elh.setAttribute('value', token); // só para visualização
-                    elh.dispatchEvent(new Event('input', { bubbles: true }));
-                    elh.dispatchEvent(new Event('change', { bubbles: true }));
-                    
-                    const elg = document.querySelector("textarea[name='g-recaptcha-response']");
-                    if (!elg) return;
-                    elg.value = token;
-                    elg.setAttribute('value', token); // só para visualização
-                    elg.dispatchEvent(new Event('input', { bubbles: true }));
-                    elg.dispatchEvent(new Event('change', { bubbles: true }));
-                }""",
-                [result["code"], result["useragent"]],
-            )
-
-            # set_iframe_attr(page, "iframe", "data-hcaptcha-response", result["code"])
-
-        page.get_by_role("button", name="Pesquisar Pesquisar").click()
-
-        input("👉 Pressione ENTER para continuar...")
-
-        # ---------------------
-        context.close()
-        browser.close()
-        return {"status": "success"}
+            async with StatePool(
+                IDENTITIES, STATE_DIR, max_age=STATE_MAX_AGE
+            ) as states:
+                options = states.context_options(await states.acquire())
+                if options:
+                    direct.load_storage_state(options["storage_state"])
+        async with captchas:
+            try:
+                await serve(partial(direct_consult, direct, captchas), client)
+            finally:
+                direct.close()
+        return
+
+    profile = {"launch_options": {"headless": HEADLESS}}
+    if PROFILE == "lean":
+        blocker = ResourceBlocker(
+            extra_hosts=[urlparse(os.getenv("URL", "")).hostname, *EXTRA_HOSTS]
+        )
+        profile = {
+            "launch_options": lean_launch_options(HEADLESS),
+            "context_options": lean_context_options(),
+            "on_context": blocker.install,
+        }
+    async with captchas, async_playwright() as playwright, BrowserPool(
+        playwright,
+        size=BROWSERS,
+        max_contexts=CONTEXTS_PER_BROWSER,
+        max_jobs=JOBS_PER_BROWSER,
+        **profile,
+    ) as pool, StatePool(
+        IDENTITIES,
+        STATE_DIR,
+        refresh=partial(warm_identity, pool),
+        max_age=STATE_MAX_AGE,
+        margin=STATE_REFRESH_MARGIN,
+    ) as states:
+        await serve(partial(browser_consult, pool, states, captchas), client)
 
 
 if __name__ == "__main__":
-    cnpj = sys.argv[1] if len(sys.argv) > 1 else "000.000.000-00"
-    run(cnpj)
+    asyncio.run(main())
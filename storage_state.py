@@ -0,0 +1,189 @@
+# storage_state.py
+# Identidades (storage state do Playwright) reaproveitadas entre os jobs do solver.
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+State = Dict[str, Any]  # formato de BrowserContext.storage_state()
+
+
+def cookies_expire_at(state: Optional[State]) -> Optional[float]:
+    """Menor `expires` (epoch) entre os cookies com validade; None se não houver."""
+    if not state:
+        return None
+    expires = [
+        cookie["expires"]
+        for cookie in state.get("cookies", [])
+        if cookie.get("expires", -1) > 0  # -1 = cookie de sessão
+    ]
+    return min(expires) if expires else None
+
+
+class Identity:
+    """Uma sessão independente: cookies anti-bot e storage de uma origem."""
+
+    def __init__(self, name: str, path: Optional[str] = None):
+        self.name = name
+        self.path = path
+        self.state: Optional[State] = None
+        self.saved_at = 0.0  # time.time() da última gravação
+        self.in_use = 0
+        self.jobs = 0
+
+    def expires_at(self, max_age: float) -> Optional[float]:
+        """Quando o estado deixa de servir: o 1º cookie a vencer ou `max_age`."""
+        if self.state is None:
+            return None
+        limit = self.saved_at + max_age
+        cookies = cookies_expire_at(self.state)
+        return limit if cookies is None else min(limit, cookies)
+
+    def valid(self, max_age: float, margin: float = 0.0) -> bool:
+        expires = self.expires_at(max_age)
+        return expires is not None and expires - time.time() > margin
+
+
+class StatePool:
+    """
+    Guarda `size` identidades (storage state do Playwright), gravadas em
+    `directory` para sobreviver a reinícios do worker, e entrega uma por
+    job para hidratar o BrowserContext novo:
+
+        identity = await states.acquire()
+        async with pool.context(**states.context_options(identity)) as ctx:
+            ...  # consulta
+            await states.save(identity, ctx)  # só depois de uma consulta ok
+        states.release(identity)
+
+    Um estado vale até o primeiro cookie com validade vencer ou até
+    `max_age` segundos depois de gravado (os cookies TS*/TSPD_* do
+    anti-bot são de sessão, sem `expires`). Com `refresh`, uma tarefa em
+    segundo plano renova as identidades `margin` segundos antes de
+    vencerem, e aquece as que ainda não têm estado: `refresh(state)` abre
+    um contexto com esse estado (ou None), carrega a página e devolve o
+    estado novo.
+    """
+
+    def __init__(
+        self,
+        size: int = 4,
+        directory: Optional[str] = None,
+        refresh: Optional[Callable[[Optional[State]], Awaitable[State]]] = None,
+        max_age: float = 1800.0,
+        margin: float = 300.0,
+        interval: float = 30.0,
+    ):
+        self.directory = directory
+        self.refresh = refresh
+        self.max_age = max_age
+        self.margin = margin
+        self.interval = interval
+        self.identities: List[Identity] = [
+            Identity(
+                f"identity-{i}",
+                os.path.join(directory, f"identity-{i}.json") if directory else None,
+            )
+            for i in range(size)
+        ]
+        self._refresher: Optional[asyncio.Task] = None
+        self.refreshed = 0
+        self.discarded = 0
+
+    async def __aenter__(self) -> "StatePool":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            await asyncio.to_thread(self._load_all)
+        if self.refresh is not None and self._refresher is None:
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def close(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+
+    # ---- uso pelos jobs ----
+    async def acquire(self) -> Identity:
+        """
+        A identidade válida menos ocupada; se nenhuma estiver válida, a menos
+        ocupada mesmo assim (o job aquece o contexto e a grava no fim).
+        """
+        valid = [i for i in self.identities if i.valid(self.max_age)]
+        identity = min(valid or self.identities, key=lambda i: (i.in_use, i.jobs))
+        identity.in_use += 1
+        identity.jobs += 1
+        return identity
+
+    def release(self, identity: Identity) -> None:
+        identity.in_use -= 1
+
+    def context_options(self, identity: Identity) -> Dict[str, Any]:
+        """Argumentos para new_context(): o estado, se ainda estiver válido."""
+        if identity.valid(self.max_age):
+            return {"storage_state": identity.state}
+        return {}
+
+    async def save(self, identity: Identity, context) -> None:
+        """Grava o estado do contexto depois de uma consulta bem-sucedida."""
+        await self._store(identity, await context.storage_state())
+
+    def discard(self, identity: Identity) -> None:
+        """Esquece o estado (ex.: o job falhou, talvez barrado pelo anti-bot)."""
+        if identity.state is not None:
+            identity.state = None
+            self.discarded += 1
+            if identity.path and os.path.exists(identity.path):
+                os.remove(identity.path)
+
+    # ---- persistência ----
+    def _load_all(self) -> None:
+        for identity in self.identities:
+            if not identity.path or not os.path.exists(identity.path):
+                continue
+            try:
+                with open(identity.path, encoding="utf-8") as f:
+                    identity.state = json.load(f)
+            except (OSError, ValueError):
+                logger.warning("estado ilegível em %s; ignorando", identity.path)
+                continue
+            identity.saved_at = os.path.getmtime(identity.path)
+
+    def _write(self, path: str, state: State) -> None:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)  # nunca deixa um arquivo pela metade
+
+    async def _store(self, identity: Identity, state: State) -> None:
+        identity.state = state
+        identity.saved_at = time.time()
+        if identity.path:
+            await asyncio.to_thread(self._write, identity.path, state)
+
+    # ---- renovação em segundo plano ----
+    async def _refresh_loop(self) -> None:
+        while True:
+            for identity in self.identities:
+                if identity.valid(self.max_age, self.margin):
+                    continue
+                try:
+                    state = await self.refresh(identity.state)
+                except Exception:
+                    logger.exception("falha ao renovar %s", identity.name)
+                    continue
+                await self._store(identity, state)
+                self.refreshed += 1
+                logger.info("%s renovada", identity.name)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,168 @@
+# tests/conftest.py
+# Fixtures compartilhadas: o app num banco temporário, nós da API em
+# subprocessos e um Postgres descartável.
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from types import ModuleType
+from typing import Callable, Dict, Iterator, List, Optional
+
+import pytest
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(proc: subprocess.Popen, base_url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{base_url}: uvicorn terminou durante o startup")
+        try:
+            requests.get(f"{base_url}/metrics", timeout=1)
+            return
+        except requests.ConnectionError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch) -> Iterator[ModuleType]:
+    """
+    O módulo `app` importado de novo num SQLite temporário: o app lê
+    DATABASE_URL na importação, e o ambiente volta ao normal no fim do teste.
+    """
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.delitem(sys.modules, "app", raising=False)
+    import app
+
+    yield app
+    for engine in {app.engine, app.write_engine}:
+        asyncio.run(engine.dispose())
+
+
+@pytest.fixture
+def api_nodes() -> Iterator[Callable[..., List[str]]]:
+    """
+    Sobe `count` processos uvicorn (nós da API) no mesmo banco, todos ao
+    mesmo tempo, e devolve as URLs base; derruba todos no fim do teste.
+
+        urls = api_nodes(3, database_url, EVENTS_RECHECK_SECONDS="0.5")
+    """
+    procs: List[subprocess.Popen] = []
+
+    def start(count: int, database_url: str, **env: str) -> List[str]:
+        environment = dict(os.environ, DATABASE_URL=database_url, **env)
+        urls = []
+        for _ in range(count):
+            port = free_port()
+            procs.append(
+                subprocess.Popen(
+                    [
+                        sys.executable,
+                        "-m",
+                        "uvicorn",
+                        "app:app",
+                        "--port",
+                        str(port),
+                        "--log-level",
+                        "warning",
+                    ],
+                    cwd=ROOT,
+                    env=environment,
+                )
+            )
+            urls.append(f"http://127.0.0.1:{port}")
+        for proc, url in zip(procs[-count:], urls):
+            _wait_ready(proc, url)
+        return urls
+
+    yield start
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()  # shutdown gracioso preso num stream SSE aberto
+            proc.wait()
+
+
+# --------- Postgres descartável ---------
+def _pg_bin() -> Optional[str]:
+    """Diretório com initdb/pg_ctl: PG_BIN ou o PATH."""
+    if os.getenv("PG_BIN"):
+        return os.environ["PG_BIN"]
+    initdb = shutil.which("initdb")
+    return os.path.dirname(initdb) if initdb else None
+
+
+@pytest.fixture(scope="session")
+def postgres_server(tmp_path_factory) -> Iterator[Dict[str, str]]:
+    """
+    Um cluster Postgres temporário (initdb + pg_ctl) para a sessão de testes.
+    Pula os testes se não houver binários do Postgres (PG_BIN ou PATH) ou
+    o asyncpg, ou se rodar como root (o initdb se recusa).
+    """
+    pytest.importorskip("asyncpg")
+    bin_dir = _pg_bin()
+    if bin_dir is None:
+        pytest.skip("binários do Postgres não encontrados (defina PG_BIN)")
+    if hasattr(os, "geteuid") and os.geteuid() == 0:
+        pytest.skip("initdb não roda como root")
+
+    data = tmp_path_factory.mktemp("pgdata")
+    port = str(free_port())
+    subprocess.run(
+        [os.path.join(bin_dir, "initdb"), "-D", str(data), "-U", "postgres"]
+        + ["-A", "trust", "--no-sync"],
+        check=True,
+        capture_output=True,
+    )
+    options = f"-p {port} -k {data} -c listen_addresses=127.0.0.1 -c fsync=off"
+    pg_ctl = os.path.join(bin_dir, "pg_ctl")
+    subprocess.run(
+        [pg_ctl, "-D", str(data), "-o", options, "-l", str(data / "log"), "-w"]
+        + ["start"],
+        check=True,
+        capture_output=True,
+    )
+    try:
+        yield {"bin": bin_dir, "port": port}
+    finally:
+        subprocess.run(
+            [pg_ctl, "-D", str(data), "-m", "immediate", "stop"], capture_output=True
+        )
+
+
+@pytest.fixture
+def postgres_url(postgres_server) -> str:
+    """Um banco novo e vazio no cluster da sessão (DATABASE_URL)."""
+    name = f"fila_{uuid.uuid4().hex[:8]}"
+    subprocess.run(
+        [
+            os.path.join(postgres_server["bin"], "createdb"),
+            "-h",
+            "127.0.0.1",
+            "-p",
+            postgres_server["port"],
+            "-U",
+            "postgres",
+            name,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return f"postgresql://postgres@127.0.0.1:{postgres_server['port']}/{name}"
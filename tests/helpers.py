@@ -0,0 +1,21 @@
+# tests/helpers.py
+# Utilitários dos testes que não são fixtures.
+import contextlib
+import json
+from typing import Iterator
+
+import requests
+
+
+@contextlib.contextmanager
+def sse_events(url: str, timeout: float = 30) -> Iterator[Iterator[dict]]:
+    """Abre um stream SSE e itera os eventos `job` já decodificados."""
+    with requests.get(url, stream=True, timeout=timeout) as resp:
+        resp.raise_for_status()
+
+        def events():
+            for line in resp.iter_lines(decode_unicode=True):
+                if line and line.startswith("data:"):
+                    yield json.loads(line[len("data:") :])
+
+        yield events()
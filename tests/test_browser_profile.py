@@ -0,0 +1,80 @@
+# tests/test_browser_profile.py
+# Perfil enxuto: o ResourceBlocker com rotas falsas, sem abrir o Chromium.
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("playwright")
+
+from browser_profile import (  # noqa: E402
+    ResourceBlocker,
+    host_allowed,
+    lean_context_options,
+    lean_launch_options,
+)
+
+
+class FakeRoute:
+    def __init__(self, url: str, resource_type: str = "document"):
+        self.request = SimpleNamespace(url=url, resource_type=resource_type)
+        self.outcome = None
+
+    async def abort(self, reason: str) -> None:
+        self.outcome = f"abort:{reason}"
+
+    async def continue_(self) -> None:
+        self.outcome = "continue"
+
+
+class FakeContext:
+    def __init__(self):
+        self.routes = []
+
+    async def route(self, pattern, handler) -> None:
+        self.routes.append((pattern, handler))
+
+
+def test_hosts_match_exactly_or_as_subdomains():
+    allowed = ("tse.jus.br", "hcaptcha.com")
+    assert host_allowed("tse.jus.br", allowed)
+    assert host_allowed("consultaunificadapje.tse.jus.br", allowed)
+    assert host_allowed("js.hcaptcha.com", allowed)
+    assert not host_allowed("faketse.jus.br", allowed)
+    assert not host_allowed("tse.jus.br.evil.com", allowed)
+
+
+@pytest.mark.parametrize(
+    "url, resource_type, outcome",
+    [
+        ("https://consultaunificadapje.tse.jus.br/", "document", "continue"),
+        ("https://consultaunificadapje.tse.jus.br/main.js", "script", "continue"),
+        ("https://js.hcaptcha.com/1/api.js", "script", "continue"),
+        ("https://consultaunificadapje.tse.jus.br/logo.png", "image", "abort"),
+        ("https://consultaunificadapje.tse.jus.br/f.woff2", "font", "abort"),
+        ("https://www.google-analytics.com/analytics.js", "script", "abort"),
+        ("https://cdn.example.org/lib.js", "script", "continue"),  # extra_hosts
+    ],
+)
+def test_blocker_aborts_blocked_types_and_foreign_hosts(url, resource_type, outcome):
+    blocker = ResourceBlocker(extra_hosts=["cdn.example.org", None])
+    route = FakeRoute(url, resource_type)
+    asyncio.run(blocker._handle(route))
+    assert route.outcome.split(":")[0] == outcome
+    assert (blocker.blocked, blocker.allowed) == (
+        (1, 0) if outcome == "abort" else (0, 1)
+    )
+
+
+def test_blocker_installs_one_catch_all_route():
+    blocker = ResourceBlocker()
+    context = FakeContext()
+    asyncio.run(blocker.install(context))
+    assert context.routes == [("**/*", blocker._handle)]
+
+
+def test_lean_options():
+    options = lean_launch_options(headless=False)
+    assert options["headless"] is False
+    assert "--blink-settings=imagesEnabled=false" in options["args"]
+    assert lean_context_options()["service_workers"] == "block"
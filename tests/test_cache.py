@@ -0,0 +1,92 @@
+# tests/test_cache.py
+# TTLCache: expiração por idade e descarte do usado há mais tempo (LRU).
+import threading
+
+import pytest
+
+import cache
+from cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    fake = FakeClock()
+    monkeypatch.setattr(cache, "time", fake)
+    return fake
+
+
+def test_entries_expire_after_ttl(clock):
+    results = TTLCache(max_size=10, ttl=60)
+    results.put("a", 1)
+    clock.now += 59
+    assert results.get("a") == 1
+    clock.now += 2
+    assert results.get("a") is None
+    assert len(results) == 0  # a entrada vencida sai no get
+
+
+def test_max_age_is_per_lookup_and_capped_by_ttl(clock):
+    results = TTLCache(max_size=10, ttl=60)
+    results.put("a", 1)
+    clock.now += 30
+    assert results.get("a", max_age=10) is None
+    assert results.get("a", max_age=3600) == 1  # nunca além do ttl
+    assert len(results) == 1  # velha demais para este pedido, mas fica
+
+
+def test_put_honours_the_age_of_the_value(clock):
+    results = TTLCache(max_size=10, ttl=60)
+    results.put("old", 1, age=61)
+    assert results.get("old") is None
+    results.put("a", 1, age=50)
+    clock.now += 11
+    assert results.get("a") is None
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    results = TTLCache(max_size=2, ttl=60)
+    results.put("a", 1)
+    results.put("b", 2)
+    assert results.get("a") == 1  # "b" passa a ser o usado há mais tempo
+    results.put("c", 3)
+    assert len(results) == 2
+    assert results.get("b") is None
+    assert (results.get("a"), results.get("c")) == (1, 3)
+
+
+def test_zero_size_cache_stores_nothing(clock):
+    results = TTLCache(max_size=0, ttl=60)
+    results.put("a", 1)
+    assert len(results) == 0
+
+
+def test_pop_and_clear(clock):
+    results = TTLCache(max_size=10, ttl=60)
+    results.put("a", 1)
+    results.put("b", 2)
+    results.pop("a")
+    results.pop("missing")
+    assert len(results) == 1
+    results.clear()
+    assert len(results) == 0
+
+
+def test_len_waits_for_the_lock():
+    results = TTLCache(max_size=10, ttl=60)
+    sizes = []
+    with results._lock:
+        reader = threading.Thread(target=lambda: sizes.append(len(results)))
+        reader.start()
+        reader.join(timeout=0.2)
+        assert reader.is_alive()  # bloqueado enquanto um put/get segura o lock
+        results._data["a"] = (0.0, 1)
+    reader.join(timeout=5)
+    assert sizes == [1]
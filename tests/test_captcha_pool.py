@@ -0,0 +1,124 @@
+# tests/test_captcha_pool.py
+# CaptchaPool com um provedor falso no lugar do cliente do hCaptcha.
+import asyncio
+import itertools
+import threading
+import time
+
+import pytest
+
+from captcha_pool import CaptchaPool, CaptchaUnavailable, SolvedToken
+
+
+class FakeProvider:
+    """`solve` falso: falha as primeiras `failures` vezes, depois devolve t1, t2..."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = 0
+        self._codes = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            if self.calls <= self.failures:
+                raise RuntimeError(f"falha {self.calls}")
+            return {"code": f"t{next(self._codes)}", "useragent": "fake-agent"}
+
+
+def _token(code: str, age: float) -> SolvedToken:
+    return SolvedToken(code, None, time.monotonic() - age, 10.0)
+
+
+def test_take_returns_the_oldest_valid_token_and_drops_expired():
+    async def scenario():
+        pool = CaptchaPool(FakeProvider(), ttl=120, margin=20)
+        # vencido (mais de ttl - margin), o mais antigo válido, um mais novo
+        pool._ready.extend(
+            [_token("old", 101), _token("oldest-valid", 90), _token("new", 5)]
+        )
+        return await pool.take(timeout=0), pool
+
+    token, pool = asyncio.run(scenario())
+    assert token.code == "oldest-valid"
+    assert pool.expired == 1
+    assert [t.code for t in pool._ready] == ["new"]
+
+
+def test_take_gets_tokens_from_the_provider_in_order():
+    async def scenario():
+        async with CaptchaPool(FakeProvider(), max_size=1) as pool:
+            return [(await pool.take(timeout=5)) for _ in range(3)]
+
+    tokens = asyncio.run(scenario())
+    assert [t.code for t in tokens] == ["t1", "t2", "t3"]
+    assert tokens[0].useragent == "fake-agent"
+
+
+def test_take_times_out_when_the_provider_is_slow():
+    release = threading.Event()
+
+    async def scenario():
+        async with CaptchaPool(lambda: release.wait(30) and {"code": "late"}) as pool:
+            started = time.monotonic()
+            try:
+                with pytest.raises(CaptchaUnavailable, match="nenhum token"):
+                    await pool.take(timeout=0.3)
+            finally:
+                release.set()  # libera a thread presa no provedor falso
+            return time.monotonic() - started
+
+    elapsed = asyncio.run(scenario())
+    assert 0.3 <= elapsed < 2
+
+
+def test_take_fails_fast_after_max_failures():
+    provider = FakeProvider(failures=100)
+
+    async def scenario():
+        pool = CaptchaPool(provider, max_size=1, max_failures=3, retry_seconds=0.01)
+        async with pool:
+            with pytest.raises(CaptchaUnavailable, match=r"falhou \d+ vezes"):
+                await pool.take(timeout=10)
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert pool.failures >= 3
+    assert provider.calls >= 3
+
+
+def test_a_success_resets_the_failure_count():
+    async def scenario():
+        pool = CaptchaPool(
+            FakeProvider(failures=2), max_size=1, max_failures=2, retry_seconds=0.2
+        )
+        async with pool:
+            with pytest.raises(CaptchaUnavailable):
+                await pool.take(timeout=10)
+            # o produtor continua tentando; a terceira chamada dá certo
+            while pool.failures:
+                await asyncio.sleep(0.05)
+            return pool, await pool.take(timeout=5)
+
+    pool, token = asyncio.run(scenario())
+    assert token.code == "t1"
+    assert pool.failures == 0
+
+
+def test_target_size_follows_consumption_within_bounds():
+    pool = CaptchaPool(FakeProvider(), min_size=2, max_size=8, ttl=120, margin=20)
+    now = time.monotonic()
+    pool._started_at = now - pool.rate_window
+    pool._solve_seconds = 30.0
+    assert pool.target_size() == 2  # sem consumo: o mínimo
+
+    pool._takes.extend([now] * 3000)  # 10 tokens/s
+    assert pool.target_size() == 8  # limitado por max_size
+
+    pool.min_size = 1
+    pool._takes.clear()
+    pool._takes.extend([now] * 6)  # 0,02 token/s
+    pool._solve_seconds = 300.0
+    # a lei de Little pediria 7, mas só 3 seriam usados antes de vencer
+    assert pool.target_size() == 3
@@ -0,0 +1,123 @@
+# tests/test_claim_concurrency.py
+# /next com muitos claimers ao mesmo tempo: nenhum job entregue duas vezes.
+import asyncio
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import pytest
+import requests
+from sqlalchemy import delete
+
+from documents import complete_cpf
+
+JOBS = 600
+CLAIMERS = (1, 4, 16, 32)
+CLAIM_BATCH = 5
+
+
+def _report(capsys, title: str, rates: Dict[int, float]) -> None:
+    with capsys.disabled():
+        print(f"\n{title}")
+        for claimers, rate in rates.items():
+            print(f"  {claimers:>3} claimers: {rate:8.0f} jobs/s")
+
+
+# --------- No mesmo processo ---------
+async def _seed(app, count: int) -> List[str]:
+    items = [(complete_cpf(100_000_000 + i),) * 2 for i in range(count)]
+    async with app.WriteSessionLocal() as db:
+        await db.execute(delete(app.Message))
+        ids = await app._insert_texts(db, items)
+        await db.commit()
+    return ids
+
+
+async def _claim_until_empty(app, worker_id: str) -> List[str]:
+    claimed: List[str] = []
+    # cada claimer com a sua conexão do pool compartilhado: as reservas
+    # disputam o banco de verdade, sem a fila do pool de escrita
+    async with app.SessionLocal() as db:
+        while True:
+            rows = await app._claim_pending(db, CLAIM_BATCH, worker_id)
+            await db.commit()
+            if not rows:
+                return claimed
+            claimed += [row.id for row in rows]
+
+
+async def _claim_round(app, claimers: int):
+    await app._ensure_schema()
+    ids = await _seed(app, JOBS)
+    started = time.perf_counter()
+    batches = await asyncio.gather(
+        *(_claim_until_empty(app, f"worker-{i}") for i in range(claimers))
+    )
+    elapsed = time.perf_counter() - started
+    return ids, batches, elapsed
+
+
+def test_concurrent_claims_in_one_process(app_module, capsys):
+    rates = {}
+    for claimers in CLAIMERS:
+        ids, batches, elapsed = asyncio.run(_claim_round(app_module, claimers))
+        claimed = Counter(job_id for batch in batches for job_id in batch)
+        assert set(claimed) == set(ids)
+        assert max(claimed.values()) == 1  # nenhum job reservado duas vezes
+        rates[claimers] = JOBS / elapsed
+        asyncio.run(app_module.engine.dispose())
+    _report(capsys, "reservas no mesmo processo (SQLite)", rates)
+
+
+# --------- Vários processos ---------
+@pytest.fixture(params=["sqlite", "postgresql"])
+def shared_database(request, tmp_path) -> str:
+    """O mesmo teste num arquivo SQLite e num Postgres descartável."""
+    if request.param == "sqlite":
+        return f"sqlite:///{tmp_path / 'nodes.db'}"
+    return request.getfixturevalue("postgres_url")
+
+
+def _claim_over_http(url: str, worker_id: str) -> List[str]:
+    claimed: List[str] = []
+    with requests.Session() as session:
+        while True:
+            resp = session.post(
+                f"{url}/next",
+                params={"worker_id": worker_id, "n": CLAIM_BATCH},
+                timeout=60,
+            )
+            if resp.status_code == 503:  # banco ocupado: tenta de novo
+                continue
+            resp.raise_for_status()
+            if not resp.json():
+                return claimed
+            claimed += [job["id"] for job in resp.json()]
+
+
+def test_concurrent_claims_across_processes(api_nodes, shared_database, capsys):
+    urls = api_nodes(4, shared_database)
+    rates = {}
+    for claimers in CLAIMERS:
+        requests.delete(f"{urls[0]}/jobs/clear", timeout=60).raise_for_status()
+        texts = [complete_cpf(200_000_000 + i) for i in range(JOBS)]
+        resp = requests.post(f"{urls[0]}/send/batch", json={"texts": texts})
+        ids = set(resp.json()["ids"])
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=claimers) as executor:
+            batches = list(
+                executor.map(
+                    lambda i: _claim_over_http(urls[i % len(urls)], f"worker-{i}"),
+                    range(claimers),
+                )
+            )
+        elapsed = time.perf_counter() - started
+
+        claimed = Counter(job_id for batch in batches for job_id in batch)
+        assert set(claimed) == ids
+        assert max(claimed.values()) == 1  # nenhum job entregue duas vezes
+        rates[claimers] = JOBS / elapsed
+    backend = shared_database.partition(":")[0]
+    _report(capsys, f"reservas via /next em {len(urls)} processos ({backend})", rates)
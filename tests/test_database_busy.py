@@ -0,0 +1,36 @@
+# tests/test_database_busy.py
+# Banco ocupado vira 503 com Retry-After; outros erros do banco, não.
+import asyncio
+import sqlite3
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from starlette.requests import Request
+
+REQUEST = Request({"type": "http", "method": "POST", "path": "/next", "headers": []})
+
+
+def _operational(message: str) -> OperationalError:
+    return OperationalError("BEGIN IMMEDIATE", {}, sqlite3.OperationalError(message))
+
+
+@pytest.mark.parametrize(
+    "exc",
+    [PoolTimeoutError("QueuePool limit reached"), _operational("database is locked")],
+)
+def test_busy_database_returns_503_with_retry_after(app_module, exc):
+    resp = asyncio.run(app_module.database_busy_handler(REQUEST, exc))
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+
+
+def test_other_operational_errors_are_not_masked(app_module):
+    exc = _operational("no such table: messages")
+    with pytest.raises(OperationalError):
+        asyncio.run(app_module.database_busy_handler(REQUEST, exc))
+
+
+def test_builtin_timeout_error_is_not_shadowed(app_module):
+    # `TimeoutError` no módulo é o builtin, não o do pool do SQLAlchemy
+    assert "TimeoutError" not in vars(app_module)
@@ -0,0 +1,252 @@
+# tests/test_direct_api.py
+# DirectClient contra um servidor local no lugar do endpoint da consulta.
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+import pytest
+
+import direct_api
+from direct_api import DirectApiError, DirectClient, TooManyResults
+
+PAGE_PATH = re.compile(r"/consulta-publica-unificada/processo/(\d+)/(\d+)")
+STORAGE_STATE = {
+    "cookies": [
+        {"name": "JSESSIONID", "value": "abc", "domain": "127.0.0.1", "path": "/"},
+        {"name": "TS01", "value": "xyz", "domain": "127.0.0.1", "expires": -1},
+    ],
+    "origins": [],
+}
+
+
+def processo(n: int) -> Dict[str, Any]:
+    return {
+        "numeroProcesso": f"0600{n:03d}-00.2024.6.26.0001",
+        "instancia": "1º grau",
+        "uf": "SP",
+        "classeJudicial": {"descricao": "Prestação de Contas"},
+        "assuntoPrincipal": {"descricao": "Eleições"},
+        "dataUltimoMovimento": "2024-10-01",
+        "partes": [{"nome": "Fulano"}, {"nome": "Beltrano"}],
+    }
+
+
+class StandIn:
+    """
+    O endpoint paginado `.../processo/{size}/{page}`: serve `items` em páginas
+    de `size` com o total em `totalElements`, ou responde `status` a tudo.
+    Guarda cada requisição recebida em `requests`.
+
+    Para os testes de paginação: `max_size` recusa (com `reject_status`)
+    tamanhos maiores, `clamp` corta o tamanho em silêncio, `with_total=False`
+    omite o total, `delay` segura cada resposta (e `max_in_flight` conta as
+    simultâneas) e `after_first` muda a lista depois da primeira página.
+    """
+
+    def __init__(self, items: List[Dict[str, Any]]):
+        self.items = items
+        self.base_url = ""
+        self.status: Optional[int] = None
+        self.max_size: Optional[int] = None
+        self.reject_status = 400
+        self.clamp: Optional[int] = None
+        self.with_total = True
+        self.delay = 0.0
+        self.after_first: Optional[Callable[[], None]] = None
+        self.requests: List[Dict[str, Any]] = []
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def respond(self, size: int, page: int):
+        if self.status is not None:
+            return self.status, {"message": "recusado"}
+        if self.max_size is not None and size > self.max_size:
+            return self.reject_status, {"message": "tamanho inválido"}
+        size = min(size, self.clamp or size)
+        content = self.items[page * size : (page + 1) * size]
+        payload = {"content": content}
+        if self.with_total:
+            payload["totalElements"] = len(self.items)
+        if page == 0 and self.after_first is not None:
+            self.after_first()
+        return 200, payload
+
+    def pages(self, size: int) -> List[int]:
+        return sorted(r["page"] for r in self.requests if r["size"] == size)
+
+
+@pytest.fixture
+def stand_in():
+    state = StandIn([processo(n) for n in range(3)])
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            size, page = map(int, PAGE_PATH.fullmatch(self.path).groups())
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with state.lock:
+                state.requests.append(
+                    {"size": size, "page": page, "headers": self.headers, "body": body}
+                )
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            time.sleep(state.delay)
+            with state.lock:
+                status, payload = state.respond(size, page)
+                state.in_flight -= 1
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    state.base_url = f"http://127.0.0.1:{server.server_port}"
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(stand_in):
+    direct = DirectClient(base_url=stand_in.base_url)
+    yield direct
+    direct.close()
+
+
+def test_fetch_page_sends_token_user_agent_and_cookies(stand_in, client):
+    assert client.load_storage_state(STORAGE_STATE) == 2
+    data = client.fetch_page("111.444.777-35", "token-1", 0, 10, user_agent="ua/1.0")
+
+    assert data["totalElements"] == 3
+    [request] = stand_in.requests
+    assert (request["size"], request["page"]) == (10, 0)
+    assert request["headers"]["captcharesponse"] == "token-1"
+    assert request["headers"]["user-agent"] == "ua/1.0"
+    cookies = dict(
+        c.strip().split("=", 1) for c in request["headers"]["Cookie"].split(";")
+    )
+    assert cookies == {"JSESSIONID": "abc", "TS01": "xyz"}
+    # documento normalizado no corpo, como o Angular da página manda
+    assert request["body"] == {
+        "partes.cpfCnpjParte": "11144477735",
+        "filtrarPorNovoProcesso": True,
+    }
+
+
+def test_storage_state_loads_from_a_file(stand_in, client, tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text(json.dumps(STORAGE_STATE), encoding="utf-8")
+    assert client.load_storage_state(str(path)) == 2
+    client.fetch_page("11144477735", "token-1", 0, 10)
+    assert "JSESSIONID=abc" in stand_in.requests[0]["headers"]["Cookie"]
+
+
+@pytest.mark.parametrize("status", [401, 403, 429])
+def test_refused_queries_raise_direct_api_error(stand_in, client, status):
+    stand_in.status = status
+    with pytest.raises(DirectApiError, match=f"HTTP {status}"):
+        client.fetch_page("11144477735", "token-1", 0, 10)
+
+
+def test_search_returns_headers_and_rows(stand_in, client):
+    result = client.search("11144477735", "token-1")
+
+    assert result["headers"] == direct_api.HEADERS
+    assert result["rows"][0] == [
+        "0600000-00.2024.6.26.0001",
+        "1º grau",
+        "SP",
+        "Prestação de Contas",
+        "Eleições",
+        "2024-10-01",
+        "Fulano; Beltrano",
+    ]
+    assert len(result["rows"]) == 3
+
+
+# --------- Paginação ---------
+def test_search_fetches_the_remaining_pages_in_parallel(stand_in, client):
+    stand_in.items = [processo(n) for n in range(95)]
+    stand_in.max_size = 20
+    stand_in.delay = 0.2
+    pages = []
+    result = client.search("11144477735", "token-1", on_page=pages.append)
+
+    assert len(result["rows"]) == 95
+    assert stand_in.pages(20) == [0, 1, 2, 3, 4]
+    assert sorted(pages) == [0, 1, 2, 3, 4]
+    # as páginas 1-4 saem juntas, até `fan_out` por consulta
+    assert 2 <= stand_in.max_in_flight <= client.fan_out
+
+
+@pytest.mark.parametrize("status", [400, 422])
+def test_rejected_page_sizes_fall_back_to_a_smaller_one(stand_in, client, status):
+    stand_in.items = [processo(n) for n in range(30)]
+    stand_in.max_size = 20
+    stand_in.reject_status = status
+    assert len(client.search("11144477735", "token-1")["rows"]) == 30
+    assert [r["size"] for r in stand_in.requests[:3]] == [100, 50, 20]
+    assert client.page_size == 20
+
+    # o tamanho aceito fica lembrado para as próximas consultas
+    stand_in.requests.clear()
+    client.search("11144477735", "token-2")
+    assert {r["size"] for r in stand_in.requests} == {20}
+
+
+def test_a_silently_clamped_page_size_is_detected(stand_in, client):
+    stand_in.items = [processo(n) for n in range(30)]
+    stand_in.clamp = 7
+    result = client.search("11144477735", "token-1")
+
+    assert client.page_size == 7
+    assert stand_in.pages(7) == [1, 2, 3, 4]
+    assert len(result["rows"]) == 30
+
+
+def test_overlapping_pages_are_deduplicated(stand_in, client):
+    stand_in.items = [processo(n) for n in range(25)]
+    stand_in.max_size = 10
+    # um processo novo entra no topo: a página 1 repete o último da página 0
+    stand_in.after_first = lambda: stand_in.items.insert(0, processo(999))
+    rows = client.search("11144477735", "token-1")["rows"]
+
+    numbers = [row[0] for row in rows]
+    assert len(numbers) == len(set(numbers)) == 25
+
+
+def test_more_results_than_max_pages_fail_instead_of_truncating(
+    stand_in, client, monkeypatch
+):
+    monkeypatch.setattr(direct_api, "MAX_PAGES", 3)
+    stand_in.items = [processo(n) for n in range(31)]
+    stand_in.max_size = 10
+    with pytest.raises(TooManyResults, match="31 processos"):
+        client.search("11144477735", "token-1")
+    assert stand_in.pages(10) == [0]  # nada além da primeira página
+
+
+def test_unbounded_results_without_a_total_fail_at_max_pages(
+    stand_in, client, monkeypatch
+):
+    monkeypatch.setattr(direct_api, "MAX_PAGES", 3)
+    stand_in.items = [processo(n) for n in range(50)]
+    stand_in.max_size = 10
+    stand_in.with_total = False
+    with pytest.raises(TooManyResults):
+        client.search("11144477735", "token-1")
+
+    # uma página vazia antes do limite: a lista acabou
+    stand_in.items = stand_in.items[:15]
+    assert len(client.search("11144477735", "token-1")["rows"]) == 15
@@ -0,0 +1,49 @@
+# tests/test_documents.py
+# Dígitos verificadores de CPF e CNPJ (numérico e alfanumérico).
+import pytest
+
+from documents import complete_cpf, normalize_document
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("111.444.777-35", "11144477735"),
+        (" 11144477735 ", "11144477735"),
+        ("11.222.333/0001-81", "11222333000181"),
+        # exemplo da Receita para o CNPJ alfanumérico
+        ("12.ABC.345/01DE-35", "12ABC34501DE35"),
+        ("12.abc.345/01de-35", "12ABC34501DE35"),
+    ],
+)
+def test_valid_documents_are_normalized(value, expected):
+    assert normalize_document(value) == expected
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "111.444.777-36",  # dígito verificador errado
+        "11.222.333/0001-82",
+        "12.ABC.345/01DE-36",
+        "12.ABC.345/01DE-3A",  # dígitos verificadores são sempre numéricos
+        "1234567890A",  # CPF não tem letras
+        # todos os dígitos iguais passam na conta, mas não são válidos
+        "111.111.111-11",
+        "000.000.000-00",
+        "00.000.000/0000-00",
+        "1114447773",  # tamanho errado
+        "",
+        None,
+    ],
+)
+def test_invalid_documents_are_rejected(value):
+    with pytest.raises(ValueError):
+        normalize_document(value)
+
+
+def test_complete_cpf_builds_valid_documents():
+    for base in (1, 111_444_777, 999_999_998):
+        document = complete_cpf(base)
+        assert document[:9] == f"{base:09d}"
+        assert normalize_document(document) == document
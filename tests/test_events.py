@@ -0,0 +1,42 @@
+# tests/test_events.py
+# /events com vários processos no mesmo arquivo SQLite (como uvicorn --workers).
+import threading
+
+import requests
+
+from documents import complete_cpf
+from helpers import sse_events
+
+RESULT = {"headers": ["Número Processo"], "rows": [["0600001-00.2024"]]}
+JOBS = 8
+
+
+def test_subscriber_gets_jobs_finished_in_every_process(api_nodes, tmp_path):
+    # sem WEB_CONCURRENCY nem SHARED_DATABASE: o banco em arquivo já basta
+    urls = api_nodes(
+        4, f"sqlite:///{tmp_path / 'events.db'}", EVENTS_RECHECK_SECONDS="0.5"
+    )
+    texts = [complete_cpf(500_000_000 + i) for i in range(JOBS)]
+    ids = requests.post(f"{urls[0]}/send/batch", json={"texts": texts}).json()["ids"]
+    received = []
+    subscribed = threading.Event()
+
+    def listen():
+        with sse_events(f"{urls[0]}/events?ids={','.join(ids)}") as events:
+            subscribed.set()
+            received.extend(events)
+
+    listener = threading.Thread(target=listen, daemon=True)
+    listener.start()
+    assert subscribed.wait(timeout=10)
+    for i in range(JOBS):
+        url = urls[i % len(urls)]
+        job = requests.post(f"{url}/next", params={"worker_id": f"w{i}"}).json()
+        requests.post(
+            f"{url}/finish/{job['id']}", json={"content": RESULT, "worker_id": f"w{i}"}
+        ).raise_for_status()
+    listener.join(timeout=15)
+
+    assert not listener.is_alive()
+    assert sorted(event["id"] for event in received) == sorted(ids)
+    assert {event["status"] for event in received} == {"done"}
@@ -0,0 +1,59 @@
+# tests/test_fair_queue.py
+# Relógio virtual dos clientes: só jobs de fato inseridos custam a vez.
+import asyncio
+
+import requests
+from sqlalchemy import select
+
+from documents import complete_cpf
+
+
+def _vtime(url: str, client_id: str) -> float:
+    clients = {c["id"]: c for c in requests.get(f"{url}/clients").json()}
+    return clients[client_id]["vtime"]
+
+
+def test_repeats_and_resends_do_not_advance_the_clock(api_nodes, tmp_path):
+    [url] = api_nodes(1, f"sqlite:///{tmp_path / 'fair.db'}")
+    document = complete_cpf(600_000_000)
+
+    resp = requests.post(
+        f"{url}/send/batch", json={"texts": [document] * 100, "client_id": "tenant"}
+    )
+    assert len(set(resp.json()["ids"])) == 1
+    assert _vtime(url, "tenant") == 1
+
+    for _ in range(5):  # o mesmo documento ainda em andamento
+        requests.post(
+            f"{url}/send", json={"text": document, "client_id": "tenant"}
+        ).raise_for_status()
+    assert _vtime(url, "tenant") == 1
+
+    requests.post(
+        f"{url}/send", json={"text": complete_cpf(600_000_001), "client_id": "tenant"}
+    ).raise_for_status()
+    assert _vtime(url, "tenant") == 2
+
+
+def test_rolled_back_enqueue_returns_the_reservation(app_module):
+    app = app_module
+
+    async def scenario():
+        await app._ensure_schema()
+        items = [(complete_cpf(610_000_000 + i),) * 2 for i in range(3)]
+        async with app.WriteSessionLocal() as db:
+            await app._enqueue(db, items, client_id="tenant")
+            await db.rollback()  # ex.: falha depois da inserção
+        async with app.WriteSessionLocal() as db:
+            await app._enqueue(db, items[:1], client_id="tenant")
+            await db.commit()
+        async with app.SessionLocal() as db:
+            vtime = await db.scalar(
+                select(app.Client.vtime).where(app.Client.id == "tenant")
+            )
+            tags = (await db.scalars(select(app.Message.vtag))).all()
+        return vtime, tags
+
+    vtime, tags = asyncio.run(scenario())
+    assert vtime == 1
+    assert tags == [1]
@@ -0,0 +1,26 @@
+# tests/test_list_jobs.py
+# /jobs devolve só os campos pedidos, e o OpenAPI descreve esse formato.
+import requests
+
+from documents import complete_cpf
+
+
+def test_items_carry_only_the_requested_fields(api_nodes, tmp_path):
+    [url] = api_nodes(1, f"sqlite:///{tmp_path / 'jobs.db'}")
+    requests.post(f"{url}/send", json={"text": complete_cpf(800_000_000)})
+
+    schema = requests.get(f"{url}/openapi.json").json()
+    item = schema["components"]["schemas"]["JobListItem"]
+    assert "required" not in item
+    assert "result_json" in item["properties"]
+    response = schema["paths"]["/jobs"]["get"]["responses"]["200"]
+    items = response["content"]["application/json"]["schema"]["items"]
+    assert items["$ref"].endswith("/JobListItem")
+
+    [job] = requests.get(f"{url}/jobs").json()
+    assert "result_json" not in job
+    assert set(job) == set(item["properties"]) - {"result_json"}
+    [job] = requests.get(f"{url}/jobs", params={"include_content": True}).json()
+    assert job["result_json"] is None
+    [job] = requests.get(f"{url}/jobs", params={"fields": "id,status"}).json()
+    assert set(job) == {"id", "status"}
@@ -0,0 +1,123 @@
+# tests/test_postgres.py
+# A fila com vários nós da API compartilhando um Postgres descartável.
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from documents import complete_cpf
+from helpers import sse_events
+
+RESULT = {"headers": ["Número Processo", "UF"], "rows": [["0600001-00.2024", "SP"]]}
+
+
+def _claim_all(url: str, worker_id: str) -> list:
+    claimed = []
+    with requests.Session() as session:
+        while True:
+            resp = session.post(
+                f"{url}/next", params={"worker_id": worker_id, "n": 5}, timeout=30
+            )
+            resp.raise_for_status()
+            if not resp.json():
+                return claimed
+            claimed += [job["id"] for job in resp.json()]
+
+
+def test_nodes_migrate_a_fresh_database_together(api_nodes, postgres_url):
+    # os três sobem ao mesmo tempo: a migração é serializada pelo advisory lock
+    urls = api_nodes(3, postgres_url)
+    for url in urls:
+        assert requests.get(f"{url}/jobs", timeout=10).status_code == 200
+
+
+def test_each_job_is_claimed_by_exactly_one_worker(api_nodes, postgres_url):
+    urls = api_nodes(2, postgres_url)
+    texts = [complete_cpf(100_000_000 + i) for i in range(300)]
+    resp = requests.post(f"{urls[0]}/send/batch", json={"texts": texts}, timeout=30)
+    sent = set(resp.json()["ids"])
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        batches = list(
+            executor.map(lambda i: _claim_all(urls[i % 2], f"worker-{i}"), range(16))
+        )
+    claimed = Counter(job_id for batch in batches for job_id in batch)
+    assert set(claimed) == sent
+    assert max(claimed.values()) == 1  # nenhum job entregue duas vezes
+
+
+def test_same_document_coalesces_across_nodes(api_nodes, postgres_url):
+    urls = api_nodes(2, postgres_url)
+    barrier = threading.Barrier(20)
+
+    def send(i: int) -> str:
+        barrier.wait()
+        resp = requests.post(
+            f"{urls[i % 2]}/send", json={"text": "111.444.777-35"}, timeout=30
+        )
+        resp.raise_for_status()
+        return resp.json()["id"]
+
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        ids = set(executor.map(send, range(20)))
+    assert len(ids) == 1
+
+
+def test_client_clock_has_no_lost_updates(api_nodes, postgres_url):
+    urls = api_nodes(2, postgres_url)
+
+    def send(i: int) -> int:
+        return requests.post(
+            f"{urls[i % 2]}/send",
+            json={"text": complete_cpf(200_000_000 + i), "client_id": "tenant"},
+            timeout=30,
+        ).status_code
+
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        assert set(executor.map(send, range(60))) == {200}
+    clients = {c["id"]: c for c in requests.get(f"{urls[0]}/clients").json()}
+    # uma marca de 1/peso por job: nenhum avanço do relógio se perdeu
+    assert clients["tenant"]["vtime"] == 60
+
+
+def test_events_reach_a_subscriber_on_another_node(api_nodes, postgres_url):
+    urls = api_nodes(2, postgres_url, EVENTS_RECHECK_SECONDS="0.5")
+    resp = requests.post(f"{urls[0]}/send", json={"text": complete_cpf(300_000_000)})
+    job_id = resp.json()["id"]
+    received = []
+
+    def listen():
+        with sse_events(f"{urls[0]}/events?ids={job_id}") as events:
+            received.extend(events)
+
+    listener = threading.Thread(target=listen, daemon=True)
+    listener.start()
+    time.sleep(0.5)  # assinatura feita antes do /finish
+    job = requests.post(f"{urls[1]}/next", params={"worker_id": "w"}).json()
+    assert job["id"] == job_id
+    finished_at = time.monotonic()
+    requests.post(
+        f"{urls[1]}/finish/{job_id}", json={"content": RESULT, "worker_id": "w"}
+    ).raise_for_status()
+    listener.join(timeout=10)
+
+    assert not listener.is_alive()
+    assert time.monotonic() - finished_at < 5
+    assert received == [{"id": job_id, "status": "done", "content": RESULT}]
+
+
+def test_result_round_trips_through_jsonb(api_nodes, postgres_url):
+    [url] = api_nodes(1, postgres_url)
+    job_id = requests.post(
+        f"{url}/send", json={"text": complete_cpf(400_000_000)}
+    ).json()["id"]
+    requests.post(f"{url}/next", params={"worker_id": "w"}).raise_for_status()
+    requests.post(
+        f"{url}/finish/{job_id}", json={"content": RESULT, "worker_id": "w"}
+    ).raise_for_status()
+
+    assert requests.get(f"{url}/retrieve/{job_id}").json()["content"] == RESULT
+    lines = requests.get(f"{url}/jobs/export", params={"format": "csv"}).text
+    assert lines.splitlines()[1].endswith(",0,0600001-00.2024,SP")
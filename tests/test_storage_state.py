@@ -0,0 +1,127 @@
+# tests/test_storage_state.py
+# StatePool: identidades válidas, persistência em disco e renovação.
+import asyncio
+import json
+import os
+import time
+
+from storage_state import Identity, StatePool, cookies_expire_at
+
+
+def state(*expires: float) -> dict:
+    cookies = [{"name": "TS01", "value": "s", "expires": -1}]  # de sessão
+    cookies += [
+        {"name": f"c{i}", "value": "v", "expires": value}
+        for i, value in enumerate(expires)
+    ]
+    return {"cookies": cookies, "origins": []}
+
+
+class FakeContext:
+    def __init__(self, stored: dict):
+        self.stored = stored
+
+    async def storage_state(self) -> dict:
+        return self.stored
+
+
+def test_state_expires_at_the_first_cookie_or_max_age():
+    now = time.time()
+    assert cookies_expire_at(state()) is None  # só cookies de sessão
+    assert cookies_expire_at(state(now + 50, now + 10)) == now + 10
+
+    identity = Identity("a")
+    assert not identity.valid(max_age=600)  # sem estado
+    identity.state, identity.saved_at = state(now + 100), now
+    assert identity.expires_at(max_age=600) == now + 100
+    assert identity.expires_at(max_age=60) == now + 60
+    assert identity.valid(max_age=600, margin=50)
+    assert not identity.valid(max_age=600, margin=150)
+
+
+def test_acquire_prefers_valid_then_least_busy_identities():
+    async def scenario():
+        pool = StatePool(size=3, max_age=600)
+        await pool._store(pool.identities[2], state())
+        first = await pool.acquire()
+        second = await pool.acquire()  # a válida, mesmo já em uso
+        pool.release(first)
+        pool.release(second)
+        return pool, first, second
+
+    pool, first, second = asyncio.run(scenario())
+    assert first is second is pool.identities[2]
+    assert pool.context_options(first) == {"storage_state": first.state}
+    assert pool.context_options(pool.identities[0]) == {}
+
+
+def test_saved_states_survive_a_restart(tmp_path):
+    directory = str(tmp_path / "states")
+
+    async def save():
+        async with StatePool(size=2, directory=directory) as pool:
+            identity = await pool.acquire()
+            await pool.save(identity, FakeContext(state()))
+            pool.release(identity)
+            return identity.name
+
+    async def reload():
+        async with StatePool(size=2, directory=directory) as pool:
+            return {i.name: i.state for i in pool.identities}
+
+    name = asyncio.run(save())
+    assert sorted(os.listdir(directory)) == [f"{name}.json"]  # sem o .tmp
+    assert asyncio.run(reload()) == {
+        "identity-0": state() if name == "identity-0" else None,
+        "identity-1": state() if name == "identity-1" else None,
+    }
+
+
+def test_discard_forgets_the_state_and_its_file(tmp_path):
+    async def scenario():
+        pool = StatePool(size=1, directory=str(tmp_path))
+        await pool.start()
+        [identity] = pool.identities
+        await pool._store(identity, state())
+        pool.discard(identity)
+        return pool, identity
+
+    pool, identity = asyncio.run(scenario())
+    assert identity.state is None
+    assert pool.discarded == 1
+    assert not os.path.exists(identity.path)
+
+
+def test_unreadable_state_files_are_ignored(tmp_path):
+    (tmp_path / "identity-0.json").write_text("{not json", encoding="utf-8")
+    (tmp_path / "identity-1.json").write_text(json.dumps(state()), encoding="utf-8")
+
+    async def scenario():
+        async with StatePool(size=2, directory=str(tmp_path)) as pool:
+            return [i.state for i in pool.identities]
+
+    assert asyncio.run(scenario()) == [None, state()]
+
+
+def test_refresh_warms_and_renews_identities_before_they_expire():
+    calls = []
+
+    async def refresh(previous):
+        calls.append(previous)
+        return state(time.time() + 3600)
+
+    async def scenario():
+        pool = StatePool(size=2, refresh=refresh, max_age=600, margin=60, interval=0.05)
+        # uma vence em 30s (dentro da margem), a outra nunca foi aquecida
+        pool.identities[0].state = state(time.time() + 30)
+        pool.identities[0].saved_at = time.time()
+        async with pool:
+            while pool.refreshed < 2:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.2)  # válidas agora: nada mais a renovar
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert pool.refreshed == 2
+    assert len(calls) == 2 and calls[1] is None
+    assert all(i.valid(pool.max_age, pool.margin) for i in pool.identities)
@@ -0,0 +1,53 @@
+# tests/test_timings.py
+# Marcas de tempo dos workers presas à janela reserva -> /finish.
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+from documents import complete_cpf
+
+RESULT = {"headers": [], "rows": []}
+
+
+def test_skewed_worker_marks_are_clamped(api_nodes, tmp_path):
+    [url] = api_nodes(1, f"sqlite:///{tmp_path / 'timings.db'}")
+    requests.post(f"{url}/send", json={"text": complete_cpf(700_000_000)})
+    job = requests.post(f"{url}/next", params={"worker_id": "w"}).json()
+
+    now = datetime.now(timezone.utc)
+    marks = [
+        {"stage": "page_load", "at": (now - timedelta(days=400)).isoformat()},
+        {
+            "stage": "captcha_solved",
+            "started_at": (now - timedelta(days=1)).isoformat(),
+            "at": (now + timedelta(seconds=1)).isoformat(),
+        },
+        # relógio do worker ~290 dias adiantado
+        {"stage": "page_collected", "at": (now + timedelta(days=290)).isoformat()},
+    ]
+    requests.post(
+        f"{url}/finish/{job['id']}",
+        json={"content": RESULT, "worker_id": "w", "timings": marks},
+    ).raise_for_status()
+
+    timeline = requests.get(f"{url}/jobs/{job['id']}/timings").json()
+    claimed = datetime.fromisoformat(timeline["claimed_at"])
+    finished = datetime.fromisoformat(timeline["updated_at"])
+    stages = {s["stage"]: s for s in timeline["stages"]}
+    assert list(stages) == [
+        "queue_wait",
+        "page_load",
+        "captcha_solved",
+        "page_collected",
+        "upload",
+    ]
+    for stage in timeline["stages"][1:]:
+        assert claimed <= datetime.fromisoformat(stage["started_at"])
+        assert datetime.fromisoformat(stage["ended_at"]) <= finished
+        assert stage["duration_ms"] <= (finished - claimed).total_seconds() * 1000
+    assert stages["page_load"]["duration_ms"] == 0
+
+    window_ms = (finished - claimed).total_seconds() * 1000
+    stats = requests.get(f"{url}/timings/stats").json()["stages"]
+    assert stats["page_collected"]["count"] == 1
+    assert max(stage["max_ms"] for stage in stats.values()) <= window_ms + 1000